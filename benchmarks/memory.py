@@ -0,0 +1,63 @@
+"""Peak memory of a pipeline streaming a synthetic extract, to check memory
+use stays flat as the extract grows
+
+    python -m benchmarks.memory [records] [--buffered]
+
+--buffered uses an extractor that fetches everything before yielding, for
+comparison. Prints the records extracted and the peak size in KiB of the
+Python heap allocated while the pipeline runs, which unlike the peak RSS
+doesn't include whatever the process started with.
+"""
+
+import asyncio
+import sys
+import tracemalloc
+
+from benchmarks.plugins import BenchmarkExtractor, record
+from prophetess.pipeline import Pipeline
+from prophetess.plugin import Extractor, Loader, Transformer
+
+SPEC = {
+    'name': '{Name}',
+    'slug': 'sf-{Id}',
+    'description': '{Description}',
+}
+
+
+class BufferedExtractor(Extractor):
+
+    async def run(self):
+        records = [record(i) for i in range(self.config['records'])]
+        for r in records:
+            yield r
+
+
+class NullLoader(Loader):
+
+    async def run(self, record):
+        pass
+
+
+def main(records: int, buffered: bool = False) -> int:
+    extractor = (BufferedExtractor if buffered else BenchmarkExtractor)(id='synthetic', config={'records': records})
+    pipeline = Pipeline(
+        id='memory',
+        extractors=[extractor],
+        transform=Transformer(id='YAMLTransformer', config=SPEC),
+        loaders=[NullLoader(id='null', config={})],
+        max_in_flight=1000,
+    )
+
+    tracemalloc.start()
+    try:
+        asyncio.get_event_loop().run_until_complete(pipeline.run())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    print('records={} peak_kib={}'.format(records, peak // 1024))
+    return peak // 1024
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 100000, '--buffered' in sys.argv)
@@ -0,0 +1,53 @@
+"""Stand-in plugins for benchmarking, registered as the `Benchmark` plugin
+
+    pip install -e benchmarks/
+
+registers them through the `prophetess.plugins` entry point, so pipeline
+configs can use `plugin: Benchmark` for both extractors and loaders.
+"""
+
+import asyncio
+from typing import Any, AsyncGenerator, Dict, List
+
+from prophetess.exceptions import ServiceError
+from prophetess.plugin import Loader, StreamingExtractor
+
+
+def record(i: int, size: int = 512) -> Dict[str, Any]:
+    return {
+        'Id': '0014x{:08d}'.format(i),
+        'Name': 'Account {}'.format(i),
+        'Type': 'Customer',
+        'Industry': 'industry-{}'.format(i % 20),
+        'Description': '{:0{}d}'.format(i, size),
+    }
+
+
+class BenchmarkExtractor(StreamingExtractor):
+    """Synthesizes `records` records of about `size` bytes each, waiting
+    `latency` seconds before every page of `page_size` records"""
+
+    @property
+    def page_size(self) -> int:
+        return self.config.get('page_size', 1000)
+
+    async def pages(self) -> AsyncGenerator[List[Dict[str, Any]], None]:
+        count = self.config.get('records', 10000)
+        size = self.config.get('size', 512)
+        latency = self.config.get('latency', 0)
+
+        for start in range(0, count, self.page_size):
+            await asyncio.sleep(latency)
+            yield [record(i, size) for i in range(start, min(start + self.page_size, count))]
+
+
+class BenchmarkLoader(Loader):
+    """POSTs each record to `host` + `endpoint`, such as a
+    `benchmarks.server` stand-in"""
+    required_config = ('host',)
+
+    async def run(self, record: Dict[str, Any]) -> None:
+        url = '{}{}'.format(self.config['host'], self.config.get('endpoint', '/api/records/'))
+        async with self.session().post(url, json=record) as response:
+            if response.status >= 400:
+                raise ServiceError('{} returned {}'.format(url, response.status), status=response.status)
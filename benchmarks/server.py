@@ -0,0 +1,32 @@
+"""A local HTTP service for stand-in loaders to load into
+
+Requests to /api/records/ wait `latency` seconds and fail with a 503 for
+`error_rate` of requests.
+"""
+
+import asyncio
+import random
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+def application(latency: float = 0, error_rate: float = 0) -> web.Application:
+    async def records(request: web.Request) -> web.Response:
+        await request.read()
+        if latency:
+            await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return web.Response(status=503, text='injected error')
+        return web.Response(status=201)
+
+    app = web.Application()
+    app.router.add_post('/api/records/', records)
+    return app
+
+
+async def serve(latency: float = 0, error_rate: float = 0) -> TestServer:
+    """Start a stand-in on a free local port, `close()` it when done"""
+    server = TestServer(application(latency, error_rate))
+    await server.start_server()
+    return server
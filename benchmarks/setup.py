@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+"""Installs the stand-in Benchmark plugin for prophetess
+
+    pip install -e benchmarks/
+"""
+
+from setuptools import setup
+
+setup(
+    name='prophetess-benchmarks',
+    version='0.1.0',
+    description='Stand-in plugins for benchmarking prophetess',
+    packages=['benchmarks'],
+    package_dir={'benchmarks': '.'},
+    install_requires=['prophetess'],
+    entry_points={
+        'prophetess.plugins': [
+            'benchmark = benchmarks.plugins',
+        ],
+    },
+)
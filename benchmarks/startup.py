@@ -0,0 +1,47 @@
+"""Time to import prophetess and build a pipeline in a fresh interpreter,
+against loading every plugin entry point up front with pkg_resources
+
+    python -m benchmarks.startup [runs]
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+# Each snippet runs in its own interpreter, as a container or CLI would
+SNIPPETS = {
+    'import': 'import prophetess.app',
+    'build': (
+        'from prophetess.pipeline import build_pipelines\n'
+        "build_pipelines({'pipelines': {'noop': {'transform': {'name': '{Name}'}}}})"
+    ),
+    'eager pkg_resources': (
+        'import pkg_resources\n'
+        "{ep.name: ep.load() for ep in pkg_resources.iter_entry_points('prophetess.plugins')}\n"
+        'import prophetess.app'
+    ),
+}
+
+
+def measure(code: str, runs: int) -> float:
+    """Median seconds to run `code` in a new interpreter"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main(runs: int = 10) -> None:
+    baseline = measure('pass', runs)
+    print('{} runs, interpreter alone {:.1f}ms'.format(runs, baseline * 1000))
+    for name, code in SNIPPETS.items():
+        elapsed = measure(code, runs)
+        print('{:<20} {:>8.1f}ms {:>8.1f}ms over the interpreter'.format(
+            name, elapsed * 1000, (elapsed - baseline) * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
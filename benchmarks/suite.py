@@ -0,0 +1,223 @@
+"""Throughput, latency and memory of a pipeline run, Transformer.parse and
+build_pipelines, saved as JSON to compare releases
+
+    python -m benchmarks.suite [--records N] [--latency S] [--error-rate R]
+                               [--output results.json] [--compare old.json]
+
+Pipelines extract from the synthetic Benchmark extractor and load into a
+local stand-in HTTP service. Results go to stdout as JSON unless --output
+is given, with a summary on stderr.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import prophetess
+from benchmarks import plugins, server
+from prophetess import config, metrics
+from prophetess.pipeline import build_pipelines
+from prophetess.plugin import Transformer
+
+SPEC = {
+    'name': '{Name}',
+    'slug': 'sf-{Id}',
+    'description': '{Description}',
+    'custom_fields': {
+        'salesforce_id': '{Id}',
+        'industry': '{Industry}',
+        'kind': '{Type} account',
+    },
+    'status': 'active',
+}
+
+
+def register() -> None:
+    """Resolve `plugin: Benchmark` even when benchmarks/ isn't installed"""
+    if 'benchmark' not in config.PLUGINS:
+        config.PLUGINS['benchmark'] = plugins
+
+
+def pipeline_config(name: str, host: str, records: int, latency: float) -> Dict[str, Any]:
+    return {
+        'extractors': {
+            'synthetic': {'plugin': 'Benchmark', 'config': {'records': records, 'latency': latency}},
+        },
+        'loaders': {
+            'stand-in': {'plugin': 'Benchmark', 'config': {'host': host}},
+        },
+        'pipelines': {
+            name: {
+                'extractors': ['synthetic'],
+                'loaders': ['stand-in'],
+                'transform': SPEC,
+                'max_in_flight': 1000,
+                'stages': {'transform': {'workers': 1}, 'load': {'workers': 16}},
+            },
+        },
+    }
+
+
+def quantile(samples: List[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0
+
+
+def histogram_quantile(child: Any, q: float) -> float:
+    """Estimate a quantile from a histogram child's buckets, like PromQL"""
+    counts = [bucket.get() for bucket in child._buckets]
+    rank = q * sum(counts)
+    seen, lower = 0, 0
+    for upper, count in zip(child._upper_bounds, counts):
+        if count and seen + count >= rank:
+            if upper == float('inf'):
+                return lower
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+        lower = upper
+    return 0
+
+
+def peak_memory(fn: Callable[[], Any]) -> int:
+    """Bytes allocated at the peak of `fn()`"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+async def run_pipeline(name: str, records: int, latency: float, error_rate: float) -> float:
+    stand_in = await server.serve(latency=latency, error_rate=error_rate)
+    pipelines = build_pipelines(pipeline_config(name, str(stand_in.make_url('')).rstrip('/'), records, latency))
+    try:
+        start = time.perf_counter()
+        await pipelines[name].run()
+        return time.perf_counter() - start
+    finally:
+        await pipelines.close()
+        await stand_in.close()
+
+
+def bench_pipeline(records: int, latency: float, error_rate: float) -> Dict[str, Any]:
+    loaded = metrics.records_loaded.labels('benchmark', 'stand-in')._value
+    failed = metrics.records_failed.labels('benchmark', 'stand-in')._value
+    before = loaded.get(), failed.get()
+
+    loop = asyncio.get_event_loop()
+    elapsed = loop.run_until_complete(run_pipeline('benchmark', records, latency, error_rate))
+
+    result = {
+        'records': records,
+        'seconds': elapsed,
+        'records_per_second': records / elapsed,
+        'loaded': loaded.get() - before[0],
+        'failed': failed.get() - before[1],
+    }
+    for stage in ('extract', 'transform', 'load'):
+        child = metrics.stage_latency.labels('benchmark', stage)
+        result['{}_p50'.format(stage)] = histogram_quantile(child, 0.5)
+        result['{}_p99'.format(stage)] = histogram_quantile(child, 0.99)
+
+    result['peak_memory'] = peak_memory(
+        lambda: loop.run_until_complete(run_pipeline('benchmark-memory', records, latency, error_rate)))
+    return result
+
+
+def bench_parse(records: int) -> Dict[str, Any]:
+    transformer = Transformer(id='benchmark', config=SPEC)
+    data = [plugins.record(i) for i in range(records)]
+    samples = []
+
+    start = time.perf_counter()
+    for r in data:
+        started = time.perf_counter()
+        transformer.parse(SPEC, r)
+        samples.append(time.perf_counter() - started)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'records': records,
+        'seconds': elapsed,
+        'records_per_second': records / elapsed,
+        'p50': quantile(samples, 0.5),
+        'p99': quantile(samples, 0.99),
+        'peak_memory': peak_memory(lambda: [transformer.parse(SPEC, r) for r in data]),
+    }
+
+
+def bench_build(repeat: int) -> Dict[str, Any]:
+    cfg = pipeline_config('benchmark-build', 'http://localhost', 0, 0)
+    samples = []
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build_pipelines(cfg)
+        samples.append(time.perf_counter() - started)
+
+    return {
+        'builds': repeat,
+        'seconds': sum(samples),
+        'p50': quantile(samples, 0.5),
+        'p99': quantile(samples, 0.99),
+        'peak_memory': peak_memory(lambda: build_pipelines(cfg)),
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    for name, result in results['results'].items():
+        old = baseline.get('results', {}).get(name, {})
+        for key, value in result.items():
+            if isinstance(value, (int, float)) and old.get(key):
+                print('{:<20} {:<20} {:>14.6g} {:>8.2f}x vs {}'.format(
+                    name, key, value, value / old[key], baseline.get('prophetess')), file=sys.stderr)
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0, help='seconds per page and per load')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of loads failing with a 503')
+    parser.add_argument('--builds', type=int, default=200)
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    parser.add_argument('--compare', help='results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    register()
+    results = {
+        'prophetess': prophetess.__version__,
+        'python': platform.python_version(),
+        'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+        'parameters': vars(args),
+        'results': {
+            'pipeline_run': bench_pipeline(args.records, args.latency, args.error_rate),
+            'transformer_parse': bench_parse(args.records),
+            'build_pipelines': bench_build(args.builds),
+        },
+    }
+
+    for name, result in results['results'].items():
+        print('{:<20} {}'.format(name, ' '.join(
+            '{}={:.6g}'.format(k, v) for k, v in result.items() if isinstance(v, (int, float)))), file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Per record overhead of timing with metrics.Timer, against the time.time()
+and labels() lookup it replaced
+
+    python -m benchmarks.timer [iterations]
+"""
+
+import sys
+import time
+
+from prometheus_client import CollectorRegistry, Histogram
+
+from prophetess.metrics import Timer
+
+LABELS = ('benchmark-plugin', 'Benchmark', 'Loader', 'BenchmarkLoader')
+
+
+class LegacyTimer:
+    """The Timer before it bound its labels: a wall clock, and a labels()
+    lookup for every observation"""
+
+    def __init__(self, *, observer: Histogram, labels) -> None:
+        self.histogram = observer
+        self._start_time = None
+        self.labels = labels
+
+    def __enter__(self):
+        self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self) -> None:
+        self._start_time = time.time()
+
+    def stop(self) -> None:
+        latency = time.time() - self._start_time
+        self.histogram.labels(*self.labels).observe(latency)
+
+
+def histogram() -> Histogram:
+    return Histogram(
+        name='benchmark_latency',
+        documentation='Benchmark',
+        labelnames=('id', 'plugin', 'type', 'class'),
+        registry=CollectorRegistry(),
+    )
+
+
+def measure(timer, iterations: int) -> float:
+    """Nanoseconds per `with timer` block"""
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        with timer:
+            pass
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def measure_tokens(timer: Timer, iterations: int) -> float:
+    """Nanoseconds per start()/stop(token) pair"""
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        timer.stop(timer.start())
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def main(iterations: int) -> None:
+    results = [
+        ('legacy', measure(LegacyTimer(observer=histogram(), labels=LABELS), iterations)),
+        ('timer', measure(Timer(observer=histogram(), labels=LABELS), iterations)),
+        ('timer tokens', measure_tokens(Timer(observer=histogram(), labels=LABELS), iterations)),
+    ]
+
+    print('{} iterations'.format(iterations))
+    for name, ns in results:
+        print('{:<14} {:8.0f} ns/record {:6.2f}x'.format(name, ns, results[0][1] / ns))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
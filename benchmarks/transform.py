@@ -0,0 +1,87 @@
+"""Compare the compiled YAMLTransformer template against Transformer.parse,
+both per record and rendering whole columns at once
+
+    python -m benchmarks.transform [records]
+"""
+
+import sys
+import time
+
+from prophetess.plugin import Transformer
+
+SPEC = {
+    'name': '{Name}',
+    'slug': 'sf-{Id}',
+    'description': '{Name} ({Type}) owned by {Owner}',
+    'tenant_group': {
+        'name': '{Industry}',
+        'slug': '{Industry}-{Region}',
+    },
+    'custom_fields': {
+        'salesforce_id': '{Id}',
+        'employees': '{Employees:d}',
+        'revenue': '{Revenue:.2f}',
+        'address': {
+            'city': '{City}',
+            'country': '{Country}',
+            'line': '{Street}, {City} {PostalCode}',
+        },
+        'missing': '{NotExtracted}',
+    },
+    'status': 'active',
+}
+
+# Rows per batch from a columnar extractor
+BATCH_SIZE = 1000
+
+
+def record(i: int) -> dict:
+    return {
+        'Id': '0014x{:08d}'.format(i),
+        'Name': 'Account {}'.format(i),
+        'Type': 'Customer',
+        'Owner': 'owner{}@example.com'.format(i % 50),
+        'Industry': 'industry-{}'.format(i % 20),
+        'Region': 'us-{}'.format(i % 4),
+        'Employees': i % 5000,
+        'Revenue': i * 1.5,
+        'City': 'Austin',
+        'Country': 'US',
+        'Street': '{} Congress Ave'.format(i),
+        'PostalCode': '78701',
+    }
+
+
+def measure(fn, records) -> float:
+    start = time.perf_counter()
+    for r in records:
+        fn(r)
+    return time.perf_counter() - start
+
+
+def main(count: int = 100000) -> None:
+    transformer = Transformer(id='benchmark', config=SPEC)
+    records = [record(i) for i in range(count)]
+    assert transformer.parse(SPEC, records[0]) == transformer.template.render(records[0])
+
+    batches = [
+        {key: [r[key] for r in records[i:i + BATCH_SIZE]] for key in records[0]}
+        for i in range(0, count, BATCH_SIZE)
+    ]
+
+    results = {
+        'parse': measure(lambda r: transformer.parse(SPEC, r), records),
+        'compiled': measure(transformer.template.render, records),
+        'columnar': measure(transformer.template.render_columns, batches),
+    }
+
+    print('{:,} records, {} leaves per record, columnar batches of {:,}'.format(
+        count, len(transformer.template.plan), BATCH_SIZE))
+    for name, elapsed in results.items():
+        print('{:<10} {:>8.3f}s {:>12,.0f} records/s'.format(name, elapsed, count / elapsed))
+    for name in ('compiled', 'columnar'):
+        print('{} speedup {:>8.2f}x'.format(name, results['parse'] / results[name]))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
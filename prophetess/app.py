@@ -2,34 +2,174 @@
 
 import asyncio
 import logging
-from typing import Dict
+from typing import Dict, List
 
+from prophetess.config import CONCURRENCY, SHUTDOWN_TIMEOUT
 from prophetess.exceptions import ProphetessException
-from prophetess.pipeline import build_pipelines
+from prophetess.pipeline import Pipeline, Pipelines, build_pipelines
+from prophetess.ratelimit import limiters
+from prophetess.reload import diff
+from prophetess.scheduler import Scheduler, trigger_for
+from prophetess.sessions import sessions
+from prophetess.sharding import Shard
 
 log = logging.getLogger(__name__)
 
+# Settings only read when starting
+RESTART_REQUIRED = ('concurrency', 'http', 'services')
+
 
 class Prophetess:
 
-    def __init__(self, config: Dict) -> None:
+    def __init__(self, config: Dict, shard: Shard = None) -> None:
         self.config = config
-        self.pipelines = build_pipelines(self.config)
+        self.shard = shard
+        self.concurrency = config.get('concurrency', CONCURRENCY)
+        self.interval = config.get('interval', 90)
+        sessions.configure(**config.get('http', {}))
+        limiters.configure(config.get('services', {}))
+        self.pipelines = build_pipelines(self.config, shard)
+        if shard is not None:
+            log.info('{} runs {} of {} pipelines'.format(
+                shard, len(self.pipelines), len(self.config.get('pipelines') or {}),
+            ))
+        self.scheduler = None
+        self.retiring = set()
+        self.stopping = False
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Limits how many pipelines may run at once"""
+        # Created lazily so the semaphore binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
 
     async def close(self) -> None:
+        await asyncio.gather(*self.retiring, return_exceptions=True)
         await self.pipelines.close()
 
+    async def shutdown(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        """Stop starting runs, give those in progress `timeout` seconds to
+        finish, then close every pipeline
+
+        Runs finishing in time flush their batches and stage queues as
+        usual. Those still going at the deadline are cancelled, so their
+        records in flight are lost, but the plugins are closed all the same.
+        """
+        self.stopping = True
+        running = set(self.retiring)
+        if self.scheduler is not None:
+            running.update(self.scheduler.running)
+            self.scheduler.stop()
+
+        if running:
+            log.info('Waiting up to {}s for {} runs in progress'.format(timeout, len(running)))
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            if pending:
+                log.warning('Cancelling {} runs still in progress after {}s'.format(len(pending), timeout))
+                for task in pending:
+                    task.cancel()
+                await asyncio.wait(pending)
+
+        await self.close()
+
+    async def reload(self, config: Dict) -> Dict[str, List[str]]:
+        """Switch to `config`, only rebuilding the pipelines that changed
+
+        Pipelines that changed or were removed stop being scheduled, and are
+        closed in the background once their runs in progress have finished.
+        A changed pipeline's replacement is scheduled from then on.
+        """
+        changes = diff(self.config, config)
+        for key in RESTART_REQUIRED:
+            if self.config.get(key) != config.get(key):
+                log.warning('Changes to {} only apply after a restart'.format(key))
+
+        # Built before anything is replaced, so an invalid config changes nothing
+        interval = config.get('interval', 90)
+        rebuilt = build_pipelines(dict(config, pipelines={
+            name: config['pipelines'][name] for name in changes['added'] + changes['changed']
+        }), self.shard)
+        for p in rebuilt.values():
+            trigger_for(p, interval)
+
+        pipelines = Pipelines()
+        for name in config.get('pipelines') or {}:
+            if name in rebuilt:
+                pipelines.append(rebuilt[name])
+            elif name in changes['unchanged'] and name in self.pipelines:
+                pipelines.append(self.pipelines[name])
+        # Only the caches live pipelines extract from, rebuilt ones replacing
+        # those of the pipelines they retire
+        for caches in (self.pipelines.caches, rebuilt.caches):
+            pipelines.caches.update(
+                (name, cache) for name, cache in caches.items()
+                if any(cache is e or cache is getattr(e, 'extractor', None)
+                       for p in pipelines.values() for e in p.extractors)
+            )
+
+        retired = [self.pipelines[name] for name in changes['changed'] + changes['removed'] if name in self.pipelines]
+        self.config, self.pipelines = config, pipelines
+        self.interval = interval
+        if self.scheduler is not None:
+            self.scheduler.interval = interval
+
+        for p in retired:
+            if self.scheduler is not None:
+                self.scheduler.remove(p.id)
+            task = asyncio.ensure_future(self.retire(p))
+            self.retiring.add(task)
+            task.add_done_callback(self.retiring.discard)
+        if self.scheduler is not None:
+            for name in changes['added']:
+                if name in pipelines:
+                    self.scheduler.add(pipelines[name])
+
+        log.info('Reloaded config: {}'.format(', '.join(
+            '{} {}'.format(len(names), change) for change, names in changes.items()
+        )))
+        return changes
+
+    async def retire(self, pipeline: Pipeline) -> None:
+        """Close `pipeline` once its runs have finished, then schedule its replacement"""
+        await pipeline.drain()
+        await pipeline.close()
+        log.info('Retired {}'.format(pipeline))
+
+        replacement = self.pipelines.get(pipeline.id)
+        if replacement is not None and self.scheduler is not None:
+            self.scheduler.add(replacement)
+
     async def run(self) -> None:
-        for pipeline_name, pipeline in self.pipelines.items():
-            log.info('Running Pipeline: {}'.format(pipeline_name))
+        """Run every pipeline concurrently, at most `concurrency` at a time
+
+        An unexpected exception from one pipeline is only raised once all of
+        the other pipelines in the cycle have finished.
+        """
+        results = await asyncio.gather(
+            *[self.run_pipeline(pipeline) for pipeline in self.pipelines.values()],
+            return_exceptions=True,
+        )
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def run_pipeline(self, pipeline: Pipeline) -> None:
+        async with pipeline.semaphore, self.semaphore:
+            if self.stopping:
+                log.info('Not running {}, shutting down'.format(pipeline.id))
+                return
+            log.info('Running Pipeline: {}'.format(pipeline.id))
             try:
                 await pipeline.run()
             except ProphetessException as e:
                 log.exception(e)
-            log.info('Finished Pipeline: {}'.format(pipeline_name))
+            log.info('Finished Pipeline: {}'.format(pipeline.id))
 
     async def start(self) -> None:
         log.info('Starting Control process')
-        while True:
-            await self.run()
-            await asyncio.sleep(90)
+        self.scheduler = Scheduler(self.pipelines, self.run_pipeline, interval=self.interval)
+        await self.scheduler.run()
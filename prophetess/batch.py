@@ -0,0 +1,60 @@
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+
+
+class Batch:
+    """Collects records and hands them to `handler` in groups
+
+    A batch is flushed once it holds `size` records, once `interval` seconds
+    have passed since its first record was added, or when `flush` is called.
+    `flush` only returns once flushes started by the timer have finished too.
+    """
+
+    def __init__(
+            self,
+            handler: Callable[[List[Dict[str, Any]]], Awaitable],
+            *,
+            size: int,
+            interval: float = None,
+    ) -> None:
+        self.handler = handler
+        self.size = size
+        self.interval = interval
+        self.records = []
+        self._timer = None
+        # Timer flushes still waiting on the handler
+        self._flushing = set()
+
+    async def add(self, record: Dict[str, Any]) -> None:
+        self.records.append(record)
+
+        if len(self.records) >= self.size:
+            await self.flush()
+        elif self.interval and self._timer is None:
+            self._timer = asyncio.ensure_future(self._flush_later())
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        records, self.records = self.records, []
+        if records:
+            await self.handler(records)
+
+        if self._flushing:
+            await asyncio.wait(list(self._flushing))
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        task, self._timer = self._timer, None
+        self._flushing.add(task)
+        try:
+            records, self.records = self.records, []
+            await self.handler(records)
+        finally:
+            self._flushing.discard(task)
+
+    def __len__(self) -> int:
+        return len(self.records)
@@ -0,0 +1,48 @@
+import asyncio
+
+
+class Budget:
+    """Caps how many records a pipeline holds between extract and load
+
+    Each record is acquired before it is pulled from an extractor and
+    released once it has been processed, so a slow transform or loader stops
+    extractors fetching more. A limit of None never waits.
+    """
+
+    def __init__(self, limit: int = None) -> None:
+        self.limit = limit
+        self.in_flight = 0
+        self._released = None
+
+    @property
+    def released(self) -> asyncio.Condition:
+        # Created lazily so the condition binds to the running event loop
+        if self._released is None:
+            self._released = asyncio.Condition()
+        return self._released
+
+    async def acquire(self, n: int = 1) -> int:
+        """Wait until `n` records fit, returning how many were acquired
+
+        Requests larger than the whole budget are cut down to it so they
+        can't wait forever; release the returned count, not `n`.
+        """
+        if self.limit is None:
+            self.in_flight += n
+            return n
+
+        n = min(n, self.limit)
+        if self.in_flight + n > self.limit:
+            async with self.released:
+                await self.released.wait_for(lambda: self.in_flight + n <= self.limit)
+        self.in_flight += n
+        return n
+
+    async def release(self, n: int = 1) -> None:
+        self.in_flight -= n
+        if self.limit is not None and self._released is not None:
+            async with self.released:
+                self.released.notify_all()
+
+    def __len__(self) -> int:
+        return self.in_flight
@@ -0,0 +1,246 @@
+
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncGenerator, Dict, List, Tuple
+
+from prophetess.metrics import (extract_cache_age, extract_cache_hits,
+                                extract_cache_misses)
+from prophetess.plugin import Extractor, Loader
+
+log = logging.getLogger(__name__)
+
+
+class ChangeCache:
+    """Remembers what each loader last loaded, to skip unchanged records
+
+    Entries map a pipeline, loader and the record's primary key (the
+    loader's `pk` config, or the whole record without one) to a hash of the
+    payload last loaded successfully. At most `max_size` entries are kept,
+    least recently used first out. Every `refresh_interval` seconds the
+    cache is emptied so every record is loaded again. With a `path` the
+    entries are persisted between restarts.
+    """
+
+    def __init__(self, *, max_size: int = 100000, refresh_interval: float = None, path: str = None) -> None:
+        self.max_size = max_size
+        self.refresh_interval = refresh_interval
+        self.path = path
+        self.entries = collections.OrderedDict()
+        self.refreshed = time.time()
+
+        if self.path:
+            self.load()
+
+    @staticmethod
+    def digest(record: Any) -> str:
+        data = json.dumps(record, sort_keys=True, default=str).encode()
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def fingerprint(self, pipeline_id: str, loader: Loader, record: Dict[str, Any]) -> Tuple[str, str]:
+        """The `(key, digest)` identifying `record` for `loader`"""
+        digest = self.digest(record)
+        pk = (getattr(loader, 'config', None) or {}).get('pk')
+        if isinstance(pk, str):
+            pk = [pk]
+
+        try:
+            identity = [record.get(field) for field in pk] if pk else digest
+        except AttributeError:
+            identity = digest
+
+        return json.dumps([pipeline_id, loader.id, identity], default=str), digest
+
+    def unchanged(self, key: str, digest: str) -> bool:
+        if self.refresh_interval and time.time() - self.refreshed >= self.refresh_interval:
+            log.info('Refreshing change cache, all records will be loaded')
+            self.entries.clear()
+            self.refreshed = time.time()
+
+        if self.entries.get(key) != digest:
+            return False
+
+        self.entries.move_to_end(key)
+        return True
+
+    def update(self, key: str, digest: str) -> None:
+        self.entries[key] = digest
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            log.warning('Ignoring unreadable change cache {}: {}'.format(self.path, e))
+            return
+
+        self.refreshed = data.get('refreshed', self.refreshed)
+        for key, digest in data.get('entries', [])[-self.max_size:]:
+            self.entries[key] = digest
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = '{}.tmp'.format(self.path)
+        with open(tmp, 'w') as f:
+            json.dump({'refreshed': self.refreshed, 'entries': list(self.entries.items())}, f)
+        os.replace(tmp, self.path)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class CachedExtractor:
+    """An extractor whose records are reused for `ttl` seconds
+
+    A snapshot of the last full run is served instead of running the
+    extractor again until it is `ttl` seconds old. For the following
+    `stale_while_revalidate` seconds the snapshot is still served, while the
+    extractor refreshes it in the background. Runs of more than
+    `max_records` records aren't kept. With a `path` the snapshot is
+    persisted between restarts.
+
+    Everything but `run` and `close` is the wrapped extractor's.
+    """
+
+    columnar = False
+
+    def __init__(
+            self,
+            extractor: Extractor,
+            *,
+            ttl: float,
+            max_records: int = None,
+            stale_while_revalidate: float = 0,
+            path: str = None,
+    ) -> None:
+        self.extractor = extractor
+        self.ttl = ttl
+        self.max_records = max_records
+        self.stale_while_revalidate = stale_while_revalidate
+        self.path = path
+        self.records = None
+        self.taken = None
+        self.refresh = None
+        self._generation = 0
+
+        if self.path:
+            self.load()
+
+        extract_cache_age.labels(self.extractor.id).set_function(lambda: self.age or 0)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.extractor, name)
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was taken, None without one"""
+        if self.taken is None:
+            return None
+        return time.time() - self.taken
+
+    async def run(self, **kwargs: Any) -> AsyncGenerator[Dict[str, Any], None]:
+        if kwargs or getattr(self.extractor, 'incremental', False):
+            async for record in self.extractor.run(**kwargs):
+                yield record
+            return
+
+        age = self.age
+        if age is None or age >= self.ttl + self.stale_while_revalidate:
+            extract_cache_misses.labels(self.extractor.id).inc()
+            async for record in self.extract():
+                yield record
+            return
+
+        if age < self.ttl:
+            extract_cache_hits.labels(self.extractor.id, 'fresh').inc()
+        else:
+            extract_cache_hits.labels(self.extractor.id, 'stale').inc()
+            if self.refresh is None or self.refresh.done():
+                log.debug('{} serving a {:.0f}s old snapshot, refreshing'.format(self, age))
+                self.refresh = asyncio.ensure_future(self.revalidate())
+
+        for record in self.records:
+            yield record
+
+    async def extract(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Run the extractor, keeping a snapshot of what it returns"""
+        generation = self._generation
+        records = []
+        async for record in self.extractor.run():
+            if records is not None:
+                records.append(record)
+                if self.max_records is not None and len(records) > self.max_records:
+                    log.warning('{} returned over {} records, not caching them'.format(self, self.max_records))
+                    records = None
+            yield record
+
+        if records is not None and generation == self._generation:
+            self.store(records)
+
+    async def revalidate(self) -> None:
+        try:
+            async for _ in self.extract():
+                pass
+        except Exception as e:
+            log.warning('{} failed to refresh, still serving the old snapshot: {}'.format(self, e))
+
+    def store(self, records: List[Dict[str, Any]]) -> None:
+        self.records = records
+        self.taken = time.time()
+        self.save()
+
+    def invalidate(self) -> None:
+        """Drop the snapshot, so the next run extracts again"""
+        # Refreshes already running are from before the invalidation
+        self._generation += 1
+        self.records = None
+        self.taken = None
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+        log.info('{} snapshot invalidated'.format(self))
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            log.warning('Ignoring unreadable snapshot {}: {}'.format(self.path, e))
+            return
+
+        self.records = data.get('records', [])
+        self.taken = data.get('taken')
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = '{}.tmp'.format(self.path)
+        with open(tmp, 'w') as f:
+            json.dump({'taken': self.taken, 'records': self.records}, f, default=str)
+        os.replace(tmp, self.path)
+
+    async def close(self) -> None:
+        if self.refresh is not None:
+            self.refresh.cancel()
+        await self.extractor.close()
+
+    def __str__(self) -> str:
+        return '{}({})'.format(type(self).__name__, self.extractor.id)
@@ -0,0 +1,341 @@
+"""Command line interface
+
+    prophetess [serve]                 run every pipeline on its schedule and serve /metrics
+    prophetess run [--once]            run pipelines without the web server, once or on schedule
+    prophetess validate                check the config without running anything
+
+`run` and `validate` take `--pipeline NAME`, repeatable, to only use some
+pipelines, and `run --dry-run` extracts and transforms without loading.
+
+`serve` and `run` take `--replica-count` and `--replica-index` to share the
+pipelines between several replicas, see prophetess.sharding.
+
+`serve` reloads the config when it changes, or on POST /reload, rebuilding
+only the pipelines whose definitions changed.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Any, Dict, List
+
+import yaml
+from aiohttp import web
+from prometheus_client import REGISTRY
+
+from prophetess.app import Prophetess
+from prophetess.config import (CONFIG_FILE, DEBUG, PORT, PROFILING,
+                               RELOAD_INTERVAL, REPLICA_COUNT, REPLICA_INDEX,
+                               SHUTDOWN_TIMEOUT, SLOW_CALLBACK, STATE_DIR)
+from prophetess.exceptions import ProphetessException
+from prophetess.pipeline import Pipeline
+from prophetess.reload import ConfigWatcher
+from prophetess.scheduler import trigger_for
+from prophetess.sharding import Shard, shard_for
+from prophetess.web import (CacheView, MetricsView, ProfileView, ReloadView,
+                            TasksView, watch_slow_callbacks)
+
+log = logging.getLogger('prophetess')
+
+EXIT_OK = 0
+# A pipeline raised, or some records failed to load
+EXIT_FAILED = 1
+# The config can't be read or is invalid
+EXIT_CONFIG = 2
+
+COUNTERS = ('extracted', 'transformed', 'loaded', 'skipped', 'failed')
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='prophetess', description='YAML driven ETL')
+    parser.add_argument('-c', '--config', default=CONFIG_FILE, help='pipeline config (default: %(default)s)')
+    parser.add_argument(
+        '--replica-count', type=int, default=REPLICA_COUNT,
+        help='replicas sharing the pipelines between them (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--replica-index', type=int, default=None if REPLICA_INDEX is None else int(REPLICA_INDEX),
+        help='this replica, from 0 (default: the first not claimed by another process on this host)',
+    )
+    parser.set_defaults(command=serve)
+    commands = parser.add_subparsers(title='commands')
+
+    command = commands.add_parser('serve', help='run pipelines on their schedules and serve /metrics (default)')
+    command.set_defaults(command=serve)
+
+    command = commands.add_parser('run', help='run pipelines without the web server')
+    command.add_argument('--once', action='store_true', help='run every pipeline once and exit')
+    command.add_argument('--dry-run', action='store_true', help='extract and transform, but load nothing')
+    command.add_argument('-p', '--pipeline', action='append', help='only run this pipeline, can be repeated')
+    command.set_defaults(command=run)
+
+    command = commands.add_parser('validate', help='check the config and build its plugins, then exit')
+    command.add_argument('-p', '--pipeline', action='append', help='only check this pipeline, can be repeated')
+    command.set_defaults(command=validate)
+
+    return parser
+
+
+def load_config(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return yaml.safe_load(f.read()) or {}
+
+
+def select(cfg: Dict[str, Any], names: List[str] = None) -> Dict[str, Any]:
+    """`cfg` with only the pipelines in `names`, all of them if None"""
+    if not names:
+        return cfg
+
+    pipelines = cfg.get('pipelines', {})
+    missing = [name for name in names if name not in pipelines]
+    if missing:
+        raise ProphetessException('Unknown pipelines: {}'.format(', '.join(missing)))
+
+    return dict(cfg, pipelines={name: pipelines[name] for name in names})
+
+
+def problems(cfg: Dict[str, Any]) -> List[str]:
+    """What's wrong with `cfg` that building its pipelines wouldn't catch"""
+    found = []
+    for name, data in cfg.get('pipelines', {}).items():
+        for section in ('extractors', 'loaders'):
+            for plugin in data.get(section, []):
+                if plugin not in (cfg.get(section) or {}):
+                    found.append('{}: {} {} is not defined'.format(name, section[:-1], plugin))
+
+        transform = data.get('transform')
+        if isinstance(transform, str) and transform not in (cfg.get('transformers') or {}):
+            found.append('{}: transformer {} is not defined'.format(name, transform))
+        elif not isinstance(transform, (str, dict)):
+            found.append('{}: transform must be a transformer name or a mapping'.format(name))
+
+    return found
+
+
+def counts(pipeline: Pipeline) -> Dict[str, float]:
+    """Records counted by each of `pipeline`'s plugins so far, by outcome"""
+    plugins = [p.id for p in pipeline.extractors + [pipeline.transform] + pipeline.loaders]
+    return {
+        counter: sum(
+            REGISTRY.get_sample_value(
+                'prophetess_records_{}_total'.format(counter), {'pipeline': pipeline.id, 'plugin': plugin},
+            ) or 0
+            for plugin in plugins
+        )
+        for counter in COUNTERS
+    }
+
+
+def summarize(pipeline: Pipeline, before: Dict[str, float], elapsed: float) -> str:
+    after = counts(pipeline)
+    delta = {counter: int(after[counter] - before[counter]) for counter in COUNTERS}
+    return '{}: {} in {:.1f}s, {:.1f} records/s'.format(
+        pipeline.id,
+        ', '.join('{} {}'.format(count, counter) for counter, count in delta.items()),
+        elapsed,
+        delta['extracted'] / elapsed if elapsed else 0,
+    )
+
+
+async def run_once(mage: Prophetess) -> int:
+    async def timed(pipeline):
+        before = counts(pipeline)
+        failures = pipeline.failures
+        start = time.perf_counter()
+        try:
+            await mage.run_pipeline(pipeline)
+        finally:
+            log.info(summarize(pipeline, before, time.perf_counter() - start))
+        return pipeline.failures == failures
+
+    results = await asyncio.gather(*[timed(p) for p in mage.pipelines.values()], return_exceptions=True)
+
+    status = EXIT_OK
+    for pipeline, result in zip(mage.pipelines.values(), results):
+        if isinstance(result, Exception):
+            log.error('{} failed: {!r}'.format(pipeline, result))
+            status = EXIT_FAILED
+        elif not result:
+            log.error('{} had failed loads'.format(pipeline))
+            status = EXIT_FAILED
+    return status
+
+
+def shard(args: argparse.Namespace) -> Shard:
+    return shard_for(args.replica_index, args.replica_count, directory=os.path.join(STATE_DIR, 'replicas'))
+
+
+def run(args: argparse.Namespace, cfg: Dict[str, Any]) -> int:
+    mage = Prophetess(select(cfg, args.pipeline), shard(args))
+    for pipeline in mage.pipelines.values():
+        pipeline.dry_run = args.dry_run
+
+    loop = asyncio.get_event_loop()
+    if args.once:
+        try:
+            return loop.run_until_complete(run_once(mage))
+        except KeyboardInterrupt:
+            log.warning('Run interrupted via Keyboard')
+            return EXIT_FAILED
+        finally:
+            loop.run_until_complete(mage.close())
+
+    start = asyncio.ensure_future(mage.start())
+    start.add_done_callback(stop_loop)
+    stop_on_signals(loop)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        log.warning('Run interrupted via Keyboard')
+    finally:
+        shutdown(loop, mage, start)
+    return EXIT_OK
+
+
+def stop_on_signals(loop: asyncio.AbstractEventLoop) -> None:
+    """Stop `loop` on SIGTERM and SIGINT, to shut down gracefully"""
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, stopping, loop, signum)
+        except (NotImplementedError, RuntimeError):
+            # Not supported on this platform, or not the main thread
+            pass
+
+
+def stopping(loop: asyncio.AbstractEventLoop, signum: int) -> None:
+    log.warning('Received {}, shutting down'.format(signal.Signals(signum).name))
+    loop.stop()
+
+
+def stop_loop(task: asyncio.Future) -> None:
+    """Stop the loop once `task` is done, e.g. when the scheduler fails"""
+    task.get_loop().stop()
+
+
+def shutdown(loop: asyncio.AbstractEventLoop, mage: Prophetess, *tasks: asyncio.Future) -> None:
+    """Drain and close `mage`, then wait for `tasks` to stop"""
+    # Nothing may stop the loop while it runs the drain: the scheduler stopping
+    # ends the start task, and a second signal would only cut the drain short
+    for task in tasks:
+        task.remove_done_callback(stop_loop)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.remove_signal_handler(signum)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    log.info('Draining pipelines, for up to {}s'.format(SHUTDOWN_TIMEOUT))
+    loop.run_until_complete(mage.shutdown(SHUTDOWN_TIMEOUT))
+    for task in tasks:
+        task.cancel()
+    results = loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    for result in results:
+        if isinstance(result, Exception):
+            log.error('Stopped after an error: {!r}'.format(result), exc_info=result)
+
+
+def validate(args: argparse.Namespace, cfg: Dict[str, Any]) -> int:
+    cfg = select(cfg, args.pipeline)
+    found = problems(cfg)
+    if not found:
+        try:
+            mage = Prophetess(cfg)
+            for pipeline in mage.pipelines.values():
+                trigger_for(pipeline, mage.interval)
+        except (ProphetessException, ImportError, KeyError, TypeError, ValueError) as e:
+            found.append('{}: {}'.format(type(e).__name__, e))
+
+    for problem in found:
+        log.error(problem)
+    if found:
+        return EXIT_CONFIG
+
+    log.info('{} is valid, {} pipelines'.format(args.config, len(cfg.get('pipelines', {}))))
+    return EXIT_OK
+
+
+def serve(args: argparse.Namespace, cfg: Dict[str, Any]) -> int:
+    loop = asyncio.get_event_loop()
+    log.info('Starting Prophetess')
+
+    # Some real raw AIOHtpp
+    app = web.Application(logger=logging.getLogger('prophetess.web'))
+
+    mage = Prophetess(cfg, shard(args))
+    app['prophetess'] = mage
+
+    async def reload() -> Dict[str, List[str]]:
+        cfg = load_config(args.config)
+        found = problems(cfg)
+        if found:
+            raise ProphetessException('; '.join(found))
+        return await mage.reload(cfg)
+
+    app['reload'] = reload
+
+    app.add_routes([
+        web.view('/metrics', MetricsView),
+        web.view('/reload', ReloadView),
+        web.view('/cache', CacheView),
+        web.view('/cache/{extractor}', CacheView),
+    ])
+
+    if PROFILING:
+        log.info('Profiling enabled, see /debug/profile and /debug/tasks')
+        app.add_routes([
+            web.view('/debug/profile', ProfileView),
+            web.view('/debug/tasks', TasksView),
+        ])
+        watch_slow_callbacks(loop, SLOW_CALLBACK)
+
+    # ref: https://docs.aiohttp.org/en/stable/web_advanced.html#aiohttp-web-app-runners
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+
+    site = web.TCPSite(runner, '0.0.0.0', PORT)
+    loop.run_until_complete(site.start())
+
+    tasks = [asyncio.ensure_future(mage.start())]
+    tasks[0].add_done_callback(stop_loop)
+    if RELOAD_INTERVAL:
+        tasks.append(asyncio.ensure_future(ConfigWatcher(args.config, reload, interval=RELOAD_INTERVAL).run()))
+    stop_on_signals(loop)
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        log.warning('Control loop interrupted via Keyboard')
+    finally:
+        shutdown(loop, mage, *tasks)
+        log.info('Shutting down')
+        loop.run_until_complete(runner.cleanup())
+        loop.run_until_complete(app.shutdown())
+
+    log.info('Prophetess stopped')
+    return EXIT_OK
+
+
+def main(argv: List[str] = None) -> int:
+    args = parser().parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        handlers=[logging.StreamHandler(sys.stdout)],
+        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+    )
+
+    if DEBUG:
+        logging.getLogger('prophetess').setLevel(logging.DEBUG)
+
+    try:
+        cfg = load_config(args.config)
+        return args.command(args, cfg)
+    except (OSError, yaml.YAMLError) as e:
+        log.error('Unable to read {}: {}'.format(args.config, e))
+    except ProphetessException as e:
+        log.error(e)
+    return EXIT_CONFIG
@@ -1,9 +1,25 @@
 
 import os
 
-import pkg_resources
+from prophetess.entrypoints import LazyPlugins
 
-PLUGINS = {ep.name: ep.load() for ep in pkg_resources.iter_entry_points('prophetess.plugins')}
+PLUGINS = LazyPlugins('prophetess.plugins')
 CONFIG_FILE = os.environ.get('PROPHETESS_CONFIG', '/etc/prophetess/pipeline.yaml')
+CONCURRENCY = int(os.environ.get('PROPHETESS_CONCURRENCY', 10))
 DEBUG = os.environ.get('DEBUG', False)
 PORT = os.environ.get('PORT', 8080)
+# Serves /debug/profile and /debug/tasks, and runs the loop in debug mode to
+# count callbacks blocking it for longer than SLOW_CALLBACK seconds
+PROFILING = os.environ.get('PROPHETESS_PROFILING', False)
+SLOW_CALLBACK = float(os.environ.get('PROPHETESS_SLOW_CALLBACK', 0.1))
+# Seconds between checks of CONFIG_FILE for changes to reload, 0 to only
+# reload on POST /reload
+RELOAD_INTERVAL = float(os.environ.get('PROPHETESS_RELOAD_INTERVAL', 5))
+# Run a share of the pipelines as replica REPLICA_INDEX of REPLICA_COUNT,
+# see prophetess.sharding
+REPLICA_COUNT = int(os.environ.get('PROPHETESS_REPLICA_COUNT', 1))
+REPLICA_INDEX = os.environ.get('PROPHETESS_REPLICA_INDEX')
+# Seconds runs in progress get to finish on SIGTERM before they're cancelled
+SHUTDOWN_TIMEOUT = float(os.environ.get('PROPHETESS_SHUTDOWN_TIMEOUT', 25))
+STATE_DIR = os.environ.get('PROPHETESS_STATE_DIR', '/var/lib/prophetess')
+WORKERS = int(os.environ.get('PROPHETESS_WORKERS', os.cpu_count() or 1))
@@ -0,0 +1,62 @@
+"""Plugin modules found through entry points, imported only when used"""
+
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator
+
+try:
+    from importlib import metadata
+except ImportError:  # Python < 3.8
+    import importlib_metadata as metadata
+
+
+class LazyPlugins(MutableMapping):
+    """Plugin modules by entry point name
+
+    Entry points in `group` are indexed the first time any plugin is looked
+    up, and each plugin's module is imported the first time it is looked up,
+    so plugins a config doesn't use are never imported.
+    """
+
+    def __init__(self, group: str) -> None:
+        self.group = group
+        self._plugins = None
+
+    @property
+    def plugins(self) -> Dict[str, Any]:
+        """Entry points by name, replaced by their module once loaded"""
+        if self._plugins is None:
+            entry_points = metadata.entry_points()
+            if hasattr(entry_points, 'select'):
+                entry_points = entry_points.select(group=self.group)
+            else:
+                entry_points = entry_points.get(self.group, ())
+            self._plugins = {ep.name: ep for ep in entry_points}
+        return self._plugins
+
+    def __getitem__(self, name: str) -> Any:
+        plugin = self.plugins[name]
+        if isinstance(plugin, metadata.EntryPoint):
+            plugin = self.plugins[name] = plugin.load()
+        return plugin
+
+    def __setitem__(self, name: str, module: Any) -> None:
+        self.plugins[name] = module
+
+    def __delitem__(self, name: str) -> None:
+        del self.plugins[name]
+
+    def clear(self) -> None:
+        self.plugins.clear()
+
+    def copy(self) -> Dict[str, Any]:
+        """The index as a dict, leaving plugins that aren't loaded unloaded"""
+        return dict(self.plugins)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.plugins
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.plugins)
+
+    def __len__(self) -> int:
+        return len(self.plugins)
@@ -6,7 +6,11 @@ class ProphetessException(Exception):
 
 class ServiceError(ProphetessException):
     """Base exception for external services"""
-    pass
+
+    def __init__(self, *args, status: int = None) -> None:
+        super().__init__(*args)
+        # The HTTP status the service responded with, if any
+        self.status = status
 
 
 class InvalidConfigurationException(ProphetessException):
@@ -0,0 +1,109 @@
+"""Run transformers outside the event loop
+
+A transformer configured with `executor: thread` or `executor: process` is
+wrapped in a `PooledTransformer`, which sends records in chunks to a pool
+shared by every pipeline. Process pools rebuild the transformer in each
+worker from its class and config, so the plugin instance itself never has
+to be pickled.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+from typing import Any, Collection, Dict, List, Tuple, Type, Union
+
+from prophetess.config import WORKERS
+from prophetess.exceptions import InvalidConfigurationException
+from prophetess.plugin import Transformer
+
+EXECUTORS = ('inline', 'thread', 'process')
+
+_pools = {}
+_plugins = {}
+_local = threading.local()
+
+
+def get_pool(executor: str) -> concurrent.futures.Executor:
+    if executor not in _pools:
+        if executor == 'process':
+            _pools[executor] = concurrent.futures.ProcessPoolExecutor(max_workers=WORKERS)
+        else:
+            _pools[executor] = concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS)
+    return _pools[executor]
+
+
+def shutdown() -> None:
+    while _pools:
+        _, pool = _pools.popitem()
+        pool.shutdown()
+
+
+def transform_many(transformer: Union[Transformer, Tuple], records: List[Dict[str, Any]]) -> List[List[Any]]:
+    """Executor entry point: the payloads for each record, in order
+
+    `transformer` is either a Transformer, or a `(class, id, config, labels)`
+    tuple to build one in this worker.
+    """
+    if isinstance(transformer, tuple):
+        plugin_class, plugin_id, config, labels = transformer
+        key = (plugin_class, plugin_id)
+        # A reload can change the config of a transformer with the same id
+        digest = json.dumps(config, sort_keys=True, default=str)
+        if key not in _plugins or _plugins[key][0] != digest:
+            _plugins[key] = (digest, plugin_class(id=plugin_id, config=config, labels=labels))
+        transformer = _plugins[key][1]
+
+    # Each worker thread keeps its own event loop. Forked processes inherit
+    # the parent's thread locals, so the loop is also tied to the process.
+    loop = getattr(_local, 'loop', None)
+    if loop is None or _local.pid != os.getpid():
+        loop = _local.loop = asyncio.new_event_loop()
+        _local.pid = os.getpid()
+        asyncio.set_event_loop(loop)
+
+    return loop.run_until_complete(_collect(transformer, records))
+
+
+async def _collect(transformer: Transformer, records: List[Dict[str, Any]]) -> List[List[Any]]:
+    results = []
+    for record in records:
+        results.append([payload async for payload in transformer.run(record)])
+    return results
+
+
+class PooledTransformer(Transformer):
+    """Runs another transformer in the shared thread or process pool"""
+    chunk_size = 100
+
+    def __init__(
+            self,
+            plugin_class: Type[Transformer],
+            *,
+            id: str,
+            config: Dict[str, Any],
+            labels: Collection[str] = None,
+            executor: str = 'process',
+            chunk_size: int = None,
+            loop: asyncio.AbstractEventLoop = None,
+    ) -> None:
+        if executor not in EXECUTORS[1:]:
+            raise InvalidConfigurationException('Unknown executor: {}'.format(executor))
+
+        super().__init__(id=id, config=config, labels=labels, loop=loop)
+        self.executor = executor
+        self.chunk_size = chunk_size or self.chunk_size
+        self.transformer = plugin_class(id=id, config=config, labels=labels, loop=loop)
+        self.spec = (plugin_class, id, config, labels)
+
+    async def run(self, data: Dict[str, Any]) -> Any:
+        for payload in (await self.run_many([data]))[0]:
+            yield payload
+
+    async def run_many(self, records: List[Dict[str, Any]]) -> List[List[Any]]:
+        transformer = self.spec if self.executor == 'process' else self.transformer
+        return await self.loop.run_in_executor(get_pool(self.executor), transform_many, transformer, records)
+
+    async def close(self) -> None:
+        await self.transformer.close()
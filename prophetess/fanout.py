@@ -0,0 +1,188 @@
+"""One extraction streamed to every pipeline sharing an extractor
+
+Pipelines listing the same extractor share one instance of it. When several
+of them run at about the same time, the first to ask for records starts a
+round and any others asking within `window` seconds join it. The round runs
+the extractor once and hands each record to every subscriber. Each
+subscriber buffers up to `queue_size` records; a full buffer blocks the
+extraction, so it runs at the pace of the slowest pipeline, unless `spill`
+is set and the overflow is written to a temporary file instead.
+
+Incremental extractors run from each pipeline's own watermark, so they are
+never shared.
+"""
+
+import asyncio
+import json
+import logging
+import tempfile
+from typing import Any, AsyncGenerator, Dict, List
+
+from prophetess.metrics import fan_out_spilled, fan_out_subscribers
+from prophetess.plugin import Extractor
+
+log = logging.getLogger(__name__)
+
+# Returned by Subscriber.get once the round's extraction is over
+_DONE = object()
+
+
+class Subscriber:
+    """The records of one round that one pipeline has yet to take"""
+
+    def __init__(self, extractor_id: str, *, queue_size: int, spill: bool) -> None:
+        self.extractor_id = extractor_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.spill = spill
+        self.closed = False
+        self.error = None
+        self._done = False
+        self._spilling = False
+        self._file = None
+        self._spilled = 0
+        self._read = 0
+        self._offset = 0
+        self._written = asyncio.Event()
+
+    async def put(self, record: Dict[str, Any]) -> None:
+        if self.closed:
+            return
+        if not self._spilling and (not self.spill or not self.queue.full()):
+            await self.queue.put(record)
+            return
+
+        # Once spilling, every later record goes to the file too, in order
+        self._spilling = True
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(mode='w+')
+        self._file.seek(0, 2)
+        self._file.write(json.dumps(record, default=str) + '\n')
+        self._spilled += 1
+        fan_out_spilled.labels(self.extractor_id).inc()
+        self._written.set()
+
+    def finish(self, error: BaseException = None) -> None:
+        self.error = error
+        if self._spilling or self.queue.full():
+            self._spilling = True
+            self._done = True
+            self._written.set()
+        else:
+            self.queue.put_nowait(_DONE)
+
+    async def get(self) -> Any:
+        while True:
+            if not self.queue.empty():
+                return self.queue.get_nowait()
+
+            if not self._spilling:
+                return await self.queue.get()
+
+            if self._read < self._spilled:
+                self._file.flush()
+                self._file.seek(self._offset)
+                line = self._file.readline()
+                self._offset = self._file.tell()
+                self._read += 1
+                return json.loads(line)
+
+            if self._done:
+                return _DONE
+
+            self._written.clear()
+            await self._written.wait()
+
+    def close(self) -> None:
+        """Take no more records, unblocking a round waiting for room"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        if self._file is not None:
+            self._file.close()
+
+
+class SharedExtractor:
+    """An extractor used by `consumers` pipelines, standing in for it
+
+    Everything but `run` and `close` is the wrapped extractor's. Rows are
+    what gets shared, so pipelines never read a shared extractor by column.
+    """
+
+    columnar = False
+
+    def __init__(
+            self,
+            extractor: Extractor,
+            *,
+            window: float = 1,
+            queue_size: int = 1000,
+            spill: bool = False,
+    ) -> None:
+        self.extractor = extractor
+        self.window = window
+        self.queue_size = queue_size
+        self.spill = spill
+        self.consumers = 0
+        self._round = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.extractor, name)
+
+    async def run(self, **kwargs: Any) -> AsyncGenerator[Dict[str, Any], None]:
+        if kwargs or getattr(self.extractor, 'incremental', False):
+            async for record in self.extractor.run(**kwargs):
+                yield record
+            return
+
+        subscriber = self.subscribe()
+        try:
+            while True:
+                record = await subscriber.get()
+                if record is _DONE:
+                    if subscriber.error is not None:
+                        raise subscriber.error
+                    return
+                yield record
+        finally:
+            subscriber.close()
+
+    def subscribe(self) -> Subscriber:
+        if self._round is None:
+            self._round = []
+            asyncio.ensure_future(self.extract(self._round))
+
+        subscriber = Subscriber(self.extractor.id, queue_size=self.queue_size, spill=self.spill)
+        self._round.append(subscriber)
+        return subscriber
+
+    async def extract(self, subscribers: List[Subscriber]) -> None:
+        """Run the extractor once for everyone subscribing within the window"""
+        await asyncio.sleep(self.window)
+        self._round = None
+        fan_out_subscribers.labels(self.extractor.id).observe(len(subscribers))
+        log.debug('{} extracting for {} pipelines'.format(self, len(subscribers)))
+
+        error = None
+        try:
+            async for record in self.extractor.run():
+                subscribed = [s for s in subscribers if not s.closed]
+                if not subscribed:
+                    break
+                for subscriber in subscribed:
+                    await subscriber.put(record)
+        except BaseException as e:
+            error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            for subscriber in subscribers:
+                subscriber.finish(error)
+
+    async def close(self) -> None:
+        """Close the extractor once every pipeline using it has closed"""
+        self.consumers -= 1
+        if self.consumers <= 0:
+            await self.extractor.close()
+
+    def __str__(self) -> str:
+        return '{}({})'.format(type(self).__name__, self.extractor.id)
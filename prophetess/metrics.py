@@ -1,8 +1,10 @@
 
+import contextvars
+import functools
 import time
 from typing import Collection
 
-from prometheus_client import Histogram
+from prometheus_client import Counter, Gauge, Histogram
 
 pipeline_latency = Histogram(
     name='prophetess_pipeline_exec_time',
@@ -16,23 +18,206 @@ plugin_latency = Histogram(
     labelnames=('id', 'plugin', 'type', 'class'),
 )
 
+service_rate = Gauge(
+    name='prophetess_service_rate_limit',
+    documentation='The calls per second currently allowed to a downstream service',
+    labelnames=('service',),
+)
+
+pipeline_skipped = Counter(
+    name='prophetess_pipeline_skipped_runs',
+    documentation='Scheduled pipeline runs skipped because the previous run was still in progress',
+    labelnames=('id',),
+)
+
+load_retries = Counter(
+    name='prophetess_load_retries',
+    documentation='Loads retried after a failure',
+    labelnames=('pipeline', 'loader'),
+)
+
+spooled = Counter(
+    name='prophetess_spooled_records',
+    documentation='Records written to the dead-letter spool after their load failed',
+    labelnames=('pipeline', 'loader'),
+)
+
+spool_replayed = Counter(
+    name='prophetess_replayed_records',
+    documentation='Spooled records taken from the spool to be loaded again',
+    labelnames=('pipeline', 'loader'),
+)
+
+spool_dropped = Counter(
+    name='prophetess_dropped_records',
+    documentation='Records dropped because the dead-letter spool was full',
+    labelnames=('pipeline', 'loader'),
+)
+
+spool_size = Gauge(
+    name='prophetess_spool_size',
+    documentation='Records waiting in the dead-letter spool',
+    labelnames=('pipeline', 'loader'),
+)
+
+# Per record latencies are mostly well under the default buckets' 5ms
+RECORD_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+records_extracted = Counter(
+    name='prophetess_records_extracted',
+    documentation='Records produced by an extractor',
+    labelnames=('pipeline', 'plugin'),
+)
+
+records_transformed = Counter(
+    name='prophetess_records_transformed',
+    documentation='Records passed through a transformer',
+    labelnames=('pipeline', 'plugin'),
+)
+
+records_loaded = Counter(
+    name='prophetess_records_loaded',
+    documentation='Records loaded by a loader',
+    labelnames=('pipeline', 'plugin'),
+)
+
+records_skipped = Counter(
+    name='prophetess_records_skipped',
+    documentation='Records a loader skipped because they had not changed',
+    labelnames=('pipeline', 'plugin'),
+)
+
+records_failed = Counter(
+    name='prophetess_records_failed',
+    documentation='Records that failed to transform or load',
+    labelnames=('pipeline', 'plugin'),
+)
+
+stage_latency = Histogram(
+    name='prophetess_record_stage_seconds',
+    documentation='The time each record spends in the extract, transform and load stages',
+    labelnames=('pipeline', 'stage'),
+    buckets=RECORD_BUCKETS,
+)
+
+pipeline_span = Histogram(
+    name='prophetess_pipeline_first_to_last_seconds',
+    documentation='The time from the first record a pipeline run extracts to the last one it loads',
+    labelnames=('pipeline',),
+)
+
+queue_depth = Gauge(
+    name='prophetess_queue_depth',
+    documentation='Records waiting on the queue feeding a pipeline stage',
+    labelnames=('pipeline', 'stage'),
+)
+
+in_flight = Gauge(
+    name='prophetess_records_in_flight',
+    documentation='Records a pipeline holds between extract and load',
+    labelnames=('pipeline',),
+)
+
+extract_cache_hits = Counter(
+    name='prophetess_extract_cache_hits',
+    documentation='Extractor runs served from a cached snapshot, fresh or stale',
+    labelnames=('extractor', 'state'),
+)
+
+extract_cache_misses = Counter(
+    name='prophetess_extract_cache_misses',
+    documentation='Extractor runs that found no usable cached snapshot',
+    labelnames=('extractor',),
+)
+
+extract_cache_age = Gauge(
+    name='prophetess_extract_cache_age_seconds',
+    documentation='Age of the cached snapshot of each extractor',
+    labelnames=('extractor',),
+)
+
+fan_out_subscribers = Histogram(
+    name='prophetess_fan_out_subscribers',
+    documentation='Pipelines sharing each run of a shared extractor',
+    labelnames=('extractor',),
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16),
+)
+
+fan_out_spilled = Counter(
+    name='prophetess_fan_out_spilled_records',
+    documentation='Records of a shared extractor spilled to disk for a pipeline falling behind',
+    labelnames=('extractor',),
+)
+
+slow_callbacks = Histogram(
+    name='prophetess_slow_callback_seconds',
+    documentation='Callbacks that blocked the event loop for longer than PROPHETESS_SLOW_CALLBACK seconds',
+    buckets=(.1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+
+@functools.lru_cache(maxsize=None)
+def child(metric, *labels: str):
+    """`metric.labels(*labels)`, looked up once instead of for every record"""
+    return metric.labels(*labels)
+
 
 class Timer:
+    """Observes latencies into one labelled child of a histogram
+
+    `start` returns a token to pass to `stop`, so one timer can measure any
+    number of overlapping calls. Used as a context manager, the start of each
+    measurement is kept in the current task's context, where `with` blocks
+    always nest, so concurrent tasks sharing a plugin don't share a start.
+
+    `stop` without a token stops the timer's latest `start` in the current
+    context, for plugins still pairing `start()` and `stop()`.
+    """
 
     def __init__(self, *, observer: Histogram, labels: Collection[str]) -> None:
         self.histogram = observer
-        self._start_time = None
         self.labels = labels
+        self.child = observer.labels(*labels)
+
+    def __enter__(self) -> 'Timer':
+        _measurements.set((time.perf_counter_ns(), _measurements.get()))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        stop = time.perf_counter_ns()
+        start, outer = _measurements.get()
+        _measurements.set(outer)
+        self.child.observe((stop - start) / 1e9)
+
+    def start(self) -> int:
+        token = time.perf_counter_ns()
+        started = dict(_started.get() or {})
+        started[self] = token
+        _started.set(started)
+        return token
+
+    def stop(self, token: int = None) -> float:
+        """Observe the time since the `start` that returned `token`, or since
+        this timer's latest `start` in the current context"""
+        now = time.perf_counter_ns()
+        if token is None:
+            started = dict(_started.get() or {})
+            token = started.pop(self, None)
+            if token is None:
+                raise RuntimeError('Timer {} stopped without being started'.format(self.labels))
+            _started.set(started)
+
+        latency = (now - token) / 1e9
+        self.child.observe(latency)
+        return latency
 
-    def __enter__(self):
-        self.start()
+    def observe(self, latency: float) -> None:
+        self.child.observe(latency)
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.stop()
 
-    def start(self) -> None:
-        self._start_time = time.time()
+# Starts of the measurements open in the current context, innermost first,
+# as nested (start, outer) tuples
+_measurements = contextvars.ContextVar('measurements', default=None)
 
-    def stop(self) -> None:
-        latency = time.time() - self._start_time
-        self.histogram.labels(*self.labels).observe(latency)
+# The latest start of each timer in the current context, by timer
+_started = contextvars.ContextVar('started', default=None)
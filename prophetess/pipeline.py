@@ -1,49 +1,174 @@
 
+import asyncio
 import collections
+import collections.abc
+import functools
 import logging
-from typing import Any, Dict, List, Tuple, Union
+import os
+import time
+from typing import (Any, AsyncGenerator, Awaitable, Callable, Dict, Iterable,
+                    List, Tuple, Union)
 
-from prophetess.exceptions import ProphetessException
-from prophetess.metrics import Timer, pipeline_latency
+from prophetess import executor
+from prophetess.batch import Batch
+from prophetess.budget import Budget
+from prophetess.cache import CachedExtractor, ChangeCache
+from prophetess.config import STATE_DIR
+from prophetess.exceptions import (InvalidConfigurationException,
+                                   ProphetessException)
+from prophetess.fanout import SharedExtractor
+from prophetess.metrics import (Timer, child, in_flight, load_retries,
+                                pipeline_latency, pipeline_span, queue_depth,
+                                records_extracted, records_failed,
+                                records_loaded, records_skipped,
+                                records_transformed, spool_replayed,
+                                stage_latency)
 from prophetess.plugin import Extractor, Loader, Transformer
+from prophetess.ratelimit import limit
+from prophetess.retry import retryable
+from prophetess.sessions import sessions
+from prophetess.sharding import Shard
+from prophetess.spool import Spool
+from prophetess.state import StateStore
+from prophetess.template import columns_to_rows
 from prophetess.utils import build_plugin
 
 log = logging.getLogger(__name__)
 
+# Sentinel placed on a stage queue to tell one worker there is no more work
+_STOP = object()
 
-def build_pipelines(cfg: Dict[str, Any]) -> 'Pipelines':
+
+def build_pipelines(cfg: Dict[str, Any], shard: Shard = None) -> 'Pipelines':
+    """Build the pipelines in `cfg`
+
+    With a `shard`, only the pipelines assigned to it are built, along with
+    every partitioned pipeline, whose extractors are limited to the shard's
+    partition.
+    """
     pipelines = Pipelines()
     extractors = cfg.get('extractors')
     loaders = cfg.get('loaders')
     transformers = cfg.get('transformers', {})
+    # Replicas sharing a host keep their state apart
+    state_dir = STATE_DIR if shard is None else os.path.join(STATE_DIR, 'replica-{}'.format(shard.index))
+    watermarks = StateStore(os.path.join(state_dir, 'watermarks.json'))
 
+    selected = {}
     for name, data in cfg.get('pipelines', {}).items():
+        if shard is None or data.get('partitioned') or shard.owns(name):
+            selected[name] = data
+        else:
+            log.debug('{} is run by replica {}'.format(name, shard.ring.owner(name)))
+
+    # Extractors are built once, and shared by every pipeline listing them.
+    # Partitioned pipelines share their own, limited to the partition.
+    references = collections.Counter((e, bool(shard and data.get('partitioned')))
+                                     for data in selected.values() for e in data.get('extractors', []))
+    built = {}
+
+    def extractor(e: str, partitioned: bool) -> Union[Extractor, CachedExtractor, SharedExtractor]:
+        key = (e, partitioned)
+        if key not in built:
+            built[key] = build_plugin('Extractor', e, extractors[e])
+            if partitioned:
+                if not getattr(built[key], 'partitioned', False):
+                    raise InvalidConfigurationException('Extractor {} can not be partitioned'.format(e))
+                built[key].partition = shard.partition
+            cache = extractors[e].get('cache')
+            if cache:
+                # A partition's snapshot only holds its share of the records
+                name = e if not partitioned else '{}.partition-{}-of-{}'.format(e, *shard.partition)
+                built[key] = pipelines.caches[name] = CachedExtractor(
+                    built[key],
+                    ttl=cache.get('ttl', 3600),
+                    max_records=cache.get('max_records'),
+                    stale_while_revalidate=cache.get('stale_while_revalidate', 0),
+                    path=os.path.join(state_dir, 'cache', '{}.json'.format(name)) if cache.get('persist') else None,
+                )
+            if references[key] > 1:
+                built[key] = SharedExtractor(built[key], **extractors[e].get('fan_out', {}))
+        if isinstance(built[key], SharedExtractor):
+            built[key].consumers += 1
+        return built[key]
+
+    for name, data in selected.items():
+        partitioned = bool(shard and data.get('partitioned'))
         transform = data.get('transform')
+        changes = None
+        skip_unchanged = data.get('skip_unchanged')
 
         if isinstance(transform, str):
             transformer = build_plugin('Transformer', transform, transformers.get(transform))
-        elif isinstance(transform, collections.Mapping):
+        elif isinstance(transform, collections.abc.Mapping):
             transformer = Transformer(id='YAMLTransformer', config=transform)
         else:
             log.error('Invalid pipeline configuration for {}, bad transform'.format(name))
             continue
 
+        if skip_unchanged:
+            options = skip_unchanged if isinstance(skip_unchanged, collections.abc.Mapping) else {}
+            changes = ChangeCache(
+                max_size=options.get('max_size', 100000),
+                refresh_interval=options.get('refresh_interval'),
+                path=os.path.join(state_dir, 'changes-{}.json'.format(name)) if options.get('persist') else None,
+            )
+
+        spools = {}
+        for loader in data.get('loaders', []):
+            spool = loaders[loader].get('spool')
+            if spool:
+                options = spool if isinstance(spool, collections.abc.Mapping) else {}
+                spools[loader] = Spool(
+                    os.path.join(state_dir, 'spool', name, '{}.jsonl'.format(loader)),
+                    max_size=options.get('max_size', 10000),
+                    labels=(name, loader),
+                )
+
         pipelines.append(Pipeline(
             id=name,
-            extractors=[build_plugin('Extractor', e, extractors[e])
-                        for e in data.get('extractors', [])],
+            extractors=[extractor(e, partitioned) for e in data.get('extractors', [])],
             transform=transformer,
-            loaders=[build_plugin('Loader', e, loaders[e]) for e in data.get('loaders', [])]
+            loaders=[build_plugin('Loader', e, loaders[e]) for e in data.get('loaders', [])],
+            concurrency=data.get('concurrency', 1),
+            stages=data.get('stages'),
+            strict_load_order=data.get('strict_load_order', False),
+            batch_size=data.get('batch_size'),
+            flush_interval=data.get('flush_interval'),
+            columnar=data.get('columnar', False),
+            max_in_flight=data.get('max_in_flight'),
+            state=watermarks,
+            changes=changes,
+            spools=spools,
+            interval=data.get('interval'),
+            schedule=data.get('schedule'),
+            jitter=data.get('jitter', 0),
         ))
 
     return pipelines
 
 
+async def closing(closeable: Iterable[Any]) -> None:
+    """Close everything in `closeable` at once, logging rather than raising errors"""
+    closeable = list(closeable)
+    results = await asyncio.gather(*[c.close() for c in closeable], return_exceptions=True)
+    for c, result in zip(closeable, results):
+        if isinstance(result, Exception):
+            log.error('Failed to close {}: {!r}'.format(c, result))
+
+
 class Pipelines(collections.OrderedDict):
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Extractors with a cache, by name and partition, so they can be
+        # invalidated
+        self.caches = {}
+
     async def close(self) -> None:
-        for p in self.values():
-            await p.close()
+        await closing(self.values())
+        executor.shutdown()
+        await sessions.close()
 
     def append(self, pipeline: 'Pipeline') -> None:
         self[pipeline.id] = pipeline
@@ -60,50 +185,540 @@ class Pipeline:
             extractors: Union[List[Extractor], Tuple[Extractor]],
             transform: Transformer,
             loaders: Union[List[Loader], Tuple[Loader]],
+            concurrency: int = 1,
+            stages: Dict[str, Dict[str, int]] = None,
+            strict_load_order: bool = False,
+            batch_size: int = None,
+            flush_interval: float = None,
+            columnar: bool = False,
+            max_in_flight: int = None,
+            state: StateStore = None,
+            changes: ChangeCache = None,
+            spools: Dict[str, Spool] = None,
+            interval: float = None,
+            schedule: str = None,
+            jitter: float = 0,
+            dry_run: bool = False,
     ) -> None:
+        # Watermarks and the failures holding them back are tracked per
+        # pipeline, which only works while its runs don't overlap
+        if concurrency > 1 and state is not None and any(getattr(e, 'incremental', False) for e in extractors):
+            raise InvalidConfigurationException(
+                '{} has incremental extractors, so its concurrency must be 1'.format(id))
+
         self.id = id
         self.extractors = extractors
         self.transform = transform
         self.loaders = loaders
+        self.concurrency = concurrency
+        self.stages = stages
+        self.strict_load_order = strict_load_order
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.columnar = columnar
+        self.budget = Budget(max_in_flight)
+        in_flight.labels(self.id).set_function(lambda: len(self.budget))
+        self.state = state
+        self.changes = changes
+        self.spools = spools or {}
+        self.interval = interval
+        self.schedule = schedule
+        self.jitter = jitter
+        # Dry runs extract and transform as usual, but never call loaders or
+        # save watermarks, unchanged records or spools
+        self.dry_run = dry_run
+        self.failures = 0
         self.timer = Timer(observer=pipeline_latency, labels=(self.id,))
+        self._semaphore = None
+        self._batches = {}
+        self._watermarks = {}
+        # perf_counter times of the first extracted and last loaded record,
+        # spanning every run in progress when runs overlap
+        self._first = None
+        self._last = None
+        self._running = 0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Limits how many runs of this pipeline may be in progress at once"""
+        # Created lazily so the semaphore binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def drain(self) -> None:
+        """Wait for the runs in progress to finish, keeping new ones from starting"""
+        for _ in range(self.concurrency):
+            await self.semaphore.acquire()
 
     async def close(self) -> None:
-        for e in self.extractors + [self.transform] + self.loaders:
-            await e.close()
+        await self.flush()
+        if self.changes is not None and not self.dry_run:
+            self.changes.save()
+        await closing(self.extractors + [self.transform] + self.loaders)
+
+    async def flush(self) -> None:
+        await asyncio.gather(*[batch.flush() for batch in self._batches.values()])
 
     async def run(self) -> None:
+        self._watermarks = {}
+        if not self._running:
+            self._first = self._last = None
+
+        self._running += 1
+        try:
+            await self._run()
+        finally:
+            self._running -= 1
+
+        if self._running:
+            return
+
+        if self._first is not None and self._last is not None:
+            pipeline_span.labels(self.id).observe(self._last - self._first)
+
+    async def _run(self) -> None:
         with self.timer:
-            for e in self.extractors:
-                log.debug('Running Extractor {}'.format(e))
-                e.timer.start()
-                async for record in e.run():
-                    e.timer.stop()
-                    log.debug('{} produced {}'.format(e, record))
+            # Records spooled by earlier runs are loaded before this run
+            # extracts, so they can't overwrite newer payloads for the same
+            # records downstream
+            await self.replay()
+
+            # Replayed records predate this run's watermarks, so only
+            # failures from here on hold them back
+            failures = self.failures
+
+            if self.stages:
+                await self.run_staged()
+            else:
+                for e in self.extractors:
+                    await self.run_extractor(e)
+
+            await self.flush()
+
+        if self.dry_run:
+            return
+
+        # Watermarks only advance once every record up to them has loaded,
+        # otherwise the next run fetches the same records again
+        if self.changes is not None:
+            self.changes.save()
+
+        if self.failures == failures:
+            self.save_watermarks()
+        elif self._watermarks:
+            log.warning('{} had {} failed loads, not advancing watermarks'.format(self, self.failures - failures))
+
+    async def replay(self) -> None:
+        """Load the records each loader's spool holds from earlier runs"""
+        if self.dry_run:
+            return
+
+        replayed = False
+        for loader in self.loaders:
+            spool = self.spools.get(loader.id)
+            if spool is None:
+                continue
+
+            records = collections.deque(spool.take())
+            if not records:
+                spool.done()
+                continue
+
+            log.info('{} replaying {} spooled records into {}'.format(self, len(records), loader))
+            spool_replayed.labels(self.id, loader.id).inc(len(records))
+            replayed = True
+            try:
+                while records:
+                    await self.load_into(loader, records[0])
+                    records.popleft()
+            finally:
+                # Put back whatever a cancelled run didn't get to. A process
+                # dying here leaves every taken record to be taken again.
+                if records:
+                    spool.append(list(records))
+                spool.done()
+
+        if replayed:
+            await self.flush()
+
+    def save_watermarks(self) -> None:
+        if not self._watermarks:
+            return
+
+        for key, watermark in self._watermarks.items():
+            self.state.set(key, watermark)
+        self.state.save()
+        log.debug('{} advanced watermarks {}'.format(self, self._watermarks))
+
+    def _watermark_key(self, e: Extractor) -> Union[str, None]:
+        if self.state is None or not getattr(e, 'incremental', False):
+            return None
+        return '{}/{}'.format(self.id, e.id)
+
+    def _advance(self, key: str, watermark: Any) -> None:
+        if watermark is not None and (key not in self._watermarks or watermark > self._watermarks[key]):
+            self._watermarks[key] = watermark
+
+    async def extract_records(self, e: Extractor) -> AsyncGenerator[Dict[str, Any], None]:
+        """Run `e`, from its last watermark if it's incremental
+
+        Every record is taken from the budget before it is yielded, and `e`
+        isn't asked for the next one until there's room for it. Consumers
+        must release each record once they're done with it.
+        """
+        key = self._watermark_key(e)
+        records = e.run() if key is None else e.run(watermark=self.state.get(key))
+        extracted = child(records_extracted, self.id, e.id)
+        latency = child(stage_latency, self.id, 'extract')
+        elapsed = 0
+
+        # Only the time spent inside the extractor counts, not the time the
+        # pipeline takes to process each record before asking for the next
+        started = time.perf_counter()
+        async for record in records:
+            now = time.perf_counter()
+            latency.observe(now - started)
+            elapsed += now - started
+            extracted.inc()
+            if self._first is None:
+                self._first = now
+
+            if key is not None:
+                self._advance(key, e.watermark(record))
+            await self.budget.acquire()
+            yield record
+            started = time.perf_counter()
+
+        e.timer.observe(elapsed + time.perf_counter() - started)
+
+    async def run_extractor(self, e: Extractor) -> None:
+        log.debug('Running Extractor {}'.format(e))
+        if self.columnar and getattr(e, 'columnar', False):
+            key = self._watermark_key(e)
+            async for columns in e.run_columns(**({} if key is None else {'watermark': self.state.get(key)})):
+                count = len(next(iter(columns.values()), ()))
+                child(records_extracted, self.id, e.id).inc(count)
+                if self._first is None:
+                    self._first = time.perf_counter()
+
+                if key is not None:
+                    for record in columns_to_rows(columns):
+                        self._advance(key, e.watermark(record))
+                taken = await self.budget.acquire(count)
+                try:
+                    await self.process_columns(columns)
+                finally:
+                    await self.budget.release(taken)
+            return
+
+        # Transformers running in an executor pool are sent records in chunks,
+        # which have to fit in the budget
+        chunk_size = min(getattr(self.transform, 'chunk_size', 1), self.budget.limit or float('inf'))
+        chunk = []
+
+        async for record in self.extract_records(e):
+            log.debug('{} produced {}'.format(e, record))
+            if chunk_size > 1:
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    await self._process_chunk(chunk)
+                    chunk = []
+            else:
+                try:
                     await self.process(record)
+                finally:
+                    await self.budget.release()
+
+        if chunk:
+            await self._process_chunk(chunk)
+
+    async def _process_chunk(self, chunk: List[Dict[str, Any]]) -> None:
+        try:
+            await self.process_many(chunk)
+        finally:
+            await self.budget.release(len(chunk))
+
+    async def run_staged(self) -> None:
+        """Run extract, transform and load as workers joined by bounded queues
+
+        The `transform` and `load` entries of `stages` set the number of
+        `workers` for that stage and the `queue_size` of the queue feeding it.
+        A full queue blocks the stage before it, so a slow loader throttles
+        the extractors instead of buffering their records in memory.
+        """
+        transform = self.stages.get('transform', {})
+        load = self.stages.get('load', {})
+        transform_workers = transform.get('workers', 1)
+        load_workers = load.get('workers', 1)
+
+        records = asyncio.Queue(maxsize=transform.get('queue_size', 100))
+        payloads = asyncio.Queue(maxsize=load.get('queue_size', 100))
+
+        async def process(record):
+            try:
+                await self.process(record, sink=payloads.put)
+            finally:
+                await self.budget.release()
+
+        queue_depth.labels(self.id, 'transform').set_function(records.qsize)
+        queue_depth.labels(self.id, 'load').set_function(payloads.qsize)
+
+        stages = [
+            asyncio.ensure_future(self._stage(
+                [self.extract(e, records) for e in self.extractors],
+                records, transform_workers,
+            )),
+            asyncio.ensure_future(self._stage(
+                [self._work(records, process) for _ in range(transform_workers)],
+                payloads, load_workers,
+            )),
+            asyncio.ensure_future(self._stage(
+                [self._work(payloads, self.load) for _ in range(load_workers)],
+            )),
+        ]
+
+        try:
+            done, _ = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+            for stage in done:
+                stage.result()
+        finally:
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+
+            # Records left queued by a failed run give back their budget
+            while not records.empty():
+                if records.get_nowait() is not _STOP:
+                    await self.budget.release()
+
+            queue_depth.labels(self.id, 'transform').set_function(lambda: 0)
+            queue_depth.labels(self.id, 'load').set_function(lambda: 0)
+
+    @staticmethod
+    async def _stage(workers: List[Awaitable], downstream: asyncio.Queue = None, consumers: int = 0) -> None:
+        await asyncio.gather(*workers)
+        for _ in range(consumers):
+            await downstream.put(_STOP)
+
+    @staticmethod
+    async def _work(queue: asyncio.Queue, handler: Callable[[Any], Awaitable]) -> None:
+        while True:
+            item = await queue.get()
+            if item is _STOP:
+                return
+            await handler(item)
+
+    async def extract(self, extractor: Extractor, queue: asyncio.Queue) -> None:
+        log.debug('Running Extractor {}'.format(extractor))
+        async for record in self.extract_records(extractor):
+            log.debug('{} produced {}'.format(extractor, record))
+            try:
+                await queue.put(record)
+            except BaseException:
+                await self.budget.release()
+                raise
+
+    async def process(self, record: Dict[str, Any], sink: Callable[[Any], Awaitable] = None) -> None:
+        sink = sink or self.load
+        elapsed = 0
 
-    async def process(self, record: Dict[str, Any]) -> None:
         with self.transform.timer:
+            # Time spent loading what the transformer produced doesn't count
+            # towards its latency
+            started = time.perf_counter()
             try:
                 async for payload in self.transform.run(record):
+                    elapsed += time.perf_counter() - started
                     log.debug('{} produced {}'.format(self.transform, payload))
-                    await self.load(payload)
-            except KeyError:
+                    await sink(payload)
+                    started = time.perf_counter()
+            except Exception:
+                child(records_failed, self.id, self.transform.id).inc()
                 raise
 
+        child(stage_latency, self.id, 'transform').observe(elapsed + time.perf_counter() - started)
+        child(records_transformed, self.id, self.transform.id).inc()
+
+    async def process_many(self, records: List[Dict[str, Any]]) -> None:
+        with self.transform.timer:
+            started = time.perf_counter()
+            results = await self.transform.run_many(records)
+            self._observe_transformed(len(records), time.perf_counter() - started)
+
+        for payloads in results:
+            for payload in payloads:
+                log.debug('{} produced {}'.format(self.transform, payload))
+                await self.load(payload)
+
+    async def process_columns(self, columns: Dict[str, List[Any]]) -> None:
+        """Transform and load a batch of `{name: [values]}` columns
+
+        The YAML transform renders the whole batch at once and hands it to
+        the loaders as a batch. Any other transformer processes the batch one
+        record at a time.
+        """
+        if not getattr(self.transform, 'columnar', False):
+            for record in columns_to_rows(columns):
+                await self.process(record)
+            return
+
+        with self.transform.timer:
+            started = time.perf_counter()
+            payloads = [p for p in self.transform.template.render_columns(columns) if p]
+            self._observe_transformed(len(next(iter(columns.values()), ())), time.perf_counter() - started)
+
+        log.debug('{} produced {} records'.format(self.transform, len(payloads)))
+        await self.load_many(payloads)
+
+    def _observe_transformed(self, count: int, elapsed: float) -> None:
+        """Count `count` records transformed together in `elapsed` seconds"""
+        if not count:
+            return
+
+        latency = child(stage_latency, self.id, 'transform')
+        for _ in range(count):
+            latency.observe(elapsed / count)
+        child(records_transformed, self.id, self.transform.id).inc(count)
+
     async def load(self, record: Dict[str, Any]) -> None:
         if not record:
             return
 
-        for loader in self.loaders:
-            log.debug('Running Loader: {}'.format(loader))
+        await self._fan_out([self.load_into(loader, record) for loader in self.loaders])
+
+    async def load_many(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+
+        await self._fan_out([self._load_many_into(loader, records) for loader in self.loaders])
+
+    async def _fan_out(self, loads: List[Awaitable]) -> None:
+        if self.strict_load_order:
+            for load in loads:
+                await load
+        else:
+            await asyncio.gather(*loads)
+
+    async def _load_many_into(self, loader: Loader, records: List[Dict[str, Any]]) -> None:
+        if getattr(loader, 'batching', False) and self.batch(loader) is None:
+            await self.load_batch_into(loader, records)
+            return
+
+        for record in records:
+            await self.load_into(loader, record)
+
+    async def load_into(self, loader: Loader, record: Dict[str, Any]) -> None:
+        batch = self.batch(loader)
+        if batch is not None:
+            await batch.add(record)
+            return
+
+        fingerprint = None
+        if self.changes is not None:
+            fingerprint = self.changes.fingerprint(self.id, loader, record)
+            if self.changes.unchanged(*fingerprint):
+                log.debug('{} skipped unchanged {}'.format(loader, record))
+                child(records_skipped, self.id, loader.id).inc()
+                return
+
+        loaded = await self._call_loader(loader, loader.run, record, [record])
+        # Dry runs load nothing, so there's nothing to remember
+        if loaded and fingerprint and not self.dry_run:
+            self.changes.update(*fingerprint)
+
+    async def load_batch_into(self, loader: Loader, records: List[Dict[str, Any]]) -> None:
+        fingerprints = []
+        if self.changes is not None:
+            changed = []
+            for record in records:
+                fingerprint = self.changes.fingerprint(self.id, loader, record)
+                if not self.changes.unchanged(*fingerprint):
+                    changed.append(record)
+                    fingerprints.append(fingerprint)
+
+            log.debug('{} skipped {} unchanged records'.format(loader, len(records) - len(changed)))
+            child(records_skipped, self.id, loader.id).inc(len(records) - len(changed))
+            records = changed
+
+        if not records:
+            return
+
+        if await self._call_loader(loader, loader.run_batch, records, records) and not self.dry_run:
+            for fingerprint in fingerprints:
+                self.changes.update(*fingerprint)
+
+    def batch(self, loader: Loader) -> Union[Batch, None]:
+        """The batch buffering records for `loader`, if it loads in batches"""
+        if not self.batch_size or not getattr(loader, 'batching', False):
+            return None
+
+        if loader.id not in self._batches:
+            self._batches[loader.id] = Batch(
+                functools.partial(self.load_batch_into, loader),
+                size=self.batch_size,
+                interval=self.flush_interval,
+            )
+        return self._batches[loader.id]
+
+    async def _call_loader(
+            self,
+            loader: Loader,
+            fn: Callable[[Any], Awaitable],
+            arg: Any,
+            records: List[Dict[str, Any]],
+    ) -> bool:
+        """Call `fn` until it succeeds or `loader` is out of retries
+
+        Records that still fail because of an outage go to the loader's spool,
+        if it has one, to be replayed by a later run.
+        """
+        if self.dry_run:
+            log.debug('{} would load {} records'.format(loader, len(records)))
+            return True
+
+        log.debug('Running Loader: {}'.format(loader))
+        delays = loader.retry.delays() if getattr(loader, 'retry', None) else iter(())
 
+        while True:
             with loader.timer:
+                started = time.perf_counter()
                 try:
-                    await loader.run(record)
-                except ProphetessException as e:
-                    log.warning('{} Loader failed: {}'.format(loader.id, e))
+                    async with limit(loader):
+                        await fn(arg)
                 except Exception as e:
-                    log.error('{} raised unexpected exception: {}'.format(loader.id, e))
+                    error = e
+                else:
+                    self._observe_loaded(loader, len(records), time.perf_counter() - started)
+                    return True
+
+            delay = next(delays, None)
+            if delay is None or not retryable(error):
+                break
+
+            log.info('{} Loader failed, retrying in {:.1f}s: {}'.format(loader.id, delay, error))
+            load_retries.labels(self.id, loader.id).inc()
+            await asyncio.sleep(delay)
+
+        self.failures += 1
+        child(records_failed, self.id, loader.id).inc(len(records))
+        if isinstance(error, ProphetessException):
+            log.warning('{} Loader failed: {}'.format(loader.id, error))
+        else:
+            log.error('{} raised unexpected exception: {}'.format(loader.id, error))
+
+        spool = self.spools.get(loader.id)
+        if spool is not None and retryable(error):
+            spool.append(records)
+
+        return False
+
+    def _observe_loaded(self, loader: Loader, count: int, elapsed: float) -> None:
+        latency = child(stage_latency, self.id, 'load')
+        for _ in range(count):
+            latency.observe(elapsed / count)
+        child(records_loaded, self.id, loader.id).inc(count)
+        self._last = time.perf_counter()
 
     def __str__(self) -> str:
         return '{}({})'.format(type(self).__name__, self.id)
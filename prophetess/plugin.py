@@ -1,14 +1,21 @@
 
 import asyncio
-from typing import Any, AsyncGenerator, Collection, Dict, Union
+from typing import Any, AsyncGenerator, Collection, Dict, List, Mapping, Union
+
+import aiohttp
 
 from prophetess.exceptions import InvalidConfigurationException
 from prophetess.metrics import Timer, plugin_latency
+from prophetess.ratelimit import Limiter, limiters
+from prophetess.sessions import paginate, sessions
+from prophetess.template import Template, format_string
 
 
 class PluginBase(object):
     config = {}
     required_config = ()
+    # The downstream service this plugin's rate limits are shared with
+    service = None
 
     def __init__(
             self, *,
@@ -36,6 +43,21 @@ class PluginBase(object):
     def loop(self) -> asyncio.AbstractEventLoop:
         return self._loop or asyncio.get_event_loop()
 
+    @property
+    def limiter(self) -> Union[Limiter, None]:
+        return limiters.get(self.service) if self.service else None
+
+    def session(self, url: str = None) -> aiohttp.ClientSession:
+        """The HTTP session shared by everything talking to `url`'s host
+
+        Defaults to the plugin's `host` config. Sessions are closed by
+        Prophetess, plugins must not close them.
+        """
+        url = url or (self.config or {}).get('host')
+        if not url:
+            raise InvalidConfigurationException('{} has no host for an HTTP session'.format(self))
+        return sessions.get(url)
+
     async def close(self) -> None:
         pass
 
@@ -44,25 +66,117 @@ class PluginBase(object):
 
 
 class Extractor(PluginBase):
+    # Incremental extractors are run with the watermark reached by the last
+    # successful run, and only fetch records past it
+    incremental = False
+    # Partitioned extractors only fetch the records in their `partition`
+    # when their pipeline is spread over several replicas
+    partitioned = False
+    partition = None
+
+    async def run(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield extracted records one at a time
+
+        Records should be yielded as they arrive rather than after fetching
+        the whole result, see `StreamingExtractor`.
+        """
+        raise NotImplementedError
+        yield
+
+    def watermark(self, record: Dict[str, Any]) -> Any:
+        """The watermark `record` has reached, e.g. its LastModifiedDate
+
+        Watermarks must be JSON serializable and increase as records change,
+        the pipeline keeps the highest one it has seen.
+        """
+        raise NotImplementedError
+
+    async def run_columns(self) -> AsyncGenerator[Dict[str, List[Any]], None]:
+        """Extract batches of records as `{name: [values]}` columns
+
+        Extractors returning large numbers of homogeneous rows can override
+        this for pipelines in columnar mode.
+        """
+        raise NotImplementedError
+        yield
+
+    @property
+    def columnar(self) -> bool:
+        return type(self).run_columns is not Extractor.run_columns
+
+    def in_partition(self, key: Any) -> bool:
+        """Whether the record identified by `key` is in this extractor's
+        partition, for extractors that can't partition their queries"""
+        return self.partition is None or self.partition.owns(key)
 
-    async def run(self) -> Dict[str, Any]:
+
+class StreamingExtractor(Extractor):
+    """Extractor fetching its records a page at a time
+
+    Subclasses implement `pages`, yielding lists of up to `page_size`
+    records. The next page isn't fetched until the pipeline has room for
+    more records in its `max_in_flight` budget, so memory use follows the
+    page size rather than the size of the extract.
+    """
+    page_size = 1000
+
+    async def pages(self, **kwargs: Any) -> AsyncGenerator[List[Dict[str, Any]], None]:
+        """Yield pages of records, taking `watermark` if incremental"""
         raise NotImplementedError
+        yield
+
+    async def run(self, **kwargs: Any) -> AsyncGenerator[Dict[str, Any], None]:
+        async for page in self.pages(**kwargs):
+            for record in page:
+                yield record
+
+    def paginate(self, url: str, **kwargs: Any) -> AsyncGenerator[List[Dict[str, Any]], None]:
+        """Pages from the JSON API at `url`, see `prophetess.sessions.paginate`"""
+        return paginate(self.session(url), url, limiter=self.limiter, **kwargs)
 
 
 class Loader(PluginBase):
+    # A prophetess.retry.Retry, set from the loader's `retries` config
+    retry = None
 
     async def run(self, record: Dict[str, Any]) -> Dict[str, Any]:
         raise NotImplementedError
 
+    async def run_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Load many records at once
+
+        Loaders which can write several records in a single request should
+        override this. The default loads each record with `run`.
+        """
+        for record in records:
+            await self.run(record)
+
+    @property
+    def batching(self) -> bool:
+        return type(self).run_batch is not Loader.run_batch
+
 
 class Transformer(PluginBase):
+    # Number of records a pipeline collects before calling run_many
+    chunk_size = 1
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.template = Template(self.config) if isinstance(self.config, Mapping) and not self.customised else None
+
+    @property
+    def customised(self) -> bool:
+        """Whether `format` or `parse` is overridden, so the template can't be used"""
+        return type(self).format is not Transformer.format or type(self).parse is not Transformer.parse
+
+    @property
+    def columnar(self) -> bool:
+        """Whether whole column batches can be transformed with the template"""
+        return self.template is not None and type(self).run is Transformer.run
 
     @staticmethod
     def format(string: str, mapping: Dict[str, Any]) -> str:
-        try:
-            return string.format(**mapping)
-        except (TypeError, KeyError):
-            return None
+        return format_string(string, mapping)
 
     def parse(self, keys: Union[str, Dict[str, Any]], values: Dict[str, Any]) -> Union[str, Dict[str, Any]]:
         if isinstance(keys, str):
@@ -70,5 +184,15 @@ class Transformer(PluginBase):
 
         return {k: self.parse(v, values) for k, v in keys.items()}
 
+    async def run_many(self, records: List[Dict[str, Any]]) -> List[List[Any]]:
+        """Transform several records, returning the payloads for each in order"""
+        results = []
+        for record in records:
+            results.append([payload async for payload in self.run(record)])
+        return results
+
     async def run(self, data: Dict[str, Any]) -> AsyncGenerator[Union[str, Dict[str, Any]], None]:
-        yield self.parse(self.config, data)
+        if self.template is None:
+            yield self.parse(self.config, data)
+        else:
+            yield self.template.render(data)
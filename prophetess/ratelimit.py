@@ -0,0 +1,174 @@
+"""Rate and concurrency limits for downstream services
+
+Plugins name the service they talk to with a `service` key next to their
+`plugin` key, and every plugin naming the same service shares one `Limiter`
+configured by the top-level `services` section. The pipeline holds a
+loader's limiter around each load. Extractors hold `self.limiter` around
+each request they make.
+
+Adaptive limiters halve their rate whenever a call is throttled, a
+`ServiceError` with a 429/5xx status, and add
+`increase` back after successes (AIMD). Both happen at most once every
+`window` seconds, so a burst of concurrent calls counts as one signal.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict
+
+from prophetess.exceptions import ServiceError
+from prophetess.metrics import service_rate
+
+log = logging.getLogger(__name__)
+
+# Errors without a status are bad records, not the service pushing back
+THROTTLED = (429, 502, 503, 504)
+
+
+class TokenBucket:
+    """Allows `rate` calls per second, in bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float = None) -> None:
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        while True:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Limiter:
+
+    def __init__(
+            self,
+            name: str,
+            *,
+            rate: float = None,
+            burst: float = None,
+            concurrency: int = None,
+            adaptive: bool = False,
+            min_rate: float = 0.1,
+            increase: float = 1,
+            decrease: float = 0.5,
+            window: float = 1,
+    ) -> None:
+        self.name = name
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_rate = rate
+        self.concurrency = concurrency
+        self.adaptive = adaptive and self.bucket is not None
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self._semaphore = None
+        # monotonic times of the last back-off and of the last rate change
+        self._backed_off = None
+        self._changed = None
+
+        if self.bucket:
+            service_rate.labels(self.name).set(self.bucket.rate)
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so the semaphore binds to the running event loop
+        if self._semaphore is None and self.concurrency:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def __aenter__(self) -> 'Limiter':
+        if self.semaphore:
+            await self.semaphore.acquire()
+        try:
+            if self.bucket:
+                await self.bucket.acquire()
+        except BaseException:
+            self.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
+        if not self.adaptive:
+            return
+
+        if exc_val is None:
+            self.recover()
+        elif isinstance(exc_val, ServiceError) and exc_val.status in THROTTLED:
+            self.backoff()
+
+    def release(self) -> None:
+        if self.semaphore:
+            self.semaphore.release()
+
+    def backoff(self) -> None:
+        # Calls already in flight when the rate dropped are throttled too,
+        # they don't mean the lower rate is still too high
+        now = time.monotonic()
+        if self._backed_off is not None and now - self._backed_off < self.window:
+            return
+
+        self._backed_off = self._changed = now
+        self.set_rate(max(self.min_rate, self.bucket.rate * self.decrease))
+        log.warning('{} throttled, backing off to {:.2f} calls/s'.format(self, self.bucket.rate))
+
+    def recover(self) -> None:
+        now = time.monotonic()
+        if self.bucket.rate >= self.max_rate or (self._changed is not None and now - self._changed < self.window):
+            return
+
+        self._changed = now
+        self.set_rate(min(self.max_rate, self.bucket.rate + self.increase))
+
+    def set_rate(self, rate: float) -> None:
+        self.bucket.refill()
+        self.bucket.rate = rate
+        service_rate.labels(self.name).set(rate)
+
+    def __str__(self) -> str:
+        return '{}({})'.format(type(self).__name__, self.name)
+
+
+class Unlimited:
+
+    async def __aenter__(self) -> 'Unlimited':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        pass
+
+
+UNLIMITED = Unlimited()
+
+
+class Limiters:
+    """The limiter for each configured service"""
+
+    def __init__(self) -> None:
+        self._limiters = {}
+
+    def configure(self, services: Dict[str, Dict[str, Any]]) -> None:
+        self._limiters = {name: Limiter(name, **(options or {})) for name, options in services.items()}
+
+    def get(self, service: str) -> Limiter:
+        return self._limiters.get(service)
+
+
+limiters = Limiters()
+
+
+def limit(plugin: Any) -> Any:
+    """The limiter to hold while `plugin` runs, which may not limit at all"""
+    return getattr(plugin, 'limiter', None) or UNLIMITED
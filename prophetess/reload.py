@@ -0,0 +1,123 @@
+"""Reloading the pipeline config while pipelines keep running
+
+A pipeline is only rebuilt when its definition changed: its own config, the
+definitions of the plugins it uses, or the default interval. So is every
+pipeline sharing an extractor with one that is added, changed or removed,
+since pipelines built together share one extractor and its cache. The rest
+keep their plugins, connections and caches.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+log = logging.getLogger(__name__)
+
+
+def definition(cfg: Dict[str, Any], name: str) -> Dict[str, Any]:
+    """Everything in `cfg` that building pipeline `name` depends on"""
+    data = cfg.get('pipelines', {}).get(name, {})
+    transform = data.get('transform')
+
+    return {
+        'pipeline': data,
+        'extractors': {e: (cfg.get('extractors') or {}).get(e) for e in data.get('extractors', [])},
+        'loaders': {e: (cfg.get('loaders') or {}).get(e) for e in data.get('loaders', [])},
+        'transformer': (cfg.get('transformers') or {}).get(transform) if isinstance(transform, str) else None,
+        'interval': cfg.get('interval'),
+    }
+
+
+def diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, List[str]]:
+    """The names of the pipelines `added`, `changed`, `removed` and
+    `unchanged` going from config `old` to `new`"""
+    before = old.get('pipelines') or {}
+    after = new.get('pipelines') or {}
+    changes = {
+        'added': [],
+        'changed': [],
+        'removed': [name for name in before if name not in after],
+        'unchanged': [],
+    }
+
+    for name in after:
+        if name not in before:
+            changes['added'].append(name)
+        elif definition(old, name) != definition(new, name):
+            changes['changed'].append(name)
+        else:
+            changes['unchanged'].append(name)
+
+    # Rebuilding a pipeline rebuilds its extractors, so the pipelines sharing
+    # them are rebuilt along with it, until no unchanged pipeline shares one
+    rebuilt = {e for name in changes['added'] + changes['changed'] for e in after[name].get('extractors', [])}
+    rebuilt.update(e for name in changes['changed'] + changes['removed'] for e in before[name].get('extractors', []))
+    sharing = True
+    while sharing:
+        sharing = [name for name in changes['unchanged'] if rebuilt & set(after[name].get('extractors', []))]
+        for name in sharing:
+            changes['unchanged'].remove(name)
+            changes['changed'].append(name)
+            rebuilt.update(after[name].get('extractors', []))
+
+    changes['changed'].sort(key=list(after).index)
+    return changes
+
+
+class ConfigWatcher:
+    """Polls `path` every `interval` seconds, awaiting `callback` when its
+    contents change
+
+    The file is only read and hashed when its size or mtime changed, and
+    rewriting it with the same contents isn't a change. Errors from
+    `callback` are logged, and the next change is tried again.
+    """
+
+    def __init__(self, path: str, callback: Callable[[], Awaitable], *, interval: float = 5) -> None:
+        self.path = path
+        self.callback = callback
+        self.interval = interval
+        self._stat = self.stat()
+        self.digest = self.hash()
+
+    def stat(self) -> Tuple[int, int]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def hash(self) -> str:
+        try:
+            with open(self.path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except FileNotFoundError:
+            return None
+
+    def changed(self) -> bool:
+        stat = self.stat()
+        if stat == self._stat:
+            return False
+        self._stat = stat
+
+        digest = self.hash()
+        # A missing file is most likely being replaced, wait for the new one
+        if digest is None or digest == self.digest:
+            return False
+        self.digest = digest
+        return True
+
+    async def run(self) -> None:
+        log.info('Watching {} for changes every {}s'.format(self.path, self.interval))
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.changed():
+                continue
+
+            log.info('{} changed, reloading'.format(self.path))
+            try:
+                await self.callback()
+            except Exception as e:
+                log.error('Not reloading {}: {!r}'.format(self.path, e))
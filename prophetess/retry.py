@@ -0,0 +1,43 @@
+import asyncio
+import collections
+import random
+from typing import Any, Iterator
+
+import aiohttp
+
+from prophetess.exceptions import ServiceError
+
+
+class Retry:
+    """How many times to try a load, and how long to wait between tries
+
+    Waits grow exponentially from `base` seconds up to `max`, with full
+    jitter so loaders failing together don't retry in lockstep.
+    """
+
+    def __init__(self, attempts: int = 1, base: float = 1, max: float = 30) -> None:
+        self.attempts = attempts
+        self.base = base
+        self.max = max
+
+    @classmethod
+    def from_config(cls, cfg: Any) -> 'Retry':
+        """Build from a loader's `retries`, either a number of attempts or a mapping"""
+        if isinstance(cfg, collections.abc.Mapping):
+            return cls(**cfg)
+        return cls(attempts=cfg or 1)
+
+    def delays(self) -> Iterator[float]:
+        for attempt in range(self.attempts - 1):
+            yield random.uniform(0, min(self.max, self.base * 2 ** attempt))
+
+
+def retryable(exc: BaseException) -> bool:
+    """Whether `exc` looks like a passing outage rather than a bad record
+
+    Service errors without a status are treated as bad records; retrying
+    them would only spool and replay them forever.
+    """
+    if isinstance(exc, ServiceError):
+        return exc.status is not None and (exc.status == 429 or exc.status >= 500)
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError))
@@ -0,0 +1,233 @@
+"""Run each pipeline on its own schedule
+
+Pipelines set either an `interval` in seconds or a cron-style `schedule`,
+plus an optional `jitter` in seconds which delays every run by a random
+amount so pipelines sharing a schedule don't all start at the same moment.
+Runs are fixed-rate: a slow run doesn't push back the next one, and a run
+that would start while the previous one is still going is skipped.
+"""
+
+import asyncio
+import datetime
+import logging
+import random
+import time
+from typing import Awaitable, Callable, FrozenSet, Union
+
+from prophetess.exceptions import InvalidConfigurationException
+from prophetess.metrics import pipeline_skipped
+from prophetess.pipeline import Pipeline, Pipelines
+
+log = logging.getLogger(__name__)
+
+
+class Cron:
+    """A five field `minute hour day-of-month month day-of-week` expression
+
+    Fields accept `*`, numbers, `a-b` ranges, `,` separated lists and `/n`
+    steps. Day of week 0 and 7 are both Sunday. As with cron, when both day
+    fields are restricted a day matching either of them matches.
+    """
+
+    FIELDS = (
+        (0, 59),  # minute
+        (0, 23),  # hour
+        (1, 31),  # day of month
+        (1, 12),  # month
+        (0, 7),   # day of week
+    )
+
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != len(self.FIELDS):
+            raise InvalidConfigurationException('Invalid schedule {!r}, expected 5 fields'.format(expression))
+
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self.parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELDS)
+        ]
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self._any_day = fields[2] == '*' or fields[4] == '*'
+
+    def parse_field(self, field: str, low: int, high: int) -> FrozenSet[int]:
+        values = set()
+        try:
+            for part in field.split(','):
+                part, _, step = part.partition('/')
+                step = int(step) if step else 1
+                if part == '*':
+                    start, end = low, high
+                elif '-' in part:
+                    start, end = (int(value) for value in part.split('-', 1))
+                else:
+                    start = int(part)
+                    end = high if step > 1 else start
+
+                if step < 1 or not low <= start <= end <= high:
+                    raise ValueError(part)
+                values.update(range(start, end + 1, step))
+        except ValueError:
+            raise InvalidConfigurationException('Invalid schedule field {!r} in {!r}'.format(field, self.expression))
+
+        return frozenset(values)
+
+    def matches_day(self, dt: datetime.datetime) -> bool:
+        in_month = dt.day in self.days
+        in_week = (dt.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next(self, after: datetime.datetime) -> datetime.datetime:
+        """The first time matching this expression, strictly after `after`"""
+        dt = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        # Long enough to reach any valid date, including February 29th
+        limit = dt + datetime.timedelta(days=366 * 8)
+
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1) + datetime.timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self.matches_day(dt):
+                dt = dt.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + datetime.timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += datetime.timedelta(minutes=1)
+            else:
+                return dt
+
+        raise InvalidConfigurationException('Schedule {!r} never runs'.format(self.expression))
+
+
+class IntervalTrigger:
+    """Fires every `interval` seconds, measured from the first run"""
+
+    def __init__(self, interval: float, jitter: float = 0) -> None:
+        self.interval = interval
+        self.jitter = jitter
+        self._start = None
+        self._runs = 0
+
+    def delay(self, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        if self._start is None:
+            self._start = now
+
+        due = self._start + self._runs * self.interval
+        # Ticks missed entirely, e.g. while the event loop was blocked, are dropped
+        while due + self.interval <= now:
+            self._runs += 1
+            due += self.interval
+
+        self._runs += 1
+        return max(due - now, 0) + random.uniform(0, self.jitter)
+
+
+class CronTrigger:
+    """Fires whenever the wall clock matches a cron expression"""
+
+    def __init__(self, schedule: str, jitter: float = 0) -> None:
+        self.cron = Cron(schedule)
+        self.jitter = jitter
+        self._last = None
+
+    def delay(self, now: datetime.datetime = None) -> float:
+        now = datetime.datetime.now() if now is None else now
+        # Never fire twice for the same minute, even if a jittered run started early
+        after = max(now, self._last) if self._last else now
+        self._last = self.cron.next(after)
+        return (self._last - now).total_seconds() + random.uniform(0, self.jitter)
+
+
+def trigger_for(pipeline: Pipeline, interval: float) -> Union[IntervalTrigger, CronTrigger]:
+    jitter = getattr(pipeline, 'jitter', 0) or 0
+    if getattr(pipeline, 'schedule', None):
+        return CronTrigger(pipeline.schedule, jitter)
+    return IntervalTrigger(getattr(pipeline, 'interval', None) or interval, jitter)
+
+
+class Scheduler:
+    """Runs every pipeline with `runner` on its own trigger, until cancelled
+
+    Pipelines can be added and removed while it runs.
+    """
+
+    def __init__(
+            self,
+            pipelines: Pipelines,
+            runner: Callable[[Pipeline], Awaitable],
+            *,
+            interval: float = 90,
+    ) -> None:
+        self.pipelines = pipelines
+        self.runner = runner
+        self.interval = interval
+        self.running = set()
+        self.schedules = {}
+        # Built up front so an invalid schedule is reported straight away
+        self.triggers = {p.id: trigger_for(p, interval) for p in pipelines.values()}
+        self._stopped = None
+
+    async def run(self) -> None:
+        self._stopped = asyncio.get_event_loop().create_future()
+        for p in self.pipelines.values():
+            self._start(p)
+
+        try:
+            await self._stopped
+        except BaseException:
+            for task in self.running:
+                task.cancel()
+            raise
+        finally:
+            for task in self.schedules.values():
+                task.cancel()
+
+    def stop(self) -> None:
+        """Stop scheduling runs, so `run` returns, leaving runs in progress alone"""
+        for pipeline_id in list(self.schedules):
+            self.remove(pipeline_id)
+        if self._stopped is not None and not self._stopped.done():
+            self._stopped.set_result(None)
+
+    def add(self, pipeline: Pipeline) -> None:
+        """Schedule `pipeline`, in place of any pipeline with the same id"""
+        trigger = trigger_for(pipeline, self.interval)
+        self.remove(pipeline.id)
+        self.triggers[pipeline.id] = trigger
+        if self._stopped is not None and not self._stopped.done():
+            self._start(pipeline)
+
+    def remove(self, pipeline_id: str) -> None:
+        """Stop scheduling a pipeline, leaving its runs in progress alone"""
+        self.triggers.pop(pipeline_id, None)
+        task = self.schedules.pop(pipeline_id, None)
+        if task is not None:
+            task.cancel()
+
+    def _start(self, pipeline: Pipeline) -> None:
+        task = self.schedules[pipeline.id] = asyncio.ensure_future(self.schedule(pipeline))
+        task.add_done_callback(self._stop)
+
+    def _stop(self, task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None and not self._stopped.done():
+            self._stopped.set_exception(task.exception())
+
+    async def schedule(self, pipeline: Pipeline) -> None:
+        trigger = self.triggers[pipeline.id]
+        while True:
+            await asyncio.sleep(trigger.delay())
+
+            if pipeline.semaphore.locked():
+                log.warning('Skipping {}, the previous run is still in progress'.format(pipeline))
+                pipeline_skipped.labels(pipeline.id).inc()
+                continue
+
+            task = asyncio.ensure_future(self.runner(pipeline))
+            self.running.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Future) -> None:
+        self.running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error('Pipeline run failed: {!r}'.format(task.exception()), exc_info=task.exception())
@@ -0,0 +1,105 @@
+"""HTTP client sessions shared by every plugin
+
+Plugins talking to the same host share one `aiohttp.ClientSession`, and so
+one connection pool, instead of each opening their own. Connection limits,
+keep-alive and DNS caching are set once for all of them by the `http`
+section of the pipeline config.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncGenerator, Dict, List
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+
+from prophetess.exceptions import ServiceError
+from prophetess.ratelimit import UNLIMITED, Limiter
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'limit': 100,
+    'limit_per_host': 0,
+    'keepalive_timeout': 30,
+    'ttl_dns_cache': 300,
+    'timeout': 300,
+}
+
+
+class Sessions:
+
+    def __init__(self, **options: Any) -> None:
+        self.options = dict(DEFAULTS)
+        self._sessions = {}
+        self.configure(**options)
+
+    def configure(self, **options: Any) -> None:
+        self.options.update(options)
+
+    @staticmethod
+    def key(url: str) -> str:
+        """The `scheme://host:port` sessions are shared by"""
+        parts = urlsplit(url if '//' in url else '//' + url)
+        return '{}://{}'.format(parts.scheme or 'https', parts.netloc)
+
+    def get(self, url: str) -> aiohttp.ClientSession:
+        key = self.key(url)
+        session = self._sessions.get(key)
+
+        if session is None or session.closed:
+            log.debug('Opening HTTP session for {}'.format(key))
+            connector = aiohttp.TCPConnector(
+                limit=self.options['limit'],
+                limit_per_host=self.options['limit_per_host'],
+                keepalive_timeout=self.options['keepalive_timeout'],
+                ttl_dns_cache=self.options['ttl_dns_cache'],
+                use_dns_cache=True,
+            )
+            session = self._sessions[key] = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.options['timeout']),
+            )
+
+        return session
+
+    async def close(self) -> None:
+        sessions, self._sessions = list(self._sessions.values()), {}
+        await asyncio.gather(*[session.close() for session in sessions])
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+sessions = Sessions()
+
+
+async def paginate(
+        session: aiohttp.ClientSession,
+        url: str,
+        *,
+        results: str = 'results',
+        next: str = 'next',
+        limiter: Limiter = None,
+        **kwargs: Any,
+) -> AsyncGenerator[List[Dict[str, Any]], None]:
+    """Yield the pages of a JSON API that links each page to the next
+
+    Each response holds a page of records under `results` and the URL of the
+    next page, relative or absolute, under `next`: `results`/`next` for
+    Netbox, `records`/`nextRecordsUrl` for Salesforce. `kwargs` are passed
+    to the first request only, later URLs carry their own query.
+    """
+    while url:
+        async with limiter or UNLIMITED:
+            async with session.get(url, **kwargs) as response:
+                if response.status >= 400:
+                    raise ServiceError(
+                        '{} returned {}: {}'.format(url, response.status, await response.text()),
+                        status=response.status,
+                    )
+                body = await response.json()
+
+        yield body.get(results) or []
+        url = urljoin(url, body[next]) if body.get(next) else None
+        kwargs = {}
@@ -0,0 +1,115 @@
+"""Spreading pipelines over several replicas
+
+Each of `count` replicas runs the pipelines a consistent hash ring assigns
+to its `index`, so adding a replica only moves about 1/count of them.
+Pipelines set to `partitioned` run on every replica instead, each of their
+extractors fetching only its replica's partition of the records.
+
+Replicas are numbered by PROPHETESS_REPLICA_INDEX, e.g. from a StatefulSet
+pod's ordinal. Without it each replica claims the first free index by
+locking a file in PROPHETESS_STATE_DIR/replicas, which works for several
+processes on one host.
+"""
+
+import bisect
+import fcntl
+import hashlib
+import logging
+import os
+from typing import IO, NamedTuple
+
+from prophetess.exceptions import InvalidConfigurationException
+
+log = logging.getLogger(__name__)
+
+
+def position(key: str) -> int:
+    """Where `key` hashes to, the same in every process"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class Partition(NamedTuple):
+    """Partition `index` of `count` of an extractor's records"""
+    index: int
+    count: int
+
+    def owns(self, key: str) -> bool:
+        return position(str(key)) % self.count == self.index
+
+
+class HashRing:
+    """Consistent hashing of keys onto replicas numbered from 0 to `count` - 1
+
+    Every replica has `points` positions on the ring, and a key belongs to
+    the replica at the first position after its own.
+    """
+
+    def __init__(self, count: int, *, points: int = 100) -> None:
+        ring = sorted(
+            (position('replica-{}-{}'.format(replica, point)), replica)
+            for replica in range(count)
+            for point in range(points)
+        )
+        self.positions = [p for p, _ in ring]
+        self.replicas = [r for _, r in ring]
+
+    def owner(self, key: str) -> int:
+        i = bisect.bisect(self.positions, position(key)) % len(self.positions)
+        return self.replicas[i]
+
+
+class Shard:
+    """What replica `index` of `count` runs
+
+    A `lease` is the locked file claiming the index, held until `release`.
+    """
+
+    def __init__(self, index: int, count: int, *, lease: IO = None) -> None:
+        if not 0 <= index < count:
+            raise InvalidConfigurationException('Replica index {} is not within 0-{}'.format(index, count - 1))
+
+        self.index = index
+        self.count = count
+        self.lease = lease
+        self.ring = HashRing(count)
+
+    @property
+    def partition(self) -> Partition:
+        return Partition(self.index, self.count)
+
+    def owns(self, pipeline_id: str) -> bool:
+        return self.ring.owner(pipeline_id) == self.index
+
+    def release(self) -> None:
+        if self.lease is not None:
+            self.lease.close()
+            self.lease = None
+
+    def __str__(self) -> str:
+        return '{}({}/{})'.format(type(self).__name__, self.index, self.count)
+
+
+def claim(directory: str, count: int) -> Shard:
+    """The first replica index no other process on this host has claimed"""
+    os.makedirs(directory, exist_ok=True)
+    for index in range(count):
+        lease = open(os.path.join(directory, 'replica-{}.lock'.format(index)), 'w')
+        try:
+            fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lease.close()
+            continue
+
+        log.info('Claimed replica {} of {}'.format(index, count))
+        return Shard(index, count, lease=lease)
+
+    raise InvalidConfigurationException('All {} replicas are already claimed in {}'.format(count, directory))
+
+
+def shard_for(index: int = None, count: int = 1, *, directory: str) -> Shard:
+    """This replica's shard, None when running every pipeline alone"""
+    if count <= 1:
+        return None
+    if index is None:
+        return claim(directory, count)
+    return Shard(index, count)
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+from typing import Any, Collection, Dict, List
+
+from prophetess.metrics import spool_dropped, spool_size, spooled
+
+log = logging.getLogger(__name__)
+
+
+class Spool:
+    """Records a loader gave up on, kept on disk until a later run replays them
+
+    Records are appended to a JSON lines file, which holds at most `max_size`
+    records. Records arriving at a full spool are dropped and counted.
+
+    Taken records are kept in a `.replaying` file until the replay is `done`,
+    so a process dying mid-replay takes them again on its next run.
+    """
+
+    def __init__(self, path: str, *, labels: Collection[str], max_size: int = 10000) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.labels = labels
+        self.replaying = path + '.replaying'
+        self._size = None
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            try:
+                with open(self.path) as f:
+                    self._size = sum(1 for _ in f)
+            except FileNotFoundError:
+                self._size = 0
+            spool_size.labels(*self.labels).set(self._size)
+        return self._size
+
+    def append(self, records: List[Dict[str, Any]]) -> int:
+        """Spool as many of `records` as fit, returning how many did"""
+        kept = records[:max(0, self.max_size - self.size)]
+        dropped = len(records) - len(kept)
+
+        if kept:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a') as f:
+                for record in kept:
+                    f.write(json.dumps(record, default=str))
+                    f.write('\n')
+            self._size += len(kept)
+            spooled.labels(*self.labels).inc(len(kept))
+            spool_size.labels(*self.labels).set(self._size)
+
+        if dropped:
+            spool_dropped.labels(*self.labels).inc(dropped)
+            log.error('{} is full, dropped {} records'.format(self, dropped))
+
+        return len(kept)
+
+    def take(self) -> List[Dict[str, Any]]:
+        """Return every spooled record, including those of a replay that never
+        finished, moving them aside until `done` is called"""
+        leftover = os.path.exists(self.replaying)
+        if not self.size and not leftover:
+            return []
+
+        if self.size and leftover:
+            # Records spooled since go after those left over, and are only
+            # removed once they are safely with them
+            with open(self.path) as src, open(self.replaying, 'a') as dst:
+                dst.writelines(src)
+            os.remove(self.path)
+        elif self.size:
+            os.replace(self.path, self.replaying)
+
+        records = []
+        with open(self.replaying) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError as e:
+                    log.warning('Skipping unreadable record in {}: {}'.format(self.replaying, e))
+
+        self._size = 0
+        spool_size.labels(*self.labels).set(0)
+        return records
+
+    def done(self) -> None:
+        """Forget the records `take` returned, now they have been replayed"""
+        try:
+            os.remove(self.replaying)
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __str__(self) -> str:
+        return '{}({})'.format(type(self).__name__, self.path)
@@ -0,0 +1,59 @@
+
+import json
+import logging
+import os
+from typing import Any, Dict
+
+log = logging.getLogger(__name__)
+
+
+class StateStore:
+    """Small JSON-serializable values persisted to a file between runs
+
+    The file is read the first time a value is needed and rewritten
+    atomically by `save`. Only the values `set` on this store are written,
+    merged into what the file holds then, so several stores can share a
+    file, e.g. the pipelines built before and after a reload.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._data = None
+        self._changed = set()
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = self.load()
+        return self._data
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            log.warning('Ignoring unreadable state file {}: {}'.format(self.path, e))
+            return {}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        self.data[key] = value
+        self._changed.add(key)
+
+    def save(self) -> None:
+        data = self.load()
+        data.update({key: self.data[key] for key in self._changed})
+        self._changed.clear()
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = '{}.tmp'.format(self.path)
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def __str__(self) -> str:
+        return '{}({})'.format(type(self).__name__, self.path)
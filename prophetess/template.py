@@ -0,0 +1,187 @@
+"""Compiled YAMLTransformer specs
+
+A transform spec is a (possibly nested) mapping whose string leaves are
+`str.format` templates filled in from each extracted record. `Template`
+walks the spec once and turns it into a flat plan so rendering a record is
+a single loop, rather than a recursive walk that re-parses every template.
+"""
+
+import itertools
+import operator
+import string
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Tuple
+
+_formatter = string.Formatter()
+
+CONVERSIONS = (None, 'r', 's', 'a')
+
+# Kinds of operation in a compiled plan
+MAPPING = 0   # a nested mapping, which becomes the parent of later operations
+CONSTANT = 1  # a value which does not depend on the record
+FIELD = 2     # a template with a single record field
+FIELDS = 3    # a template with several record fields
+FORMAT = 4    # a template only str.format understands, rendered the slow way
+
+
+def format_string(template: str, values: Dict[str, Any]) -> str:
+    try:
+        return template.format(**values)
+    except (TypeError, KeyError):
+        return None
+
+
+def compile_leaf(value: Any) -> Tuple[int, Any]:
+    """Pre-parse one leaf of a transform spec into `(kind, template)`
+
+    Named fields are rewritten as positional ones, so a FIELD or FIELDS
+    template is a formatting function and a getter for the record values
+    it takes, in order.
+    """
+    if not isinstance(value, str):
+        return CONSTANT, value
+
+    try:
+        parsed = list(_formatter.parse(value))
+    except ValueError:
+        return FORMAT, value
+
+    chunks = []
+    names = []
+    for literal, name, spec, conversion in parsed:
+        chunks.append(literal.replace('{', '{{').replace('}', '}}'))
+        if name is None:
+            continue
+
+        if not name or name.isdigit() or '.' in name or '[' in name or '{' in spec or conversion not in CONVERSIONS:
+            # Positional or nested fields, attribute and index lookups,
+            # nested format specs and invalid conversions are left to str.format
+            return FORMAT, value
+
+        chunks.append('{{{}{}{}}}'.format(
+            len(names),
+            '!' + conversion if conversion else '',
+            ':' + spec if spec else '',
+        ))
+        names.append(name)
+
+    if not names:
+        return CONSTANT, ''.join(literal for literal, _, _, _ in parsed)
+
+    fmt = ''.join(chunks)
+    if len(names) > 1:
+        return FIELDS, (fmt.format, operator.itemgetter(*names), tuple(names))
+
+    # A bare '{name}' is the same as format(value), without parsing a template
+    return FIELD, (format if fmt == '{0}' else fmt.format, operator.itemgetter(names[0]), tuple(names))
+
+
+def columns_to_rows(columns: Mapping[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """Turn a batch of `{name: [values]}` columns into a list of records"""
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def render_column(fmt: Callable[..., str], columns: List[Sequence[Any]]) -> List[str]:
+    try:
+        return list(map(fmt, *columns))
+    except TypeError:
+        pass
+
+    # A value could not be formatted; redo the column one value at a time so
+    # only that value renders as None, as it would for a single record
+    rendered = []
+    for values in zip(*columns):
+        try:
+            rendered.append(fmt(*values))
+        except TypeError:
+            rendered.append(None)
+    return rendered
+
+
+def zip_mappings(keys: List[str], columns: List[List[Any]], length: int) -> List[Dict[str, Any]]:
+    if not keys:
+        return [{} for _ in range(length)]
+    return list(map(dict, map(zip, itertools.repeat(keys), zip(*columns))))
+
+
+class Template:
+    """A transform spec compiled into a flat list of operations
+
+    Each operation is `(parent, key, kind, template)`: the rendered value is
+    stored under `key` in the mapping numbered `parent`. The output mapping
+    is number 0 and every MAPPING operation adds the next number.
+    """
+
+    def __init__(self, spec: Mapping[str, Any]) -> None:
+        self.spec = spec
+        self.plan = []
+        self._mappings = 0
+        self._compile(spec, 0)
+
+    def _compile(self, spec: Mapping[str, Any], parent: int) -> None:
+        for key, value in spec.items():
+            if isinstance(value, Mapping):
+                self._mappings += 1
+                self.plan.append((parent, key, MAPPING, self._mappings))
+                self._compile(value, self._mappings)
+            else:
+                self.plan.append((parent, key) + compile_leaf(value))
+
+    def render(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        mappings = [{}]
+        for parent, key, kind, template in self.plan:
+            if kind == FIELD:
+                try:
+                    value = template[0](template[1](values))
+                except (TypeError, KeyError):
+                    value = None
+            elif kind == FIELDS:
+                try:
+                    value = template[0](*template[1](values))
+                except (TypeError, KeyError):
+                    value = None
+            elif kind == CONSTANT:
+                value = template
+            elif kind == MAPPING:
+                value = {}
+                mappings.append(value)
+            else:
+                value = format_string(template, values)
+            mappings[parent][key] = value
+
+        return mappings[0]
+
+    def render_columns(self, columns: Mapping[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+        """Render a batch of `{name: [values]}` columns into a list of records
+
+        Each template is applied to whole columns with `map`, so the
+        formatting loop runs in C rather than once per record in Python. The
+        records produced are the same as rendering each row on its own.
+        """
+        length = min((len(column) for column in columns.values()), default=0)
+        rows = None
+
+        # Walking the plan backwards renders every nested mapping's children
+        # before the mapping itself, which zips them up into a column of dicts
+        rendered = [([], []) for _ in range(self._mappings + 1)]
+        for parent, key, kind, template in reversed(self.plan):
+            if kind == FIELD or kind == FIELDS:
+                try:
+                    column = render_column(template[0], [columns[name] for name in template[2]])
+                except KeyError:
+                    column = [None] * length
+            elif kind == CONSTANT:
+                column = [template] * length
+            elif kind == MAPPING:
+                keys, values = rendered[template]
+                column = zip_mappings(keys[::-1], values[::-1], length)
+            else:
+                if rows is None:
+                    rows = columns_to_rows(columns)
+                column = [format_string(template, row) for row in rows]
+
+            rendered[parent][0].append(key)
+            rendered[parent][1].append(column)
+
+        keys, values = rendered[0]
+        return zip_mappings(keys[::-1], values[::-1], length)
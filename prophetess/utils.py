@@ -3,7 +3,9 @@ import logging
 from typing import Any, Dict
 
 from prophetess import config, plugin
-from prophetess.exceptions import InvalidPlugin
+from prophetess.exceptions import InvalidConfigurationException, InvalidPlugin
+from prophetess.executor import PooledTransformer
+from prophetess.retry import Retry
 
 log = logging.getLogger(__name__)
 
@@ -15,11 +17,36 @@ def build_plugin(plugin_type: str, plugin_id: str, plugin_config: Dict[str, Any]
     if module_name not in config.PLUGINS:
         raise InvalidPlugin(f'{plugin_name} not found, try `pip install prophetess-{module_name}`?')
 
-    name = plugin_config.get('class', '{}{}'.format(plugin_name, plugin_type))
-    plugin_class = getattr(config.PLUGINS.get(module_name), name)
+    try:
+        module = config.PLUGINS[module_name]
+    except ImportError as e:
+        raise InvalidPlugin(f'{plugin_name} could not be imported: {e}')
 
-    return plugin_class(
+    name = plugin_config.get('class', '{}{}'.format(plugin_name, plugin_type))
+    plugin_class = getattr(module, name)
+
+    executor = plugin_config.get('executor', 'inline')
+    if executor != 'inline':
+        if plugin_type != 'Transformer':
+            raise InvalidConfigurationException(f'{plugin_id}: only transformers can set an executor')
+
+        return PooledTransformer(
+            plugin_class,
+            id=plugin_id,
+            config=plugin_config.get('config'),
+            labels=(plugin_name, plugin_type, name),
+            executor=executor,
+            chunk_size=plugin_config.get('chunk_size', PooledTransformer.chunk_size),
+        )
+
+    instance = plugin_class(
         id=plugin_id,
         config=plugin_config.get('config'),
         labels=(plugin_name, plugin_type, name),
     )
+    if 'service' in plugin_config:
+        instance.service = plugin_config['service']
+    if 'retries' in plugin_config:
+        instance.retry = Retry.from_config(plugin_config['retries'])
+
+    return instance
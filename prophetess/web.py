@@ -1,9 +1,15 @@
+import asyncio
+import cProfile
+import io
 import logging
+import pstats
 
 from aiohttp import web
 from prometheus_client import core
 from prometheus_client.exposition import CONTENT_TYPE_LATEST, generate_latest
 
+from prophetess.metrics import slow_callbacks
+
 log = logging.getLogger(__name__)
 
 
@@ -12,3 +18,113 @@ class MetricsView(web.View):
         resp = web.Response(body=generate_latest(core.REGISTRY))
         resp.content_type = CONTENT_TYPE_LATEST
         return resp
+
+
+class CacheView(web.View):
+    """Cached extractor snapshots: GET their age, DELETE to invalidate
+
+    Without an extractor in the path every snapshot is affected. With one,
+    so are the snapshots of each of its partitions.
+    """
+
+    @property
+    def caches(self) -> dict:
+        caches = self.request.app['prophetess'].pipelines.caches
+        name = self.request.match_info.get('extractor')
+        if name is None:
+            return caches
+        matched = {key: cache for key, cache in caches.items() if key == name or cache.id == name}
+        if not matched:
+            raise web.HTTPNotFound(text='No cache for extractor {}\n'.format(name))
+        return matched
+
+    async def get(self) -> web.Response:
+        return web.json_response({
+            name: {'age': cache.age, 'records': len(cache.records) if cache.records is not None else None}
+            for name, cache in self.caches.items()
+        })
+
+    async def delete(self) -> web.Response:
+        caches = self.caches
+        for cache in caches.values():
+            cache.invalidate()
+        return web.Response(text='Invalidated {}\n'.format(', '.join(caches) or 'nothing'))
+
+
+class ReloadView(web.View):
+    """POST to reload the config, rebuilding the pipelines that changed"""
+
+    async def post(self) -> web.Response:
+        try:
+            changes = await self.request.app['reload']()
+        except Exception as e:
+            log.error('Not reloading: {!r}'.format(e))
+            raise web.HTTPBadRequest(text='{}: {}\n'.format(type(e).__name__, e))
+        return web.json_response(changes)
+
+
+class ProfileView(web.View):
+    """cProfile everything the event loop runs for `seconds` (default 10)
+
+    Results are sorted by `sort` (default cumulative) and cut to the first
+    `limit` (default 50) functions.
+    """
+    profiler = None
+
+    async def get(self) -> web.Response:
+        try:
+            seconds = float(self.request.query.get('seconds', 10))
+            limit = int(self.request.query.get('limit', 50))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text='{}\n'.format(e))
+        sort = self.request.query.get('sort', 'cumulative')
+
+        if ProfileView.profiler is not None:
+            raise web.HTTPConflict(text='A profile is already running\n')
+
+        profiler = ProfileView.profiler = cProfile.Profile()
+        log.info('Profiling the event loop for {}s'.format(seconds))
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+            ProfileView.profiler = None
+
+        out = io.StringIO()
+        try:
+            pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+        except KeyError:
+            raise web.HTTPBadRequest(text='Unknown sort key: {}\n'.format(sort))
+        return web.Response(text=out.getvalue())
+
+
+class TasksView(web.View):
+    """The stack of every task pending on the event loop"""
+
+    async def get(self) -> web.Response:
+        current = asyncio.current_task()
+        tasks = [t for t in asyncio.all_tasks() if t is not current and not t.done()]
+
+        out = io.StringIO()
+        out.write('{} pending tasks\n'.format(len(tasks)))
+        for task in tasks:
+            out.write('\n')
+            task.print_stack(file=out)
+        return web.Response(text=out.getvalue())
+
+
+class SlowCallbackHandler(logging.Handler):
+    """Counts the slow callbacks asyncio logs in debug mode"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if str(record.msg).startswith('Executing') and len(record.args or ()) == 2:
+            slow_callbacks.observe(record.args[1])
+
+
+def watch_slow_callbacks(loop: asyncio.AbstractEventLoop, threshold: float) -> None:
+    """Put `loop` in debug mode, exporting callbacks that run for longer than
+    `threshold` seconds to prophetess_slow_callback_seconds"""
+    loop.set_debug(True)
+    loop.slow_callback_duration = threshold
+    logging.getLogger('asyncio').addHandler(SlowCallbackHandler())
@@ -36,11 +36,17 @@ setup(
     packages=find_packages(),
     package_data={'': ['LICENSE']},
     package_dir={'prophetess': 'prophetess'},
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=[
         'aiohttp[speedups]',
+        'importlib-metadata; python_version < "3.8"',
         'PyYAML',
         'prometheus-client',
     ],
+    entry_points={
+        'console_scripts': [
+            'prophetess = prophetess.cli:main',
+        ],
+    },
     zip_safe=False,
 )
@@ -1,5 +1,9 @@
 
-from prophetess.plugin import PluginBase
+import asyncio
+import os
+
+from prophetess.exceptions import ServiceError
+from prophetess.plugin import Extractor, Loader, PluginBase, Transformer
 
 
 class FakePlugin(PluginBase):
@@ -27,3 +31,45 @@ class FakeTransformer(PluginBase):
 
     async def run(self):
         pass
+
+
+class UpperTransformer(Transformer):
+    """Upper cases every value and records which process did the work."""
+
+    async def run(self, data):
+        yield dict({k: v.upper() for k, v in data.items()}, pid=os.getpid())
+
+
+class ListExtractor(Extractor):
+    """Yields the records in its config, `delay` seconds apart."""
+
+    async def run(self):
+        for record in self.config.get('records', []):
+            await asyncio.sleep(self.config.get('delay', 0))
+            yield record
+
+
+class PartitionedListExtractor(ListExtractor):
+    """Yields the records in its config within its partition, by `id`."""
+
+    partitioned = True
+
+    async def run(self):
+        async for record in super().run():
+            if self.in_partition(record['id']):
+                yield record
+
+
+class RecordingLoader(Loader):
+    """Keeps every record it loads, failing those with a `fail` key."""
+
+    loaded = []
+    closed = False
+
+    async def close(self):
+        type(self).closed = True
+
+    async def run(self, record):
+        if record.get('fail'):
+            raise ServiceError('refused {}'.format(record['name']), status=400)
+        self.loaded.append(record)
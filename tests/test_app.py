@@ -1,11 +1,33 @@
 """Unit tests for the prophetess.app package."""
 
+import asyncio
 from unittest.mock import patch
 
 import asynctest
 import pytest
 
-from prophetess import app, exceptions, pipeline
+from prophetess import app, exceptions, pipeline, scheduler
+
+from . import fixtures
+
+CONFIG = {
+    'extractors': {
+        'sites': {'plugin': 'List', 'config': {'records': [{'Name': 'one'}]}},
+    },
+    'loaders': {
+        'tenants': {'plugin': 'Recording', 'config': {}},
+    },
+    'pipelines': {
+        'site-sync': {'extractors': ['sites'], 'loaders': ['tenants'], 'transform': {'name': '{Name}'}},
+        'rack-sync': {'extractors': ['sites'], 'loaders': ['tenants'], 'transform': {'rack': '{Name}'}},
+    },
+}
+
+
+@pytest.fixture
+def plugins():
+    with patch.dict('prophetess.config.PLUGINS', {'list': fixtures, 'recording': fixtures}):
+        yield
 
 
 class TestProphetess:
@@ -16,9 +38,11 @@ class TestProphetess:
 
         mage = app.Prophetess({'test': 'config'})
         assert mage.config == {'test': 'config'}
+        assert mage.concurrency == 10
+        assert mage.interval == 90
         assert mage.pipelines == ['pipeline']
 
-        bp_mock.assert_called_once_with({'test': 'config'})
+        bp_mock.assert_called_once_with({'test': 'config'}, None)
 
     @pytest.mark.asyncio
     @asynctest.patch('prophetess.pipeline.Pipelines.close')
@@ -64,3 +88,246 @@ class TestProphetess:
         await mage.run()
         p1.run.assert_called_once()
         p2.run.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_run_with_pipelines_concurrently(self):
+        started = asyncio.Event()
+
+        async def slow():
+            await started.wait()
+
+        async def fast():
+            started.set()
+
+        p1 = pipeline.Pipeline(id='p1', extractors=None, transform=None, loaders=None)
+        p2 = pipeline.Pipeline(id='p2', extractors=None, transform=None, loaders=None)
+        p1.run = asynctest.CoroutineMock(side_effect=slow)
+        p2.run = asynctest.CoroutineMock(side_effect=fast)
+
+        mage = app.Prophetess({})
+        mage.pipelines.append(p1)
+        mage.pipelines.append(p2)
+
+        # p1 can only finish once p2 has started, so this deadlocks if run serially
+        await asyncio.wait_for(mage.run(), timeout=1)
+        p1.run.assert_called_once()
+        p2.run.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_run_with_concurrency_limit(self):
+        running = []
+        peak = []
+
+        async def track():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0)
+            running.pop()
+
+        mage = app.Prophetess({'concurrency': 2})
+        for i in range(5):
+            p = pipeline.Pipeline(id='p{}'.format(i), extractors=None, transform=None, loaders=None)
+            p.run = asynctest.CoroutineMock(side_effect=track)
+            mage.pipelines.append(p)
+
+        await mage.run()
+        assert max(peak) == 2
+        assert len(peak) == 5
+
+    @pytest.mark.asyncio
+    async def test_run_with_pipelines_unexpected_error(self):
+        p1 = pipeline.Pipeline(id='p1', extractors=None, transform=None, loaders=None)
+        p2 = pipeline.Pipeline(id='p2', extractors=None, transform=None, loaders=None)
+        p1.run = asynctest.CoroutineMock(side_effect=ValueError)
+        p2.run = asynctest.CoroutineMock()
+
+        mage = app.Prophetess({})
+        mage.pipelines.append(p1)
+        mage.pipelines.append(p2)
+
+        with pytest.raises(ValueError):
+            await mage.run()
+        p1.run.assert_called_once()
+        p2.run.assert_called_once()
+
+    @pytest.mark.asyncio
+    @asynctest.patch('prophetess.app.Scheduler')
+    async def test_start(self, scheduler_mock):
+        scheduler_mock.return_value.run = asynctest.CoroutineMock()
+
+        mage = app.Prophetess({'interval': 30})
+        await mage.start()
+
+        scheduler_mock.assert_called_once_with(mage.pipelines, mage.run_pipeline, interval=30)
+        scheduler_mock.return_value.run.assert_awaited_once()
+        assert mage.scheduler is scheduler_mock.return_value
+
+
+@pytest.mark.asyncio
+class TestShutdown:
+
+    def prophetess(self, run):
+        mage = app.Prophetess({'pipelines': {}})
+        p = pipeline.Pipeline(id='p1', extractors=[], transform=None, loaders=[], interval=0.01)
+        p.run = asynctest.CoroutineMock(side_effect=run)
+        p.close = asynctest.CoroutineMock()
+        mage.pipelines.append(p)
+        return mage, p
+
+    async def test_shutdown(self):
+        finished = []
+
+        async def run():
+            await asyncio.sleep(0.05)
+            finished.append(True)
+
+        mage, p = self.prophetess(run)
+        start = asyncio.ensure_future(mage.start())
+        await asyncio.sleep(0.02)
+
+        await mage.shutdown(timeout=1)
+        assert finished == [True]
+        p.close.assert_awaited_once()
+        await asyncio.wait_for(start, 1)
+
+    async def test_shutdown_deadline(self, caplog):
+        cancelled = []
+
+        async def run():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        mage, p = self.prophetess(run)
+        start = asyncio.ensure_future(mage.start())
+        await asyncio.sleep(0.02)
+
+        await asyncio.wait_for(mage.shutdown(timeout=0.05), 1)
+        assert cancelled == [True]
+        assert 'Cancelling 1 runs still in progress after 0.05s' in caplog.text
+        p.close.assert_awaited_once()
+        await asyncio.wait_for(start, 1)
+
+    async def test_stopping(self):
+        mage, p = self.prophetess(None)
+        mage.stopping = True
+
+        await mage.run_pipeline(p)
+        p.run.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures('plugins')
+class TestReload:
+
+    def config(self, **pipelines):
+        return dict(CONFIG, pipelines=dict(CONFIG['pipelines'], **pipelines))
+
+    async def test_reload(self):
+        base = dict(self.config(**{
+            'rack-sync': {'extractors': ['racks'], 'loaders': ['tenants'], 'transform': {'rack': '{Name}'}},
+        }), extractors=dict(CONFIG['extractors'], racks={'plugin': 'List', 'config': {'records': []}}))
+        mage = app.Prophetess(base)
+        mage.scheduler = asynctest.MagicMock()
+        site_sync, rack_sync = mage.pipelines['site-sync'], mage.pipelines['rack-sync']
+        rack_sync.close = asynctest.CoroutineMock()
+
+        cfg = dict(base, pipelines=dict(base['pipelines'], **{
+            'rack-sync': {'extractors': ['racks'], 'loaders': ['tenants'], 'transform': {'rack': '{Name}!'}},
+            'device-sync': {'extractors': ['racks'], 'loaders': ['tenants'], 'transform': {'name': '{Name}'}},
+        }))
+        changes = await mage.reload(cfg)
+
+        assert changes == {
+            'added': ['device-sync'], 'changed': ['rack-sync'], 'removed': [], 'unchanged': ['site-sync'],
+        }
+        assert mage.config is cfg
+        assert list(mage.pipelines) == ['site-sync', 'rack-sync', 'device-sync']
+        assert mage.pipelines['site-sync'] is site_sync
+        assert mage.pipelines['rack-sync'] is not rack_sync
+
+        mage.scheduler.remove.assert_called_once_with('rack-sync')
+        mage.scheduler.add.assert_called_once_with(mage.pipelines['device-sync'])
+
+        # the replacement is only scheduled once the old pipeline has closed
+        await asyncio.gather(*mage.retiring)
+        rack_sync.close.assert_awaited_once()
+        mage.scheduler.add.assert_called_with(mage.pipelines['rack-sync'])
+
+    async def test_reload_shared_cache(self):
+        cfg = dict(CONFIG, extractors={'sites': dict(CONFIG['extractors']['sites'], cache={'ttl': 600})})
+        mage = app.Prophetess(cfg)
+        old = mage.pipelines.caches['sites']
+
+        changes = await mage.reload(dict(cfg, pipelines=dict(cfg['pipelines'], **{
+            'rack-sync': {'extractors': ['sites'], 'loaders': ['tenants'], 'transform': {'rack': '{Name}!'}},
+        })))
+
+        # site-sync is rebuilt too, so both keep sharing one cached extraction
+        assert changes['changed'] == ['site-sync', 'rack-sync']
+        shared = mage.pipelines['site-sync'].extractors[0]
+        assert mage.pipelines['rack-sync'].extractors[0] is shared
+        assert mage.pipelines.caches == {'sites': shared.extractor}
+        assert shared.extractor is not old
+
+        # the retired pipelines' cache is dropped along with them
+        await mage.reload(dict(cfg, pipelines={}))
+        assert mage.pipelines.caches == {}
+        await mage.close()
+
+    async def test_reload_interval(self):
+        mage = app.Prophetess(dict(CONFIG, interval=90))
+        mage.scheduler = scheduler.Scheduler(mage.pipelines, asynctest.CoroutineMock(), interval=90)
+
+        await mage.reload(dict(CONFIG, interval=10))
+        await asyncio.gather(*mage.retiring)
+
+        assert mage.interval == 10
+        assert mage.scheduler.interval == 10
+        assert mage.scheduler.triggers['site-sync'].interval == 10
+
+    async def test_reload_removed(self):
+        mage = app.Prophetess(CONFIG)
+        rack_sync = mage.pipelines['rack-sync']
+        rack_sync.close = asynctest.CoroutineMock()
+
+        changes = await mage.reload(dict(CONFIG, pipelines={'site-sync': CONFIG['pipelines']['site-sync']}))
+        assert changes['removed'] == ['rack-sync']
+        assert list(mage.pipelines) == ['site-sync']
+
+        await mage.close()
+        rack_sync.close.assert_awaited_once()
+
+    async def test_reload_drains(self):
+        mage = app.Prophetess(CONFIG)
+        site_sync = mage.pipelines['site-sync']
+        site_sync.close = asynctest.CoroutineMock()
+
+        async with site_sync.semaphore:
+            await mage.reload(self.config(**{'site-sync': dict(CONFIG['pipelines']['site-sync'], batch_size=10)}))
+            await asyncio.sleep(0.01)
+            site_sync.close.assert_not_awaited()
+
+        await asyncio.gather(*mage.retiring)
+        site_sync.close.assert_awaited_once()
+
+    async def test_reload_invalid(self):
+        mage = app.Prophetess(CONFIG)
+        pipelines = mage.pipelines
+
+        with pytest.raises(exceptions.InvalidConfigurationException):
+            await mage.reload(self.config(**{
+                'site-sync': dict(CONFIG['pipelines']['site-sync'], schedule='never'),
+            }))
+
+        assert mage.pipelines is pipelines
+        assert mage.config is CONFIG
+        assert not mage.retiring
+
+    async def test_reload_restart_required(self, caplog):
+        mage = app.Prophetess(CONFIG)
+        await mage.reload(dict(CONFIG, concurrency=2))
+
+        assert 'Changes to concurrency only apply after a restart' in caplog.text
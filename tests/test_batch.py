@@ -0,0 +1,74 @@
+"""Unit tests for the prophetess.batch package."""
+
+import asyncio
+
+import asynctest
+import pytest
+
+from prophetess import batch
+
+
+@pytest.mark.asyncio
+class TestBatch:
+
+    async def test_flush_on_size(self):
+        handler = asynctest.CoroutineMock()
+        b = batch.Batch(handler, size=2)
+
+        await b.add({'id': 1})
+        handler.assert_not_awaited()
+        assert len(b) == 1
+
+        await b.add({'id': 2})
+        handler.assert_awaited_once_with([{'id': 1}, {'id': 2}])
+        assert len(b) == 0
+
+    async def test_flush_on_interval(self):
+        handler = asynctest.CoroutineMock()
+        b = batch.Batch(handler, size=100, interval=0.01)
+
+        await b.add({'id': 1})
+        await b.add({'id': 2})
+        handler.assert_not_awaited()
+
+        await asyncio.sleep(0.05)
+        handler.assert_awaited_once_with([{'id': 1}, {'id': 2}])
+        assert b._timer is None
+
+    async def test_flush(self):
+        handler = asynctest.CoroutineMock()
+        b = batch.Batch(handler, size=100, interval=10)
+
+        await b.add({'id': 1})
+        timer = b._timer
+        await b.flush()
+
+        handler.assert_awaited_once_with([{'id': 1}])
+        assert b._timer is None
+        await asyncio.sleep(0)
+        assert timer.cancelled()
+
+    async def test_flush_waits_for_interval(self):
+        loading = asyncio.Event()
+        loaded = asyncio.Event()
+
+        async def handler(records):
+            loading.set()
+            await asyncio.sleep(0.05)
+            loaded.set()
+
+        b = batch.Batch(handler, size=100, interval=0.01)
+        await b.add({'id': 1})
+        await loading.wait()
+
+        # the timer's flush is still loading, flush waits for it
+        await b.flush()
+        assert loaded.is_set()
+        assert not b._flushing
+
+    async def test_flush_empty(self):
+        handler = asynctest.CoroutineMock()
+        b = batch.Batch(handler, size=100)
+
+        await b.flush()
+        handler.assert_not_awaited()
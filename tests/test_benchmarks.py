@@ -0,0 +1,27 @@
+"""Smoke tests for the benchmarks suite."""
+
+import json
+import subprocess
+import sys
+
+
+def test_suite(tmp_path):
+    output = tmp_path / 'results.json'
+    subprocess.run(
+        [sys.executable, '-m', 'benchmarks.suite', '--records', '300', '--builds', '5',
+         '--error-rate', '0.5', '--output', str(output)],
+        check=True, stderr=subprocess.PIPE,
+    )
+
+    results = json.loads(output.read_text())
+    assert results['parameters']['records'] == 300
+
+    run = results['results']['pipeline_run']
+    assert run['loaded'] + run['failed'] == 300
+    assert run['failed'] > 0
+    assert run['records_per_second'] > 0
+    assert 0 < run['load_p50'] <= run['load_p99']
+    assert run['peak_memory'] > 0
+
+    assert results['results']['transformer_parse']['records'] == 300
+    assert results['results']['build_pipelines']['builds'] == 5
@@ -0,0 +1,37 @@
+"""Unit tests for the prophetess.budget package."""
+
+import asyncio
+
+import pytest
+
+from prophetess import budget
+
+
+@pytest.mark.asyncio
+class TestBudget:
+
+    async def test_unlimited(self):
+        b = budget.Budget()
+
+        assert await b.acquire(1000) == 1000
+        assert len(b) == 1000
+        await b.release(1000)
+        assert len(b) == 0
+
+    async def test_waits_for_release(self):
+        b = budget.Budget(2)
+        await b.acquire(2)
+
+        waiter = asyncio.ensure_future(b.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        await b.release()
+        assert await waiter == 1
+        assert len(b) == 2
+
+    async def test_clamped(self):
+        b = budget.Budget(3)
+
+        assert await b.acquire(10) == 3
+        assert len(b) == 3
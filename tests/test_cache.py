@@ -0,0 +1,239 @@
+"""Unit tests for the prophetess.cache package."""
+
+import asyncio
+from unittest.mock import patch
+
+import asynctest
+import pytest
+from prometheus_client import REGISTRY
+
+from prophetess import cache, plugin
+
+from .fixtures import ListExtractor
+
+
+def loader(pk=None):
+    return plugin.Loader(id='test-loader', config={'pk': pk} if pk else {})
+
+
+class TestChangeCache:
+
+    def test_digest(self):
+        assert cache.ChangeCache.digest({'a': 1, 'b': 2}) == cache.ChangeCache.digest({'b': 2, 'a': 1})
+        assert cache.ChangeCache.digest({'a': 1}) != cache.ChangeCache.digest({'a': 2})
+
+    def test_fingerprint_pk(self):
+        c = cache.ChangeCache()
+        key, digest = c.fingerprint('pipe', loader(['slug']), {'slug': 'a', 'name': 'A'})
+        key2, digest2 = c.fingerprint('pipe', loader(['slug']), {'slug': 'a', 'name': 'B'})
+
+        assert key == key2 == '["pipe", "test-loader", ["a"]]'
+        assert digest != digest2
+
+    def test_fingerprint_pk_str(self):
+        c = cache.ChangeCache()
+        key, _ = c.fingerprint('pipe', loader('slug'), {'slug': 'a'})
+        assert key == '["pipe", "test-loader", ["a"]]'
+
+    def test_fingerprint_no_pk(self):
+        c = cache.ChangeCache()
+        key, digest = c.fingerprint('pipe', loader(), {'slug': 'a'})
+        assert key == '["pipe", "test-loader", "{}"]'.format(digest)
+
+    def test_unchanged(self):
+        c = cache.ChangeCache()
+        assert not c.unchanged('key', 'digest')
+
+        c.update('key', 'digest')
+        assert c.unchanged('key', 'digest')
+        assert not c.unchanged('key', 'other')
+
+    def test_lru(self):
+        c = cache.ChangeCache(max_size=2)
+        c.update('a', '1')
+        c.update('b', '2')
+        assert c.unchanged('a', '1')
+
+        c.update('c', '3')
+        assert len(c) == 2
+        assert c.unchanged('a', '1')
+        assert not c.unchanged('b', '2')
+
+    @patch('time.time')
+    def test_refresh(self, time_mock):
+        time_mock.return_value = 1000
+        c = cache.ChangeCache(refresh_interval=60)
+        c.update('a', '1')
+
+        time_mock.return_value = 1059
+        assert c.unchanged('a', '1')
+
+        time_mock.return_value = 1060
+        assert not c.unchanged('a', '1')
+        assert len(c) == 0
+        assert c.refreshed == 1060
+
+    def test_persist(self, tmp_path):
+        path = str(tmp_path / 'changes.json')
+        c = cache.ChangeCache(path=path)
+        c.update('a', '1')
+        c.update('b', '2')
+        c.save()
+
+        restored = cache.ChangeCache(path=path, max_size=1)
+        assert restored.refreshed == c.refreshed
+        assert list(restored.entries.items()) == [('b', '2')]
+
+    def test_persist_corrupt(self, tmp_path):
+        path = tmp_path / 'changes.json'
+        path.write_text('nope')
+
+        assert len(cache.ChangeCache(path=str(path))) == 0
+
+    def test_save_no_path(self):
+        cache.ChangeCache().save()
+
+
+def cache_hits(state):
+    return REGISTRY.get_sample_value(
+        'prophetess_extract_cache_hits_total', {'extractor': 'test-extractor', 'state': state},
+    ) or 0
+
+
+def cached(records=({'id': 1}, {'id': 2}), **kwargs):
+    e = ListExtractor(id='test-extractor', config={'records': list(records)})
+    e.run = asynctest.MagicMock(side_effect=e.run)
+    return cache.CachedExtractor(e, **dict({'ttl': 60}, **kwargs))
+
+
+async def extract(c, **kwargs):
+    return [r async for r in c.run(**kwargs)]
+
+
+@pytest.mark.asyncio
+class TestCachedExtractor:
+
+    async def test_delegates(self):
+        c = cached()
+        assert c.id == 'test-extractor'
+        assert not c.columnar
+        assert c.age is None
+        assert str(c) == 'CachedExtractor(test-extractor)'
+
+    @patch('time.time')
+    async def test_fresh(self, time_mock):
+        time_mock.return_value = 1000
+        c = cached()
+        hits = cache_hits('fresh')
+
+        assert await extract(c) == [{'id': 1}, {'id': 2}]
+        time_mock.return_value = 1059
+        assert await extract(c) == [{'id': 1}, {'id': 2}]
+
+        assert c.extractor.run.call_count == 1
+        assert cache_hits('fresh') - hits == 1
+        assert REGISTRY.get_sample_value('prophetess_extract_cache_age_seconds', {'extractor': 'test-extractor'}) == 59
+
+    @patch('time.time')
+    async def test_expired(self, time_mock):
+        time_mock.return_value = 1000
+        c = cached()
+        await extract(c)
+
+        time_mock.return_value = 1060
+        await extract(c)
+        assert c.extractor.run.call_count == 2
+        assert c.taken == 1060
+
+    @patch('time.time')
+    async def test_stale_while_revalidate(self, time_mock):
+        time_mock.return_value = 1000
+        c = cached(stale_while_revalidate=60)
+        await extract(c)
+        c.extractor.config['records'] = [{'id': 3}]
+
+        time_mock.return_value = 1100
+        hits = cache_hits('stale')
+        assert await extract(c) == [{'id': 1}, {'id': 2}]
+        assert cache_hits('stale') - hits == 1
+
+        await c.refresh
+        assert c.taken == 1100
+        assert await extract(c) == [{'id': 3}]
+        assert c.extractor.run.call_count == 2
+
+    @patch('time.time')
+    async def test_revalidate_error(self, time_mock):
+        time_mock.return_value = 1000
+        c = cached(stale_while_revalidate=60)
+        await extract(c)
+
+        c.extractor.run.side_effect = ValueError('boom')
+        time_mock.return_value = 1100
+        assert await extract(c) == [{'id': 1}, {'id': 2}]
+        await c.refresh
+        assert c.taken == 1000
+
+    async def test_max_records(self):
+        c = cached(max_records=1)
+
+        assert await extract(c) == [{'id': 1}, {'id': 2}]
+        assert c.records is None
+        await extract(c)
+        assert c.extractor.run.call_count == 2
+
+    async def test_incremental(self):
+        c = cached()
+        c.extractor.incremental = True
+
+        await extract(c)
+        await extract(c)
+        assert c.extractor.run.call_count == 2
+        assert c.records is None
+
+    async def test_invalidate(self):
+        c = cached()
+        await extract(c)
+
+        c.invalidate()
+        assert c.records is None
+        await extract(c)
+        assert c.extractor.run.call_count == 2
+
+    async def test_invalidate_during_refresh(self):
+        c = cached()
+        records = c.run()
+        assert await records.__anext__() == {'id': 1}
+
+        c.invalidate()
+        assert [r async for r in records] == [{'id': 2}]
+        assert c.records is None
+
+    async def test_persist(self, tmp_path):
+        path = str(tmp_path / 'cache' / 'test-extractor.json')
+        c = cached(path=path)
+        await extract(c)
+
+        restored = cached(records=(), path=path)
+        assert restored.taken == c.taken
+        assert await extract(restored) == [{'id': 1}, {'id': 2}]
+        assert restored.extractor.run.call_count == 0
+
+        restored.invalidate()
+        restored.invalidate()
+        assert cached(path=path).records is None
+
+    async def test_persist_corrupt(self, tmp_path):
+        path = tmp_path / 'test-extractor.json'
+        path.write_text('{')
+        assert cached(path=str(path)).records is None
+
+    async def test_close(self):
+        c = cached()
+        c.extractor.close = asynctest.CoroutineMock()
+        c.refresh = asyncio.ensure_future(asyncio.sleep(10))
+
+        await c.close()
+        await asyncio.sleep(0)
+        assert c.refresh.cancelled()
+        c.extractor.close.assert_awaited_once()
@@ -0,0 +1,199 @@
+"""Unit tests for the prophetess.cli package."""
+
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+import yaml
+
+from prophetess import cli
+from prophetess.app import Prophetess
+
+from . import fixtures
+
+CONFIG = {
+    'extractors': {
+        'accounts': {
+            'plugin': 'List',
+            'config': {'records': [
+                {'Name': 'one', 'Fail': ''},
+                {'Name': 'two', 'Fail': ''},
+                {'Name': 'bad', 'Fail': 'yes'},
+            ]},
+        },
+    },
+    'loaders': {
+        'tenants': {'plugin': 'Recording', 'config': {}},
+    },
+    'pipelines': {
+        'account-sync': {
+            'extractors': ['accounts'],
+            'loaders': ['tenants'],
+            'transform': {'name': '{Name}', 'fail': '{Fail}'},
+        },
+        'good-sync': {
+            'extractors': ['accounts'],
+            'loaders': ['tenants'],
+            'transform': {'name': '{Name}'},
+            'schedule': '*/5 * * * *',
+        },
+    },
+}
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    def write(cfg):
+        path = tmp_path / 'pipeline.yaml'
+        path.write_text(yaml.safe_dump(cfg))
+        return str(path)
+    return write
+
+
+@pytest.fixture(autouse=True)
+def plugins():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    fixtures.RecordingLoader.loaded = []
+
+    with patch.dict('prophetess.config.PLUGINS', {'list': fixtures, 'recording': fixtures}):
+        yield
+    loop.close()
+
+
+def test_parser_default_serve():
+    args = cli.parser().parse_args([])
+    assert args.command is cli.serve
+    assert args.config == cli.CONFIG_FILE
+
+
+def test_run_once(config_file):
+    status = cli.main(['-c', config_file(CONFIG), 'run', '--once'])
+
+    assert status == cli.EXIT_FAILED
+    assert len(fixtures.RecordingLoader.loaded) == 5
+
+
+def test_run_selected_pipeline(config_file, caplog):
+    status = cli.main(['-c', config_file(CONFIG), 'run', '--once', '--pipeline', 'good-sync'])
+
+    assert status == cli.EXIT_OK
+    assert [r['name'] for r in fixtures.RecordingLoader.loaded] == ['one', 'two', 'bad']
+    assert 'account-sync' not in caplog.text
+
+
+def test_run_failed_loads(config_file, caplog):
+    caplog.set_level(logging.INFO)
+    status = cli.main(['-c', config_file(CONFIG), 'run', '--once', '--pipeline', 'account-sync'])
+
+    assert status == cli.EXIT_FAILED
+    assert [r['name'] for r in fixtures.RecordingLoader.loaded] == ['one', 'two']
+    assert 'account-sync: 3 extracted, 3 transformed, 2 loaded, 0 skipped, 1 failed' in caplog.text
+
+
+def test_run_unknown_pipeline(config_file):
+    status = cli.main(['-c', config_file(CONFIG), 'run', '--once', '--pipeline', 'nope'])
+
+    assert status == cli.EXIT_CONFIG
+    assert fixtures.RecordingLoader.loaded == []
+
+
+def test_run_dry_run(config_file, caplog):
+    caplog.set_level(logging.INFO)
+    status = cli.main(['-c', config_file(CONFIG), 'run', '--once', '--dry-run', '-p', 'account-sync'])
+
+    assert status == cli.EXIT_OK
+    assert fixtures.RecordingLoader.loaded == []
+    assert 'account-sync: 3 extracted, 3 transformed, 0 loaded' in caplog.text
+
+
+def test_validate(config_file):
+    assert cli.main(['-c', config_file(CONFIG), 'validate']) == cli.EXIT_OK
+
+
+@pytest.mark.parametrize('pipeline,problem', [
+    ({'extractors': ['missing'], 'loaders': ['tenants'], 'transform': {}}, 'extractor missing is not defined'),
+    ({'extractors': ['accounts'], 'loaders': ['tenants'], 'transform': 'Missing'}, 'transformer Missing'),
+    ({'extractors': ['accounts'], 'loaders': ['tenants'], 'transform': 5}, 'transform must be'),
+    ({'extractors': ['accounts'], 'loaders': ['tenants'], 'transform': {}, 'schedule': '* *'}, 'Invalid schedule'),
+])
+def test_validate_invalid(config_file, caplog, pipeline, problem):
+    cfg = dict(CONFIG, pipelines={'broken': pipeline})
+
+    assert cli.main(['-c', config_file(cfg), 'validate']) == cli.EXIT_CONFIG
+    assert problem in caplog.text
+
+
+def test_validate_unknown_plugin(config_file, caplog):
+    cfg = dict(CONFIG, loaders={'tenants': {'plugin': 'Netbox', 'config': {}}})
+
+    assert cli.main(['-c', config_file(cfg), 'validate']) == cli.EXIT_CONFIG
+    assert 'Netbox not found' in caplog.text
+
+
+def test_missing_config(tmp_path):
+    assert cli.main(['-c', str(tmp_path / 'missing.yaml'), 'validate']) == cli.EXIT_CONFIG
+
+
+def test_run_sigterm(config_file, tmp_path):
+    path = config_file({'pipelines': {}})
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'prophetess', '-c', path, 'run'],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        env=dict(os.environ, PROPHETESS_STATE_DIR=str(tmp_path)),
+    )
+
+    # wait for the scheduler to start before asking it to stop
+    for line in proc.stdout:
+        if b'Starting Control process' in line:
+            break
+    proc.send_signal(signal.SIGTERM)
+    out, _ = proc.communicate(timeout=30)
+
+    assert proc.returncode == cli.EXIT_OK
+    assert b'Received SIGTERM, shutting down' in out
+
+
+def test_run_sigterm_drains(config_file, caplog):
+    caplog.set_level(logging.INFO)
+    fixtures.RecordingLoader.closed = False
+    path = config_file({
+        'extractors': {
+            'slow': {'plugin': 'List', 'config': {'delay': 0.1, 'records': [{'Name': n} for n in 'abc']}},
+        },
+        'loaders': {'tenants': {'plugin': 'Recording', 'config': {}}},
+        'pipelines': {'slow-sync': {'extractors': ['slow'], 'loaders': ['tenants'], 'transform': {'name': '{Name}'}}},
+    })
+
+    # SIGTERM arrives while the first record is being extracted
+    asyncio.get_event_loop().call_later(0.05, os.kill, os.getpid(), signal.SIGTERM)
+    status = cli.main(['-c', path, 'run'])
+
+    assert status == cli.EXIT_OK
+    assert [r['name'] for r in fixtures.RecordingLoader.loaded] == ['a', 'b', 'c']
+    assert fixtures.RecordingLoader.closed
+    assert 'Received SIGTERM' in caplog.text
+
+
+def test_shutdown(caplog):
+    loop = asyncio.get_event_loop()
+    mage = Prophetess({})
+
+    async def broken():
+        raise ValueError('boom')
+
+    async def forever():
+        await asyncio.sleep(10)
+
+    tasks = [asyncio.ensure_future(broken()), asyncio.ensure_future(forever())]
+    with patch.object(mage, 'shutdown', wraps=mage.shutdown) as shutdown_mock:
+        cli.shutdown(loop, mage, *tasks)
+
+    shutdown_mock.assert_called_once_with(cli.SHUTDOWN_TIMEOUT)
+    assert tasks[1].cancelled()
+    assert "Stopped after an error: ValueError('boom')" in caplog.text
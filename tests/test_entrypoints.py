@@ -0,0 +1,87 @@
+"""Unit tests for the prophetess.entrypoints package."""
+
+from unittest.mock import patch
+
+import pytest
+
+from prophetess import entrypoints, exceptions, utils
+from prophetess.entrypoints import metadata
+
+from . import fixtures
+
+ENTRY_POINTS = {
+    'prophetess.plugins': (
+        metadata.EntryPoint('fake', 'tests.fixtures', 'prophetess.plugins'),
+        metadata.EntryPoint('broken', 'tests.not_a_module', 'prophetess.plugins'),
+    ),
+    'console_scripts': (
+        metadata.EntryPoint('other', 'tests.other', 'console_scripts'),
+    ),
+}
+
+
+@patch('prophetess.entrypoints.metadata.entry_points', return_value=ENTRY_POINTS)
+class TestLazyPlugins:
+
+    def test_index_cached(self, entry_points_mock):
+        plugins = entrypoints.LazyPlugins('prophetess.plugins')
+        entry_points_mock.assert_not_called()
+
+        assert sorted(plugins) == ['broken', 'fake']
+        assert 'fake' in plugins
+        assert 'other' not in plugins
+        assert len(plugins) == 2
+        entry_points_mock.assert_called_once()
+
+    def test_loaded_when_used(self, entry_points_mock):
+        plugins = entrypoints.LazyPlugins('prophetess.plugins')
+
+        with patch.object(metadata.EntryPoint, 'load', return_value=fixtures) as load_mock:
+            assert 'fake' in plugins
+            load_mock.assert_not_called()
+
+            assert plugins['fake'] is fixtures
+            assert plugins.get('fake') is fixtures
+            load_mock.assert_called_once()
+
+    def test_missing(self, entry_points_mock):
+        plugins = entrypoints.LazyPlugins('prophetess.plugins')
+
+        assert plugins.get('missing') is None
+        with pytest.raises(KeyError):
+            plugins['missing']
+
+    def test_import_error(self, entry_points_mock):
+        plugins = entrypoints.LazyPlugins('prophetess.plugins')
+
+        with pytest.raises(ImportError):
+            plugins['broken']
+
+    def test_patch_dict(self, entry_points_mock):
+        plugins = entrypoints.LazyPlugins('prophetess.plugins')
+
+        # Patching must not import the plugins it saves and restores
+        with patch.dict(plugins, {'upper': fixtures}):
+            assert plugins['upper'] is fixtures
+        assert 'upper' not in plugins
+        assert isinstance(plugins.copy()['broken'], metadata.EntryPoint)
+
+    def test_select(self, entry_points_mock):
+        class EntryPoints(tuple):
+            def select(self, group):
+                return [ep for ep in self if ep.group == group]
+
+        entry_points_mock.return_value = EntryPoints(
+            ENTRY_POINTS['prophetess.plugins'] + ENTRY_POINTS['console_scripts'])
+        plugins = entrypoints.LazyPlugins('prophetess.plugins')
+
+        assert sorted(plugins) == ['broken', 'fake']
+
+
+def test_build_plugin_import_error():
+    plugins = entrypoints.LazyPlugins('prophetess.plugins')
+
+    with patch('prophetess.entrypoints.metadata.entry_points', return_value=ENTRY_POINTS), \
+            patch('prophetess.config.PLUGINS', plugins):
+        with pytest.raises(exceptions.InvalidPlugin):
+            utils.build_plugin('Loader', 'test-loader', {'plugin': 'Broken'})
@@ -0,0 +1,132 @@
+"""Unit tests for the prophetess.executor package."""
+
+import concurrent.futures
+import os
+from unittest.mock import patch
+
+import pytest
+
+from prophetess import exceptions, executor, pipeline, plugin, utils
+
+from . import fixtures
+from .fixtures import UpperTransformer
+
+
+@pytest.fixture(autouse=True)
+def pools():
+    yield
+    executor.shutdown()
+
+
+def in_thread(fn, *args):
+    # transform_many sets an event loop for the thread it runs in
+    with concurrent.futures.ThreadPoolExecutor() as pool:
+        return pool.submit(fn, *args).result()
+
+
+def test_transform_many():
+    t = UpperTransformer(id='test-transformer', config={})
+    results = in_thread(executor.transform_many, t, [{'a': 'x'}, {'a': 'y'}])
+
+    assert results == [[{'a': 'X', 'pid': os.getpid()}], [{'a': 'Y', 'pid': os.getpid()}]]
+
+
+def test_transform_many_spec():
+    results = in_thread(executor.transform_many, (UpperTransformer, 'test-transformer', {}, None), [{'a': 'x'}])
+    assert results == [[{'a': 'X', 'pid': os.getpid()}]]
+    assert isinstance(executor._plugins[(UpperTransformer, 'test-transformer')][1], UpperTransformer)
+
+
+def test_transform_many_spec_config_changed():
+    spec = (plugin.Transformer, 'test-tagged', {'tag': 'old'}, None)
+    assert in_thread(executor.transform_many, spec, [{}]) == [[{'tag': 'old'}]]
+
+    # as after a reload changed the transformer's config
+    spec = (plugin.Transformer, 'test-tagged', {'tag': 'new'}, None)
+    assert in_thread(executor.transform_many, spec, [{}]) == [[{'tag': 'new'}]]
+
+
+def test_get_pool():
+    pool = executor.get_pool('thread')
+    assert executor.get_pool('thread') is pool
+
+    executor.shutdown()
+    assert executor._pools == {}
+
+
+@pytest.mark.asyncio
+class TestPooledTransformer:
+
+    async def test_init_invalid_executor(self):
+        with pytest.raises(exceptions.InvalidConfigurationException):
+            executor.PooledTransformer(UpperTransformer, id='test-transformer', config={}, executor='inline')
+
+    async def test_run_thread(self):
+        t = executor.PooledTransformer(UpperTransformer, id='test-transformer', config={}, executor='thread')
+        assert t.chunk_size == 100
+        assert isinstance(t.transformer, UpperTransformer)
+
+        vals = [p async for p in t.run({'a': 'x'})]
+        assert vals == [{'a': 'X', 'pid': os.getpid()}]
+
+    async def test_run_many_process(self):
+        t = executor.PooledTransformer(
+            UpperTransformer, id='test-transformer', config={}, executor='process', chunk_size=10,
+        )
+        assert t.chunk_size == 10
+
+        results = await t.run_many([{'a': str(i)} for i in range(20)] + [{'a': 'z'}])
+        assert [r[0]['a'] for r in results] == [str(i) for i in range(20)] + ['Z']
+        assert all(r[0]['pid'] != os.getpid() for r in results)
+
+
+class TestBuildPlugin:
+
+    @patch.dict('prophetess.config.PLUGINS', {'upper': fixtures})
+    def test_executor(self):
+        t = utils.build_plugin('Transformer', 'test-transformer', {
+            'plugin': 'Upper',
+            'executor': 'thread',
+            'chunk_size': 5,
+            'config': {},
+        })
+
+        assert isinstance(t, executor.PooledTransformer)
+        assert isinstance(t.transformer, UpperTransformer)
+        assert t.executor == 'thread'
+        assert t.chunk_size == 5
+
+    @patch.dict('prophetess.config.PLUGINS', {'upper': fixtures})
+    def test_inline(self):
+        t = utils.build_plugin('Transformer', 'test-transformer', {'plugin': 'Upper', 'config': {}})
+        assert isinstance(t, UpperTransformer)
+
+    @patch.dict('prophetess.config.PLUGINS', {'upper': fixtures})
+    def test_executor_not_transformer(self):
+        with pytest.raises(exceptions.InvalidConfigurationException):
+            utils.build_plugin('Loader', 'test-loader', {
+                'plugin': 'Upper',
+                'class': 'FakeLoader',
+                'executor': 'thread',
+                'config': {},
+            })
+
+
+@pytest.mark.asyncio
+async def test_pipeline_chunks():
+    class Extractor(plugin.Extractor):
+        async def run(self):
+            for i in range(5):
+                yield {'a': str(i)}
+
+    t = executor.PooledTransformer(UpperTransformer, id='test-transformer', config={}, executor='thread', chunk_size=2)
+    p = pipeline.Pipeline(id='test', extractors=[Extractor(id='test-extractor', config={})], transform=t, loaders=[])
+
+    loaded = []
+
+    async def load(record):
+        loaded.append(record['a'])
+
+    p.load = load
+    await p.run()
+    assert loaded == ['0', '1', '2', '3', '4']
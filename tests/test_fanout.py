@@ -0,0 +1,199 @@
+"""Unit tests for the prophetess.fanout package."""
+
+import asyncio
+
+import asynctest
+import pytest
+from prometheus_client import REGISTRY
+
+from prophetess import fanout, plugin
+
+from .fixtures import ListExtractor
+
+
+def records(n):
+    return [{'id': i} for i in range(n)]
+
+
+def spilled(extractor_id):
+    return REGISTRY.get_sample_value('prophetess_fan_out_spilled_records_total', {'extractor': extractor_id}) or 0
+
+
+class CountingExtractor(ListExtractor):
+    runs = 0
+
+    async def run(self):
+        type(self).runs += 1
+        async for record in super().run():
+            yield record
+
+
+@pytest.mark.asyncio
+class TestSubscriber:
+
+    async def test_queue(self):
+        s = fanout.Subscriber('test-extractor', queue_size=10, spill=False)
+        await s.put({'id': 1})
+        s.finish()
+
+        assert await s.get() == {'id': 1}
+        assert await s.get() is fanout._DONE
+
+    async def test_spill(self):
+        before = spilled('test-spill')
+        s = fanout.Subscriber('test-spill', queue_size=2, spill=True)
+        for record in records(5):
+            await s.put(record)
+        s.finish()
+
+        assert s.queue.full()
+        assert spilled('test-spill') - before == 3
+        assert [await s.get() for _ in range(6)] == records(5) + [fanout._DONE]
+        s.close()
+
+    async def test_spill_interleaved(self):
+        s = fanout.Subscriber('test-spill', queue_size=1, spill=True)
+        await s.put({'id': 0})
+        await s.put({'id': 1})
+        assert await s.get() == {'id': 0}
+        assert await s.get() == {'id': 1}
+
+        get = asyncio.ensure_future(s.get())
+        await asyncio.sleep(0)
+        assert not get.done()
+        await s.put({'id': 2})
+        assert await get == {'id': 2}
+
+        s.finish()
+        assert await s.get() is fanout._DONE
+
+    async def test_finish_full_queue(self):
+        s = fanout.Subscriber('test-extractor', queue_size=1, spill=False)
+        await s.put({'id': 1})
+        s.finish(ValueError('boom'))
+
+        assert await s.get() == {'id': 1}
+        assert await s.get() is fanout._DONE
+        assert isinstance(s.error, ValueError)
+
+    async def test_close(self):
+        s = fanout.Subscriber('test-extractor', queue_size=1, spill=False)
+        await s.put({'id': 1})
+        s.close()
+
+        # closed subscribers drop records rather than blocking the round
+        await asyncio.wait_for(s.put({'id': 2}), 1)
+        assert s.queue.empty()
+
+
+@pytest.mark.asyncio
+class TestSharedExtractor:
+
+    def shared(self, n=3, **kwargs):
+        CountingExtractor.runs = 0
+        e = CountingExtractor(id='test-extractor', config={'records': records(n)})
+        return fanout.SharedExtractor(e, **dict({'window': 0.01}, **kwargs))
+
+    async def test_delegates(self):
+        s = self.shared()
+        assert s.id == 'test-extractor'
+        assert s.timer is s.extractor.timer
+        assert not s.columnar
+        assert str(s) == 'SharedExtractor(test-extractor)'
+
+    async def test_run_once(self):
+        s = self.shared()
+
+        async def consume():
+            return [r async for r in s.run()]
+
+        results = await asyncio.gather(consume(), consume(), consume())
+        assert results == [records(3)] * 3
+        assert CountingExtractor.runs == 1
+
+    async def test_run_later_round(self):
+        s = self.shared()
+
+        assert [r async for r in s.run()] == records(3)
+        assert [r async for r in s.run()] == records(3)
+        assert CountingExtractor.runs == 2
+
+    async def test_run_slow_consumer(self):
+        s = self.shared(n=20, queue_size=2)
+
+        async def slow():
+            result = []
+            async for r in s.run():
+                await asyncio.sleep(0)
+                result.append(r)
+            return result
+
+        async def fast():
+            return [r async for r in s.run()]
+
+        # the round waits on the slow pipeline rather than dropping records
+        assert await asyncio.gather(slow(), fast()) == [records(20)] * 2
+        assert CountingExtractor.runs == 1
+
+    async def test_run_abandoned(self):
+        s = self.shared(n=20, queue_size=2)
+
+        async def partial():
+            async for r in s.run():
+                return r
+
+        async def full():
+            return [r async for r in s.run()]
+
+        # a pipeline stopping early doesn't hold up the others
+        results = await asyncio.wait_for(asyncio.gather(partial(), full()), 5)
+        assert results == [{'id': 0}, records(20)]
+
+    async def test_run_spill(self):
+        before = spilled('test-extractor')
+        s = self.shared(n=20, queue_size=2, spill=True)
+
+        async def consume(delay):
+            result = []
+            async for r in s.run():
+                await asyncio.sleep(delay)
+                result.append(r)
+            return result
+
+        # the slow pipeline falls behind, and its overflow is spilled
+        results = await asyncio.gather(consume(0), consume(0.01))
+        assert results == [records(20)] * 2
+        assert spilled('test-extractor') > before
+
+    async def test_run_error(self):
+        s = self.shared()
+        s.extractor.run = asynctest.MagicMock(side_effect=ValueError('boom'))
+
+        async def consume():
+            return [r async for r in s.run()]
+
+        results = await asyncio.gather(consume(), consume(), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+
+    async def test_run_incremental(self):
+        class IncrementalExtractor(plugin.Extractor):
+            incremental = True
+
+            async def run(self, watermark=None):
+                yield {'watermark': watermark}
+
+        s = fanout.SharedExtractor(IncrementalExtractor(id='test-extractor', config={}))
+
+        assert [r async for r in s.run(watermark=1)] == [{'watermark': 1}]
+        assert [r async for r in s.run()] == [{'watermark': None}]
+        assert s._round is None
+
+    async def test_close(self):
+        s = self.shared()
+        s.consumers = 2
+        s.extractor.close = asynctest.CoroutineMock()
+
+        await s.close()
+        s.extractor.close.assert_not_awaited()
+        await s.close()
+        s.extractor.close.assert_awaited_once()
@@ -1,5 +1,6 @@
 """Unit tests for the prophetess.metrics package."""
 
+import asyncio
 from unittest.mock import patch
 
 import pytest
@@ -15,10 +16,10 @@ class TestTimer:
             labels=('a', 'b', 'c', 'd'),
         )
         assert t.histogram == metrics.plugin_latency
-        assert t._start_time is None
         assert t.labels == ('a', 'b', 'c', 'd')
+        assert t.child is metrics.plugin_latency.labels('a', 'b', 'c', 'd')
 
-    @patch('time.time')
+    @patch('time.perf_counter_ns')
     def test_start(self, time_mock):
         time_mock.return_value = 123456
 
@@ -26,32 +27,70 @@ class TestTimer:
             observer=metrics.plugin_latency,
             labels=('a', 'b', 'c', 'd'),
         )
-        t.start()
-        assert t._start_time == 123456
+        assert t.start() == 123456
 
-    @patch('time.time')
+    @patch('time.perf_counter_ns')
     @patch('prometheus_client.Histogram.observe')
     def test_stop(self, observe_mock, time_mock):
-        # NOTE: need three time values here because it appears that time.time is called
-        #  somewhere else in the call path, likely within a dependency.
-        time_mock.side_effect = [123456, 123460, 123462]
+        time_mock.side_effect = [123456, 4000123456]
+
+        t = metrics.Timer(
+            observer=metrics.plugin_latency,
+            labels=('a', 'b', 'c', 'd'),
+        )
+        token = t.start()
+        assert t.stop(token) == 4
+
+        observe_mock.assert_called_once_with(4)
+
+    @patch('time.perf_counter_ns')
+    @patch('prometheus_client.Histogram.observe')
+    def test_stop_without_token(self, observe_mock, time_mock):
+        time_mock.side_effect = [123456, 4000123456, 5000123456]
 
         t = metrics.Timer(
             observer=metrics.plugin_latency,
             labels=('a', 'b', 'c', 'd'),
         )
         t.start()
-        t.stop()
+        assert t.stop() == 4
 
-        assert t._start_time == 123456
         observe_mock.assert_called_once_with(4)
+        with pytest.raises(RuntimeError):
+            t.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_without_token_concurrent(self):
+        t = metrics.Timer(observer=metrics.plugin_latency, labels=('a', 'b', 'c', 'd'))
+
+        async def measure(delay):
+            t.start()
+            await asyncio.sleep(delay)
+            return t.stop()
+
+        short, long = await asyncio.gather(measure(0.01), measure(0.1))
+        assert 0.01 <= short < 0.1 <= long
 
-    @patch('time.time')
+    @patch('time.perf_counter_ns')
+    @patch('prometheus_client.Histogram.observe')
+    def test_overlapping(self, observe_mock, time_mock):
+        time_mock.side_effect = [0, 1000000000, 3000000000, 7000000000]
+
+        t = metrics.Timer(
+            observer=metrics.plugin_latency,
+            labels=('a', 'b', 'c', 'd'),
+        )
+        first = t.start()
+        second = t.start()
+        t.stop(first)
+        t.stop(second)
+
+        assert [c[0][0] for c in observe_mock.call_args_list] == [3, 6]
+
+    @patch('time.perf_counter_ns')
     @patch('prometheus_client.Histogram.observe')
     def test_context_managed_ok(self, observe_mock, time_mock):
-        # NOTE: need three time values here because it appears that time.time is called
-        #  somewhere else in the call path, likely within a dependency.
-        time_mock.side_effect = [123456, 123460, 123462]
+        time_mock.side_effect = [123456, 4000123456]
 
         t = metrics.Timer(
             observer=metrics.plugin_latency,
@@ -61,15 +100,12 @@ class TestTimer:
         with t:
             pass
 
-        assert t._start_time == 123456
         observe_mock.assert_called_once_with(4)
 
-    @patch('time.time')
+    @patch('time.perf_counter_ns')
     @patch('prometheus_client.Histogram.observe')
     def test_context_managed_on_exception(self, observe_mock, time_mock):
-        # NOTE: need three time values here because it appears that time.time is called
-        #  somewhere else in the call path, likely within a dependency.
-        time_mock.side_effect = [123456, 123460, 123462]
+        time_mock.side_effect = [123456, 4000123456]
 
         t = metrics.Timer(
             observer=metrics.plugin_latency,
@@ -80,5 +116,40 @@ class TestTimer:
             with t:
                 raise ValueError()
 
-        assert t._start_time == 123456
         observe_mock.assert_called_once_with(4)
+
+    @patch('time.perf_counter_ns')
+    @patch('prometheus_client.Histogram.observe')
+    def test_context_managed_nested(self, observe_mock, time_mock):
+        time_mock.side_effect = [0, 1000000000, 3000000000, 7000000000]
+
+        outer = metrics.Timer(observer=metrics.plugin_latency, labels=('a', 'b', 'c', 'd'))
+        inner = metrics.Timer(observer=metrics.plugin_latency, labels=('e', 'f', 'g', 'h'))
+
+        with outer:
+            with inner:
+                pass
+
+        assert [c[0][0] for c in observe_mock.call_args_list] == [2, 7]
+
+    @pytest.mark.asyncio
+    async def test_context_managed_concurrent(self):
+        t = metrics.Timer(observer=metrics.plugin_latency, labels=('a', 'b', 'c', 'd'))
+        observed = []
+
+        async def measure(delay):
+            with t:
+                await asyncio.sleep(delay)
+
+        # Tasks leave the timer in the opposite order they entered it
+        with patch.object(t.child, 'observe', side_effect=observed.append):
+            await asyncio.gather(measure(0.1), measure(0.01))
+
+        short, long = observed
+        assert 0.01 <= short < 0.1 <= long
+
+
+def test_child():
+    assert metrics.child(metrics.records_loaded, 'pipe', 'loader') is metrics.records_loaded.labels('pipe', 'loader')
+    assert metrics.child(metrics.records_loaded, 'pipe', 'loader') is metrics.child(
+        metrics.records_loaded, 'pipe', 'loader')
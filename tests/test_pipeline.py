@@ -1,11 +1,35 @@
 """Unit tests for the prophetess.pipeline package."""
 
+import asyncio
+import subprocess
+import sys
 from unittest.mock import call, patch
 
 import asynctest
 import pytest
+from prometheus_client import REGISTRY
 
-from prophetess import exceptions, metrics, pipeline, plugin
+from prophetess import (cache, exceptions, fanout, metrics, pipeline, plugin,
+                        ratelimit, retry, sharding, spool, state)
+
+from . import fixtures
+
+
+class IncrementalExtractor(plugin.Extractor):
+    incremental = True
+
+    async def run(self, watermark=None):
+        for i in range(5):
+            if watermark is None or i > watermark:
+                yield {'id': i}
+
+    def watermark(self, record):
+        return record['id']
+
+
+def observations(timer):
+    """How many latencies `timer` has observed"""
+    return sum(bucket.get() for bucket in timer.child._buckets)
 
 
 def test_build_pipelines_empty():
@@ -41,6 +65,7 @@ def test_build_pipelines_map_transform(build_mock):
             'test-pipe': {
                 'extractors': ['test-extract'],
                 'loaders': ['test-load'],
+                'concurrency': 2,
                 'transform': {
                     'name': '{Name}',
                 }
@@ -57,6 +82,9 @@ def test_build_pipelines_map_transform(build_mock):
     assert len(pipe.extractors) == 1
     assert len(pipe.loaders) == 1
 
+    assert pipe.concurrency == 2
+    assert pipe.state.path.endswith('watermarks.json')
+    assert pipe.changes is None
     assert pipe.transform.id == 'YAMLTransformer'
     assert pipe.transform.config == {'name': '{Name}'}
     assert pipe.extractors[0].id == 'test-extract'
@@ -135,6 +163,201 @@ def test_build_pipelines_str_transform(build_mock):
     ])
 
 
+@patch('prophetess.pipeline.build_plugin')
+def test_build_pipelines_skip_unchanged(build_mock):
+    build_mock.return_value = plugin.Loader(id='test-load', config={})
+
+    cfg = {
+        'loaders': {'test-load': {'plugin': 'FakeLoader'}},
+        'pipelines': {
+            'test-pipe': {
+                'loaders': ['test-load'],
+                'transform': {'name': '{Name}'},
+                'skip_unchanged': {'max_size': 10, 'refresh_interval': 60, 'persist': True},
+            },
+            'test-pipe-default': {
+                'loaders': ['test-load'],
+                'transform': {'name': '{Name}'},
+                'skip_unchanged': True,
+            },
+        }
+    }
+
+    with patch('prophetess.pipeline.STATE_DIR', '/state'):
+        p = pipeline.build_pipelines(cfg)
+
+    changes = p['test-pipe'].changes
+    assert changes.max_size == 10
+    assert changes.refresh_interval == 60
+    assert changes.path == '/state/changes-test-pipe.json'
+
+    changes = p['test-pipe-default'].changes
+    assert changes.max_size == 100000
+    assert changes.refresh_interval is None
+    assert changes.path is None
+
+
+@patch('prophetess.pipeline.build_plugin')
+def test_build_pipelines_spool(build_mock):
+    build_mock.return_value = plugin.Loader(id='test-load', config={})
+
+    cfg = {
+        'loaders': {
+            'test-load': {'plugin': 'FakeLoader', 'spool': {'max_size': 10}},
+            'test-load-default': {'plugin': 'FakeLoader', 'spool': True},
+            'test-load-none': {'plugin': 'FakeLoader'},
+        },
+        'pipelines': {
+            'test-pipe': {
+                'loaders': ['test-load', 'test-load-default', 'test-load-none'],
+                'transform': {'name': '{Name}'},
+            },
+        }
+    }
+
+    with patch('prophetess.pipeline.STATE_DIR', '/state'):
+        p = pipeline.build_pipelines(cfg)
+
+    spools = p['test-pipe'].spools
+    assert set(spools) == {'test-load', 'test-load-default'}
+    assert spools['test-load'].path == '/state/spool/test-pipe/test-load.jsonl'
+    assert spools['test-load'].max_size == 10
+    assert spools['test-load-default'].max_size == 10000
+
+
+@patch('prophetess.pipeline.build_plugin')
+def test_build_pipelines_shared_extractor(build_mock):
+    build_mock.side_effect = lambda kind, name, data: plugin.Extractor(id=name, config={})
+
+    cfg = {
+        'extractors': {
+            'test-shared': {'plugin': 'FakeExtractor', 'fan_out': {'window': 5, 'spill': True}},
+            'test-own': {'plugin': 'FakeExtractor'},
+        },
+        'pipelines': {
+            'test-pipe-1': {'extractors': ['test-shared'], 'transform': {'name': '{Name}'}},
+            'test-pipe-2': {'extractors': ['test-shared', 'test-own'], 'transform': {'name': '{Name}'}},
+        }
+    }
+
+    p = pipeline.build_pipelines(cfg)
+
+    shared = p['test-pipe-1'].extractors[0]
+    assert isinstance(shared, fanout.SharedExtractor)
+    assert p['test-pipe-2'].extractors[0] is shared
+    assert shared.consumers == 2
+    assert shared.window == 5
+    assert shared.spill
+    assert type(p['test-pipe-2'].extractors[1]) is plugin.Extractor
+    assert build_mock.call_count == 2
+
+
+@patch('prophetess.pipeline.build_plugin')
+def test_build_pipelines_cached_extractor(build_mock):
+    build_mock.side_effect = lambda kind, name, data: plugin.Extractor(id=name, config={})
+
+    cfg = {
+        'extractors': {
+            'test-cached': {'plugin': 'FakeExtractor', 'cache': {'ttl': 600, 'persist': True}},
+        },
+        'pipelines': {
+            'test-pipe-1': {'extractors': ['test-cached'], 'transform': {'name': '{Name}'}},
+            'test-pipe-2': {'extractors': ['test-cached'], 'transform': {'name': '{Name}'}},
+        }
+    }
+
+    with patch('prophetess.pipeline.STATE_DIR', '/state'):
+        p = pipeline.build_pipelines(cfg)
+
+    # shared pipelines share the one cache
+    cached = p.caches['test-cached']
+    assert isinstance(cached, cache.CachedExtractor)
+    assert p['test-pipe-1'].extractors[0].extractor is cached
+    assert cached.ttl == 600
+    assert cached.stale_while_revalidate == 0
+    assert cached.path == '/state/cache/test-cached.json'
+
+
+@patch('prophetess.pipeline.build_plugin')
+def test_build_pipelines_sharded(build_mock):
+    class PartitionedExtractor(plugin.Extractor):
+        partitioned = True
+
+    build_mock.side_effect = lambda kind, name, data: PartitionedExtractor(id=name, config={})
+
+    cfg = {
+        'extractors': {'test-extract': {'plugin': 'FakeExtractor'}},
+        'pipelines': dict(
+            {'test-pipe-{}'.format(i): {'extractors': ['test-extract'], 'transform': {'name': '{Name}'}}
+             for i in range(10)},
+            **{'test-partitioned': {'extractors': ['test-extract'], 'transform': {'name': '{Name}'},
+                                    'partitioned': True}},
+        ),
+    }
+
+    shard = sharding.Shard(1, 3)
+    with patch('prophetess.pipeline.STATE_DIR', '/state'):
+        p = pipeline.build_pipelines(cfg, shard)
+
+    assert set(p) == {name for name in cfg['pipelines'] if shard.owns(name)} | {'test-partitioned'}
+    assert 0 < len(p) < 11
+    assert p['test-partitioned'].extractors[0].partition == sharding.Partition(1, 3)
+    assert p['test-partitioned'].state.path == '/state/replica-1/watermarks.json'
+
+    # pipelines not partitioned get their own, whole, extractor
+    for name in set(p) - {'test-partitioned'}:
+        assert p[name].extractors[0].partition is None
+
+
+@patch('prophetess.pipeline.build_plugin')
+def test_build_pipelines_sharded_cache(build_mock):
+    class PartitionedExtractor(plugin.Extractor):
+        partitioned = True
+
+    build_mock.side_effect = lambda kind, name, data: PartitionedExtractor(id=name, config={})
+
+    cfg = {
+        'extractors': {'test-cached': {'plugin': 'FakeExtractor', 'cache': {'ttl': 600, 'persist': True}}},
+        'pipelines': {
+            'test-whole': {'extractors': ['test-cached'], 'transform': {'name': '{Name}'}},
+            'test-partitioned': {'extractors': ['test-cached'], 'transform': {'name': '{Name}'}, 'partitioned': True},
+        },
+    }
+
+    # the replica owning test-whole runs both, so needs both snapshots
+    shard = next(sharding.Shard(i, 3) for i in range(3) if sharding.Shard(i, 3).owns('test-whole'))
+    with patch('prophetess.pipeline.STATE_DIR', '/state'):
+        p = pipeline.build_pipelines(cfg, shard)
+
+    whole = p.caches['test-cached']
+    partitioned = p.caches['test-cached.partition-{}-of-3'.format(shard.index)]
+    assert whole is not partitioned
+    assert p['test-whole'].extractors[0] is whole
+    assert p['test-partitioned'].extractors[0] is partitioned
+    assert whole.partition is None
+    assert partitioned.partition == shard.partition
+    assert whole.path == '/state/replica-{}/cache/test-cached.json'.format(shard.index)
+    assert partitioned.path == '/state/replica-{0}/cache/test-cached.partition-{0}-of-3.json'.format(shard.index)
+
+
+@patch('prophetess.pipeline.build_plugin')
+def test_build_pipelines_not_partitionable(build_mock):
+    build_mock.return_value = plugin.Extractor(id='test-extract', config={})
+
+    cfg = {
+        'extractors': {'test-extract': {'plugin': 'FakeExtractor'}},
+        'pipelines': {
+            'test-pipe': {'extractors': ['test-extract'], 'transform': {'name': '{Name}'}, 'partitioned': True},
+        },
+    }
+
+    with pytest.raises(exceptions.InvalidConfigurationException):
+        pipeline.build_pipelines(cfg, sharding.Shard(0, 2))
+
+    # without shards, partitioned pipelines are like any other
+    assert pipeline.build_pipelines(cfg)['test-pipe'].extractors[0].partition is None
+
+
 @patch('prophetess.pipeline.build_plugin')
 def test_build_pipelines_invalid_transform(build_mock):
     cfg = {
@@ -164,8 +387,34 @@ class TestPipelines:
         p = pipeline.Pipelines()
         p['1'] = p1
 
-        await p.close()
+        with asynctest.patch('prophetess.pipeline.sessions.close') as sessions_close:
+            await p.close()
+
         p1.close.assert_called_once()
+        sessions_close.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_close_concurrently(self, caplog):
+        closed = asyncio.Event()
+
+        async def waits():
+            await closed.wait()
+
+        async def fails():
+            closed.set()
+            raise ValueError('boom')
+
+        p = pipeline.Pipelines()
+        for i, close in enumerate((waits, fails)):
+            p.append(pipeline.Pipeline(id=str(i), extractors=None, transform=None, loaders=None))
+            p[str(i)].close = asynctest.CoroutineMock(side_effect=close)
+
+        # the first pipeline can only close once the second has started closing
+        with asynctest.patch('prophetess.pipeline.sessions.close') as sessions_close:
+            await asyncio.wait_for(p.close(), 1)
+
+        assert "Failed to close Pipeline(1): ValueError('boom')" in caplog.text
+        sessions_close.assert_awaited_once()
 
     def test_append(self):
         p1 = pipeline.Pipeline(id='1', extractors=None, transform=None, loaders=None)
@@ -194,9 +443,51 @@ class TestPipeline:
         assert p.extractors == ['extractor']
         assert p.transform == 'transform'
         assert p.loaders == ['loader']
+        assert p.concurrency == 1
         assert p.timer.histogram == metrics.pipeline_latency
         assert p.timer.labels == ('test',)
 
+    @pytest.mark.asyncio
+    async def test_semaphore(self):
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[], concurrency=2)
+        assert p.semaphore is p.semaphore
+
+        async with p.semaphore:
+            async with p.semaphore:
+                assert p.semaphore.locked()
+
+    def test_init_concurrent_incremental(self, tmp_path):
+        store = state.StateStore(str(tmp_path / 'watermarks.json'))
+        extractor = IncrementalExtractor(id='test-extractor', config={})
+
+        with pytest.raises(exceptions.InvalidConfigurationException):
+            pipeline.Pipeline(
+                id='test', extractors=[extractor], transform=None, loaders=[], concurrency=2, state=store,
+            )
+
+        # without a store there are no watermarks to keep apart
+        p = pipeline.Pipeline(id='test', extractors=[extractor], transform=None, loaders=[], concurrency=2)
+        assert p.concurrency == 2
+
+    @pytest.mark.asyncio
+    async def test_run_overlapping_span(self):
+        records = [{'id': 1}, {'id': 2}]
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.run = asynctest.CoroutineMock()
+
+        p = pipeline.Pipeline(
+            id='test-overlapping-span',
+            extractors=[fixtures.ListExtractor(id='test-extractor', config={'records': records, 'delay': 0.01})],
+            transform=plugin.Transformer(id='YAMLTransformer', config={'id': '{id}'}),
+            loaders=[loader],
+            concurrency=2,
+        )
+        await asyncio.gather(p.run(), p.run())
+
+        # one span covering both runs, rather than one cut short by the other
+        span = metrics.pipeline_span.labels('test-overlapping-span')
+        assert sum(b.get() for b in span._buckets) == 1
+
     @pytest.mark.asyncio
     async def test_close(self):
         extractor = plugin.PluginBase(id='test-extractor', config={})
@@ -220,6 +511,16 @@ class TestPipeline:
         transformer.close.assert_awaited_once()
         loader.close.assert_awaited_once()
 
+    @pytest.mark.asyncio
+    async def test_close_flushes_batches(self):
+        p = pipeline.Pipeline(id='test', extractors=[], transform=plugin.PluginBase(id='t', config={}), loaders=[])
+        b = asynctest.MagicMock()
+        b.flush = asynctest.CoroutineMock()
+        p._batches['test-loader'] = b
+
+        await p.close()
+        b.flush.assert_awaited_once()
+
     @pytest.mark.asyncio
     async def test_run(self):
         extractor = plugin.PluginBase(id='test-extractor', config={})
@@ -241,15 +542,230 @@ class TestPipeline:
         )
         p.process = asynctest.CoroutineMock()
 
-        assert p.timer._start_time is None
+        pipeline_observed = observations(p.timer)
         await p.run()
 
-        assert p.timer._start_time is not None
+        assert observations(p.timer) == pipeline_observed + 1
         transformer.run.assert_not_awaited()
         loader.run.assert_not_awaited()
         extractor.run.assert_called_once()
         p.process.assert_awaited_once_with('extract-record')
 
+    @pytest.mark.asyncio
+    async def test_run_staged(self):
+        extractors = [
+            plugin.PluginBase(id='test-extractor-1', config={}),
+            plugin.PluginBase(id='test-extractor-2', config={}),
+        ]
+        transformer = plugin.PluginBase(id='test-transformer', config={})
+        loader = plugin.PluginBase(id='test-loader', config={})
+
+        def extract_fn(prefix):
+            async def fn(*args, **kwargs):
+                for i in range(10):
+                    yield '{}-{}'.format(prefix, i)
+            return fn
+
+        async def transform_fn(record):
+            yield record.upper()
+
+        extractors[0].run = asynctest.MagicMock(side_effect=extract_fn('a'))
+        extractors[1].run = asynctest.MagicMock(side_effect=extract_fn('b'))
+        transformer.run = asynctest.MagicMock(side_effect=transform_fn)
+        loader.run = asynctest.CoroutineMock()
+
+        p = pipeline.Pipeline(
+            id='test',
+            extractors=extractors,
+            transform=transformer,
+            loaders=[loader],
+            stages={'transform': {'workers': 2, 'queue_size': 1}, 'load': {'workers': 3, 'queue_size': 2}},
+        )
+
+        await asyncio.wait_for(p.run(), timeout=1)
+
+        assert transformer.run.call_count == 20
+        assert sorted(c[0][0] for c in loader.run.call_args_list) == sorted(
+            ['A-{}'.format(i) for i in range(10)] + ['B-{}'.format(i) for i in range(10)]
+        )
+
+    @pytest.mark.asyncio
+    async def test_run_staged_backpressure(self):
+        extractor = plugin.PluginBase(id='test-extractor', config={})
+        transformer = plugin.PluginBase(id='test-transformer', config={})
+        loader = plugin.PluginBase(id='test-loader', config={})
+        produced = []
+        loaded = []
+        release = asyncio.Event()
+
+        async def extract_fn(*args, **kwargs):
+            for i in range(100):
+                produced.append(i)
+                yield {'id': i}
+
+        async def transform_fn(record):
+            yield record
+
+        async def load_fn(record):
+            await release.wait()
+            loaded.append(record['id'])
+
+        extractor.run = asynctest.MagicMock(side_effect=extract_fn)
+        transformer.run = asynctest.MagicMock(side_effect=transform_fn)
+        loader.run = asynctest.CoroutineMock(side_effect=load_fn)
+
+        p = pipeline.Pipeline(
+            id='test',
+            extractors=[extractor],
+            transform=transformer,
+            loaders=[loader],
+            stages={'transform': {'queue_size': 2}, 'load': {'queue_size': 2}},
+        )
+
+        task = asyncio.ensure_future(p.run())
+        for _ in range(20):
+            await asyncio.sleep(0)
+
+        # only a handful of records held by the workers and the two queues
+        assert len(produced) < 10
+        assert loaded == []
+
+        release.set()
+        await asyncio.wait_for(task, timeout=1)
+        assert loaded == list(range(100))
+
+    @pytest.mark.asyncio
+    async def test_run_staged_error(self):
+        extractor = plugin.PluginBase(id='test-extractor', config={})
+        transformer = plugin.PluginBase(id='test-transformer', config={})
+
+        async def extract_fn(*args, **kwargs):
+            for i in range(100):
+                yield i
+
+        extractor.run = asynctest.MagicMock(side_effect=extract_fn)
+        transformer.run = asynctest.MagicMock(side_effect=KeyError)
+
+        p = pipeline.Pipeline(
+            id='test',
+            extractors=[extractor],
+            transform=transformer,
+            loaders=[],
+            stages={'transform': {'queue_size': 1}},
+        )
+
+        with pytest.raises(KeyError):
+            await asyncio.wait_for(p.run(), timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_run_columnar(self):
+        class ColumnExtractor(plugin.Extractor):
+            async def run_columns(self):
+                yield {'Name': ['a', 'b'], 'Id': [1, 2]}
+                yield {'Name': ['c'], 'Id': [3]}
+
+        class BatchLoader(plugin.Loader):
+            async def run_batch(self, records):
+                pass
+
+        batch_loader = BatchLoader(id='test-batch-loader', config={})
+        batch_loader.run_batch = asynctest.CoroutineMock()
+        loader = plugin.PluginBase(id='test-loader', config={})
+        loader.run = asynctest.CoroutineMock()
+
+        p = pipeline.Pipeline(
+            id='test',
+            extractors=[ColumnExtractor(id='test-extractor', config={})],
+            transform=plugin.Transformer(id='YAMLTransformer', config={'slug': '{Name}-{Id}'}),
+            loaders=[batch_loader, loader],
+            columnar=True,
+        )
+        await p.run()
+
+        batch_loader.run_batch.assert_has_awaits([
+            call([{'slug': 'a-1'}, {'slug': 'b-2'}]),
+            call([{'slug': 'c-3'}]),
+        ])
+        loader.run.assert_has_awaits([call({'slug': 'a-1'}), call({'slug': 'b-2'}), call({'slug': 'c-3'})])
+
+    @pytest.mark.asyncio
+    async def test_process_columns_fallback(self):
+        transformer = plugin.PluginBase(id='test-transformer', config={})
+
+        async def transform_fn(record):
+            yield record
+
+        transformer.run = asynctest.MagicMock(side_effect=transform_fn)
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=transformer, loaders=[])
+        p.load = asynctest.CoroutineMock()
+
+        await p.process_columns({'Name': ['a', 'b']})
+        p.load.assert_has_awaits([call({'Name': 'a'}), call({'Name': 'b'})])
+
+    @pytest.mark.asyncio
+    async def test_run_incremental(self, tmp_path):
+        store = state.StateStore(str(tmp_path / 'watermarks.json'))
+        loader = plugin.PluginBase(id='test-loader', config={})
+        loader.run = asynctest.CoroutineMock()
+
+        p = pipeline.Pipeline(
+            id='test',
+            extractors=[IncrementalExtractor(id='test-extractor', config={})],
+            transform=plugin.Transformer(id='YAMLTransformer', config={'id': '{id}'}),
+            loaders=[loader],
+            state=store,
+        )
+
+        await p.run()
+        assert loader.run.await_count == 5
+        assert state.StateStore(store.path).get('test/test-extractor') == 4
+
+        # nothing new, so nothing loaded and the watermark stays put
+        await p.run()
+        assert loader.run.await_count == 5
+        assert store.get('test/test-extractor') == 4
+
+    @pytest.mark.asyncio
+    async def test_run_incremental_failed_load(self, tmp_path):
+        store = state.StateStore(str(tmp_path / 'watermarks.json'))
+        store.set('test/test-extractor', 1)
+        loader = plugin.PluginBase(id='test-loader', config={})
+        loader.run = asynctest.CoroutineMock(side_effect=[None, exceptions.ServiceError, None])
+
+        p = pipeline.Pipeline(
+            id='test',
+            extractors=[IncrementalExtractor(id='test-extractor', config={})],
+            transform=plugin.Transformer(id='YAMLTransformer', config={'id': '{id}'}),
+            loaders=[loader],
+            state=store,
+        )
+
+        await p.run()
+        assert loader.run.await_count == 3
+        assert p.failures == 1
+        assert store.get('test/test-extractor') == 1
+
+    @pytest.mark.asyncio
+    async def test_run_staged_incremental(self, tmp_path):
+        store = state.StateStore(str(tmp_path / 'watermarks.json'))
+        store.set('test/test-extractor', 2)
+        loader = plugin.PluginBase(id='test-loader', config={})
+        loader.run = asynctest.CoroutineMock()
+
+        p = pipeline.Pipeline(
+            id='test',
+            extractors=[IncrementalExtractor(id='test-extractor', config={})],
+            transform=plugin.Transformer(id='YAMLTransformer', config={'id': '{id}'}),
+            loaders=[loader],
+            stages={'load': {'workers': 2}},
+            state=store,
+        )
+
+        await p.run()
+        loader.run.assert_has_awaits([call({'id': '3'}), call({'id': '4'})])
+        assert store.get('test/test-extractor') == 4
+
     @pytest.mark.asyncio
     async def test_process(self):
         extractor = plugin.PluginBase(id='test-extractor', config={})
@@ -271,13 +787,13 @@ class TestPipeline:
         )
         p.load = asynctest.CoroutineMock()
 
-        assert p.timer._start_time is None
-        assert transformer.timer._start_time is None
+        pipeline_observed = observations(p.timer)
+        transformer_observed = observations(transformer.timer)
 
         await p.process({'test': 'record'})
 
-        assert p.timer._start_time is None
-        assert transformer.timer._start_time is not None
+        assert observations(p.timer) == pipeline_observed
+        assert observations(transformer.timer) == transformer_observed + 1
 
         extractor.run.assert_not_awaited()
         loader.run.assert_not_awaited()
@@ -297,14 +813,14 @@ class TestPipeline:
         )
         p.load = asynctest.CoroutineMock()
 
-        assert p.timer._start_time is None
-        assert transformer.timer._start_time is None
+        pipeline_observed = observations(p.timer)
+        transformer_observed = observations(transformer.timer)
 
         with pytest.raises(KeyError):
             await p.process({'test': 'record'})
 
-        assert p.timer._start_time is None
-        assert transformer.timer._start_time is not None
+        assert observations(p.timer) == pipeline_observed
+        assert observations(transformer.timer) == transformer_observed + 1
 
         transformer.run.assert_called_once()
         p.load.assert_not_awaited()
@@ -318,9 +834,9 @@ class TestPipeline:
             loaders=[],
         )
 
-        assert p.timer._start_time is None
+        pipeline_observed = observations(p.timer)
         await p.load(None)
-        assert p.timer._start_time is None
+        assert observations(p.timer) == pipeline_observed
 
     @pytest.mark.asyncio
     async def test_load(self):
@@ -339,18 +855,152 @@ class TestPipeline:
             loaders=[loader],
         )
 
-        assert p.timer._start_time is None
-        assert loader.timer._start_time is None
+        pipeline_observed = observations(p.timer)
+        loader_observed = observations(loader.timer)
 
         await p.load({'test': 'record'})
 
-        assert p.timer._start_time is None
-        assert loader.timer._start_time is not None
+        assert observations(p.timer) == pipeline_observed
+        assert observations(loader.timer) == loader_observed + 1
 
         extractor.run.assert_not_awaited()
         transformer.run.assert_not_awaited()
         loader.run.assert_awaited_once_with({'test': 'record'})
 
+    @pytest.mark.asyncio
+    async def test_load_concurrent(self):
+        loaders = [
+            plugin.PluginBase(id='test-loader-1', config={}),
+            plugin.PluginBase(id='test-loader-2', config={}),
+        ]
+        started = asyncio.Event()
+
+        async def slow(record):
+            await started.wait()
+
+        async def fast(record):
+            started.set()
+
+        loaders[0].run = asynctest.CoroutineMock(side_effect=slow)
+        loaders[1].run = asynctest.CoroutineMock(side_effect=fast)
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=loaders)
+
+        # the first loader can only finish once the second has started
+        await asyncio.wait_for(p.load({'test': 'record'}), timeout=1)
+
+        loaders[0].run.assert_awaited_once_with({'test': 'record'})
+        loaders[1].run.assert_awaited_once_with({'test': 'record'})
+
+    @pytest.mark.asyncio
+    async def test_load_strict_order(self):
+        loaders = [
+            plugin.PluginBase(id='test-loader-1', config={}),
+            plugin.PluginBase(id='test-loader-2', config={}),
+        ]
+        order = []
+
+        async def first(record):
+            await asyncio.sleep(0)
+            order.append('first')
+
+        async def second(record):
+            order.append('second')
+
+        loaders[0].run = asynctest.CoroutineMock(side_effect=first)
+        loaders[1].run = asynctest.CoroutineMock(side_effect=second)
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=loaders, strict_load_order=True)
+        await p.load({'test': 'record'})
+
+        assert order == ['first', 'second']
+
+    @pytest.mark.asyncio
+    async def test_load_batch(self):
+        class BatchLoader(plugin.Loader):
+            async def run_batch(self, records):
+                pass
+
+        batch_loader = BatchLoader(id='test-batch-loader', config={})
+        batch_loader.run_batch = asynctest.CoroutineMock()
+        loader = plugin.PluginBase(id='test-loader', config={})
+        loader.run = asynctest.CoroutineMock()
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[batch_loader, loader], batch_size=2)
+
+        for i in range(3):
+            await p.load({'id': i})
+
+        batch_loader.run_batch.assert_awaited_once_with([{'id': 0}, {'id': 1}])
+        assert loader.run.await_count == 3
+
+        await p.flush()
+        batch_loader.run_batch.assert_has_awaits([call([{'id': 0}, {'id': 1}]), call([{'id': 2}])])
+
+    @pytest.mark.asyncio
+    async def test_run_flushes_batches(self):
+        extractor = plugin.PluginBase(id='test-extractor', config={})
+        p = pipeline.Pipeline(id='test', extractors=[extractor], transform=None, loaders=[])
+
+        async def extract_fn(*args, **kwargs):
+            yield 'extract-record'
+
+        extractor.run = asynctest.MagicMock(side_effect=extract_fn)
+        p.process = asynctest.CoroutineMock()
+        p.flush = asynctest.CoroutineMock()
+
+        await p.run()
+        p.flush.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_load_batch_error(self):
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.run_batch = asynctest.CoroutineMock(side_effect=exceptions.ProphetessException)
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[loader])
+        loader_observed = observations(loader.timer)
+        await p.load_batch_into(loader, [{'id': 1}])
+
+        loader.run_batch.assert_awaited_once_with([{'id': 1}])
+        assert observations(loader.timer) == loader_observed + 1
+
+    @pytest.mark.asyncio
+    async def test_load_skip_unchanged(self):
+        loader = plugin.Loader(id='test-loader', config={'pk': ['slug']})
+        loader.run = asynctest.CoroutineMock(side_effect=[None, exceptions.ServiceError, None, None])
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[loader], changes=cache.ChangeCache())
+
+        await p.load({'slug': 'a', 'name': 'A'})
+        await p.load({'slug': 'a', 'name': 'A'})
+        assert loader.run.await_count == 1
+
+        # a failed load is retried next time around
+        await p.load({'slug': 'a', 'name': 'B'})
+        await p.load({'slug': 'a', 'name': 'B'})
+        await p.load({'slug': 'a', 'name': 'B'})
+        assert loader.run.await_count == 3
+
+        await p.load({'slug': 'a', 'name': 'A'})
+        assert loader.run.await_count == 4
+
+    @pytest.mark.asyncio
+    async def test_load_batch_skip_unchanged(self):
+        loader = plugin.Loader(id='test-loader', config={'pk': ['slug']})
+        loader.run_batch = asynctest.CoroutineMock()
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[loader], changes=cache.ChangeCache())
+
+        await p.load_batch_into(loader, [{'slug': 'a'}, {'slug': 'b'}])
+        await p.load_batch_into(loader, [{'slug': 'a'}, {'slug': 'b', 'name': 'B'}])
+        await p.load_batch_into(loader, [{'slug': 'a'}])
+
+        loader.run_batch.assert_has_awaits([
+            call([{'slug': 'a'}, {'slug': 'b'}]),
+            call([{'slug': 'b', 'name': 'B'}]),
+        ])
+        assert loader.run_batch.await_count == 2
+
     @pytest.mark.asyncio
     async def test_load_error(self):
         loader = plugin.PluginBase(id='test-loader', config={})
@@ -363,13 +1013,13 @@ class TestPipeline:
             loaders=[loader],
         )
 
-        assert p.timer._start_time is None
-        assert loader.timer._start_time is None
+        pipeline_observed = observations(p.timer)
+        loader_observed = observations(loader.timer)
 
         await p.load({'test': 'record'})
 
-        assert p.timer._start_time is None
-        assert loader.timer._start_time is not None
+        assert observations(p.timer) == pipeline_observed
+        assert observations(loader.timer) == loader_observed + 1
 
         loader.run.assert_awaited_once_with({'test': 'record'})
 
@@ -385,16 +1035,379 @@ class TestPipeline:
             loaders=[loader],
         )
 
-        assert p.timer._start_time is None
-        assert loader.timer._start_time is None
+        pipeline_observed = observations(p.timer)
+        loader_observed = observations(loader.timer)
 
         await p.load({'test': 'record'})
 
-        assert p.timer._start_time is None
-        assert loader.timer._start_time is not None
+        assert observations(p.timer) == pipeline_observed
+        assert observations(loader.timer) == loader_observed + 1
 
         loader.run.assert_awaited_once_with({'test': 'record'})
 
+    @pytest.mark.asyncio
+    async def test_load_error_isolated(self):
+        loaders = [
+            plugin.PluginBase(id='test-loader-1', config={}),
+            plugin.PluginBase(id='test-loader-2', config={}),
+        ]
+        loaders[0].run = asynctest.CoroutineMock(side_effect=ValueError)
+        loaders[1].run = asynctest.CoroutineMock()
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=loaders)
+        await p.load({'test': 'record'})
+
+        loaders[0].run.assert_awaited_once_with({'test': 'record'})
+        loaders[1].run.assert_awaited_once_with({'test': 'record'})
+
+    @pytest.mark.asyncio
+    async def test_load_rate_limited(self):
+        loader = plugin.PluginBase(id='test-loader', config={})
+        loader.run = asynctest.CoroutineMock(side_effect=exceptions.ServiceError('slow down', status=429))
+        limiter = ratelimit.Limiter('netbox', rate=10, adaptive=True)
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[loader])
+        with patch.object(plugin.PluginBase, 'limiter', limiter):
+            await p.load({'test': 'record'})
+
+        assert p.failures == 1
+        assert limiter.bucket.rate == 5
+
+    @pytest.mark.asyncio
+    @patch('prophetess.pipeline.asyncio.sleep', new_callable=asynctest.CoroutineMock)
+    async def test_load_retry(self, sleep_mock):
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.retry = retry.Retry(attempts=3)
+        loader.run = asynctest.CoroutineMock(side_effect=[exceptions.ServiceError('down', status=503), None])
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[loader])
+        await p.load({'id': 1})
+
+        assert loader.run.await_count == 2
+        assert sleep_mock.await_count == 1
+        assert p.failures == 0
+
+    @pytest.mark.asyncio
+    @patch('prophetess.pipeline.asyncio.sleep', new_callable=asynctest.CoroutineMock)
+    async def test_load_retry_not_retryable(self, sleep_mock):
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.retry = retry.Retry(attempts=3)
+        loader.run = asynctest.CoroutineMock(side_effect=KeyError('id'))
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[loader])
+        await p.load({'id': 1})
+
+        loader.run.assert_awaited_once_with({'id': 1})
+        sleep_mock.assert_not_awaited()
+        assert p.failures == 1
+
+    @pytest.mark.asyncio
+    @patch('prophetess.pipeline.asyncio.sleep', new_callable=asynctest.CoroutineMock)
+    async def test_load_spooled(self, sleep_mock, tmp_path):
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.retry = retry.Retry(attempts=2)
+        loader.run = asynctest.CoroutineMock(side_effect=exceptions.ServiceError('down', status=503))
+        s = spool.Spool(str(tmp_path / 'test-loader.jsonl'), labels=('test', 'test-loader'))
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[loader], spools={'test-loader': s})
+        await p.load({'id': 1})
+
+        assert loader.run.await_count == 2
+        assert p.failures == 1
+        assert s.take() == [{'id': 1}]
+
+    @pytest.mark.asyncio
+    async def test_load_not_spooled(self, tmp_path):
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.run = asynctest.CoroutineMock(side_effect=exceptions.ServiceError('bad request', status=400))
+        s = spool.Spool(str(tmp_path / 'test-loader.jsonl'), labels=('test', 'test-loader'))
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[loader], spools={'test-loader': s})
+        await p.load({'id': 1})
+
+        assert p.failures == 1
+        assert len(s) == 0
+
+    @pytest.mark.asyncio
+    async def test_run_replays_spool(self, tmp_path):
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.run = asynctest.CoroutineMock()
+        s = spool.Spool(str(tmp_path / 'test-loader.jsonl'), labels=('test-replay', 'test-loader'))
+        s.append([{'id': 1}, {'id': 2}])
+
+        p = pipeline.Pipeline(id='test-replay', extractors=[], transform=None, loaders=[loader],
+                              spools={'test-loader': s})
+        await p.run()
+
+        loader.run.assert_has_awaits([call({'id': 1}), call({'id': 2})])
+        assert len(s) == 0
+        assert metrics.spool_replayed.labels('test-replay', 'test-loader')._value.get() == 2
+
+    @pytest.mark.asyncio
+    async def test_run_replays_spool_first(self, tmp_path):
+        loaded = []
+
+        async def run(record):
+            # the spooled payload is the slower one to load
+            if record['name'] == 'old':
+                await asyncio.sleep(0.01)
+            loaded.append(record)
+
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.run = run
+        s = spool.Spool(str(tmp_path / 'test-loader.jsonl'), labels=('test-replay-first', 'test-loader'))
+        s.append([{'id': 1, 'name': 'old'}])
+
+        p = pipeline.Pipeline(
+            id='test-replay-first',
+            extractors=[IncrementalExtractor(id='test-extractor', config={})],
+            transform=plugin.Transformer(id='YAMLTransformer', config={'id': '{id}', 'name': 'new'}),
+            loaders=[loader],
+            spools={'test-loader': s},
+        )
+        await p.run()
+
+        # the spooled payload lands first, so the current one wins
+        assert loaded[0] == {'id': 1, 'name': 'old'}
+        assert loaded[1:] == [{'id': str(i), 'name': 'new'} for i in range(5)]
+
+    @pytest.mark.asyncio
+    async def test_run_replay_failures_keep_watermarks(self, tmp_path):
+        async def run(record):
+            if record['name'] == 'old':
+                raise exceptions.ServiceError('unavailable', status=503)
+
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.run = run
+        s = spool.Spool(str(tmp_path / 'test-loader.jsonl'), labels=('test-replay-fail', 'test-loader'))
+        s.append([{'id': 1, 'name': 'old'}])
+        store = state.StateStore(str(tmp_path / 'watermarks.json'))
+
+        p = pipeline.Pipeline(
+            id='test-replay-fail',
+            extractors=[IncrementalExtractor(id='test-extractor', config={})],
+            transform=plugin.Transformer(id='YAMLTransformer', config={'id': '{id}', 'name': 'new'}),
+            loaders=[loader],
+            spools={'test-loader': s},
+            state=store,
+        )
+        await p.run()
+
+        # the spooled record failed again, but this run's extract loaded cleanly
+        assert p.failures == 1
+        assert state.StateStore(store.path).get('test-replay-fail/test-extractor') == 4
+
+    @pytest.mark.asyncio
+    async def test_replay_interrupted(self, tmp_path):
+        loading = asyncio.Event()
+
+        async def run(record):
+            if record['id'] == 2:
+                loading.set()
+                await asyncio.sleep(10)
+
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.run = run
+        path = str(tmp_path / 'test-loader.jsonl')
+        s = spool.Spool(path, labels=('test', 'test-loader'))
+        s.append([{'id': 1}, {'id': 2}, {'id': 3}])
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[loader], spools={'test-loader': s})
+        task = asyncio.ensure_future(p.replay())
+        await loading.wait()
+
+        # were the process to die now, the next one would take them all again
+        assert spool.Spool(path, labels=('test', 'test-loader')).take() == [{'id': 1}, {'id': 2}, {'id': 3}]
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert spool.Spool(path, labels=('test', 'test-loader')).take() == [{'id': 2}, {'id': 3}]
+
+    @pytest.mark.asyncio
+    async def test_replay_cancelled(self, tmp_path):
+        loaded = asyncio.Event()
+
+        async def run(record):
+            loaded.set()
+            await asyncio.sleep(10)
+
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.run = run
+        s = spool.Spool(str(tmp_path / 'test-loader.jsonl'), labels=('test', 'test-loader'))
+        s.append([{'id': 1}, {'id': 2}])
+
+        p = pipeline.Pipeline(id='test', extractors=[], transform=None, loaders=[loader], spools={'test-loader': s})
+        task = asyncio.ensure_future(p.replay())
+        await loaded.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert s.take() == [{'id': 1}, {'id': 2}]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('stages', [None, {'transform': {'queue_size': 10}, 'load': {'queue_size': 10}}])
+    async def test_run_max_in_flight(self, stages):
+        class CountingExtractor(plugin.Extractor):
+            async def run(self):
+                for i in range(50):
+                    yield {'id': i}
+
+        peak = []
+
+        async def run(record):
+            peak.append(len(p.budget))
+            await asyncio.sleep(0)
+
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.run = run
+
+        p = pipeline.Pipeline(
+            id='test',
+            extractors=[CountingExtractor(id='test-extractor', config={})],
+            transform=plugin.Transformer(id='YAMLTransformer', config={'id': '{id}'}),
+            loaders=[loader],
+            stages=stages,
+            max_in_flight=3,
+        )
+        await p.run()
+
+        assert len(peak) == 50
+        assert max(peak) <= 3
+        assert len(p.budget) == 0
+
+    @pytest.mark.asyncio
+    async def test_run_max_in_flight_chunked(self):
+        class CountingExtractor(plugin.Extractor):
+            async def run(self):
+                for i in range(10):
+                    yield {'id': i}
+
+        transformer = plugin.Transformer(id='test-transformer', config={})
+        transformer.chunk_size = 100
+        transformer.run_many = asynctest.CoroutineMock(return_value=[])
+
+        p = pipeline.Pipeline(
+            id='test',
+            extractors=[CountingExtractor(id='test-extractor', config={})],
+            transform=transformer,
+            loaders=[],
+            max_in_flight=4,
+        )
+        await p.run()
+
+        assert [len(c[0][0]) for c in transformer.run_many.call_args_list] == [4, 4, 2]
+        assert len(p.budget) == 0
+
+    def test_streaming_memory_flat(self):
+        def peak(records, *args):
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.memory', str(records)] + list(args),
+                check=True, stdout=subprocess.PIPE, universal_newlines=True,
+            ).stdout
+            return int(output.split('peak_kib=')[1])
+
+        # A 20k record extract buffered in memory takes ~16MiB more than a 2k one
+        assert peak(20000) - peak(2000) < 4 * 1024
+        assert peak(20000, '--buffered') - peak(2000, '--buffered') > 8 * 1024
+
+    @pytest.mark.asyncio
+    async def test_run_metrics(self):
+        def value(metric, *labels):
+            return metric.labels(*labels)._value.get()
+
+        def count(histogram, *labels):
+            return sum(b.get() for b in histogram.labels(*labels)._buckets)
+
+        extractor = IncrementalExtractor(id='test-extractor', config={})
+        loaders = [plugin.Loader(id='test-loader', config={}), plugin.Loader(id='test-failing', config={})]
+        loaders[0].run = asynctest.CoroutineMock()
+        loaders[1].run = asynctest.CoroutineMock(side_effect=[ValueError()] + [None] * 5)
+        changes = cache.ChangeCache()
+
+        p = pipeline.Pipeline(
+            id='test-metrics',
+            extractors=[extractor],
+            transform=plugin.Transformer(id='YAMLTransformer', config={'id': '{id}'}),
+            loaders=loaders,
+            changes=changes,
+        )
+        with patch.object(extractor.timer, 'observe') as observe_mock:
+            await p.run()
+            await p.run()
+
+        assert observe_mock.call_count == 2
+        assert value(metrics.records_extracted, 'test-metrics', 'test-extractor') == 10
+        assert value(metrics.records_transformed, 'test-metrics', 'YAMLTransformer') == 10
+        assert value(metrics.records_loaded, 'test-metrics', 'test-loader') == 5
+        assert value(metrics.records_loaded, 'test-metrics', 'test-failing') == 5
+        assert value(metrics.records_failed, 'test-metrics', 'test-failing') == 1
+        assert value(metrics.records_skipped, 'test-metrics', 'test-loader') == 5
+        assert value(metrics.records_skipped, 'test-metrics', 'test-failing') == 4
+        assert count(metrics.stage_latency, 'test-metrics', 'extract') == 10
+        assert count(metrics.stage_latency, 'test-metrics', 'transform') == 10
+        assert count(metrics.stage_latency, 'test-metrics', 'load') == 10
+        assert count(metrics.pipeline_span, 'test-metrics') == 2
+        assert REGISTRY.get_sample_value('prophetess_records_in_flight', {'pipeline': 'test-metrics'}) == 0
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('batch_size', [None, 2])
+    async def test_dry_run_changes(self, tmp_path, batch_size):
+        path = str(tmp_path / 'changes.json')
+
+        class BatchLoader(plugin.Loader):
+            async def run_batch(self, records):
+                pass
+
+        def build(dry_run):
+            loader = (BatchLoader if batch_size else plugin.Loader)(id='test-loader', config={})
+            loader.run = asynctest.CoroutineMock()
+            loader.run_batch = asynctest.CoroutineMock()
+            p = pipeline.Pipeline(
+                id='test-dry',
+                extractors=[IncrementalExtractor(id='test-extractor', config={})],
+                transform=plugin.Transformer(id='YAMLTransformer', config={'id': '{id}'}),
+                loaders=[loader],
+                batch_size=batch_size,
+                changes=cache.ChangeCache(path=path),
+                dry_run=dry_run,
+            )
+            return p, loader
+
+        p, _ = build(dry_run=True)
+        await p.run()
+        await p.close()
+        assert len(p.changes) == 0
+
+        # the real run that follows loads everything the dry run didn't
+        p, loader = build(dry_run=False)
+        await p.run()
+        loaded = loader.run_batch.await_args_list if batch_size else loader.run.await_args_list
+        assert sum(len(c[0][0]) if batch_size else 1 for c in loaded) == 5
+
+    @pytest.mark.asyncio
+    async def test_run_staged_queue_depth(self):
+        depths = []
+        labels = {'pipeline': 'test-queues', 'stage': 'load'}
+
+        async def run(record):
+            depths.append(REGISTRY.get_sample_value('prophetess_queue_depth', labels))
+
+        loader = plugin.Loader(id='test-loader', config={})
+        loader.run = run
+
+        p = pipeline.Pipeline(
+            id='test-queues',
+            extractors=[IncrementalExtractor(id='test-extractor', config={})],
+            transform=plugin.Transformer(id='YAMLTransformer', config={'id': '{id}'}),
+            loaders=[loader],
+            stages={'load': {'queue_size': 10}},
+        )
+        await p.run()
+
+        assert len(depths) == 5
+        assert max(depths) > 0
+        assert REGISTRY.get_sample_value('prophetess_queue_depth', labels) == 0
+
     def test_str_fmt(self):
         p = pipeline.Pipeline(id='test', extractors=None, transform=None, loaders=None)
 
@@ -1,10 +1,12 @@
 """Unit tests for the prophetess.plugin package."""
 
 import asyncio
+from unittest.mock import call, patch
 
+import asynctest
 import pytest
 
-from prophetess import exceptions, metrics, plugin
+from prophetess import exceptions, metrics, plugin, sharding
 
 from .fixtures import FakePlugin
 
@@ -27,14 +29,23 @@ class TestPluginBase:
         p = FakePlugin(
             id='fake-plugin',
             config={'host': 'localhost', 'port': 5000},
-            labels=('lab1', 'lab2')
+            labels=('lab1', 'lab2', 'lab3')
         )
 
         assert p.id == 'fake-plugin'
         assert p.config == {'host': 'localhost', 'port': 5000}
         assert p._loop is None
         assert p.timer.histogram == metrics.plugin_latency
-        assert p.timer.labels == ('fake-plugin', 'lab1', 'lab2')
+        assert p.timer.labels == ('fake-plugin', 'lab1', 'lab2', 'lab3')
+
+    def test_init_with_bad_labels(self):
+        # Timers bind their labels up front, so a wrong count fails early
+        with pytest.raises(ValueError):
+            FakePlugin(
+                id='fake-plugin',
+                config={'host': 'localhost', 'port': 5000},
+                labels=('lab1', 'lab2'),
+            )
 
     def test_sanitize_config_error(self):
         with pytest.raises(exceptions.InvalidConfigurationException):
@@ -61,6 +72,41 @@ class TestPluginBase:
 
         assert p.loop == loop
 
+    @pytest.mark.asyncio
+    async def test_session(self):
+        p = FakePlugin(
+            id='fake-plugin',
+            config={'host': 'https://netbox.bro', 'port': 443},
+        )
+
+        with patch('prophetess.plugin.sessions') as sessions_mock:
+            assert p.session() is sessions_mock.get.return_value
+            sessions_mock.get.assert_called_once_with('https://netbox.bro')
+
+            p.session('https://other.bro/api')
+            sessions_mock.get.assert_called_with('https://other.bro/api')
+
+    def test_session_no_host(self):
+        p = plugin.PluginBase(
+            id='test-plugin',
+            config={},
+        )
+
+        with pytest.raises(exceptions.InvalidConfigurationException):
+            p.session()
+
+    def test_limiter(self):
+        p = plugin.PluginBase(
+            id='test-plugin',
+            config={},
+        )
+        assert p.limiter is None
+
+        p.service = 'netbox'
+        with patch('prophetess.plugin.limiters') as limiters_mock:
+            assert p.limiter is limiters_mock.get.return_value
+            limiters_mock.get.assert_called_once_with('netbox')
+
     @pytest.mark.asyncio
     async def test_close(self):
         p = plugin.PluginBase(
@@ -90,7 +136,76 @@ class TestExtractor:
         )
 
         with pytest.raises(NotImplementedError):
-            await extractor.run()
+            [r async for r in extractor.run()]
+
+    async def test_watermark(self):
+        extractor = plugin.Extractor(
+            id='test-extractor',
+            config={},
+        )
+
+        assert not extractor.incremental
+        with pytest.raises(NotImplementedError):
+            extractor.watermark({})
+
+    async def test_run_columns(self):
+        extractor = plugin.Extractor(
+            id='test-extractor',
+            config={},
+        )
+
+        with pytest.raises(NotImplementedError):
+            [c async for c in extractor.run_columns()]
+
+    async def test_columnar(self):
+        class ColumnExtractor(plugin.Extractor):
+            async def run_columns(self):
+                yield {}
+
+        assert not plugin.Extractor(id='test-extractor', config={}).columnar
+        assert ColumnExtractor(id='test-extractor', config={}).columnar
+
+    async def test_in_partition(self):
+        extractor = plugin.Extractor(id='test-extractor', config={})
+        assert not extractor.partitioned
+        assert extractor.in_partition('any')
+
+        extractor.partition = sharding.Partition(0, 2)
+        owned = [key for key in range(100) if extractor.in_partition(key)]
+        assert owned == [key for key in range(100) if sharding.Partition(0, 2).owns(key)]
+        assert 0 < len(owned) < 100
+
+
+@pytest.mark.asyncio
+class TestStreamingExtractor:
+
+    async def test_run(self):
+        class PagedExtractor(plugin.StreamingExtractor):
+            async def pages(self, watermark=None):
+                yield [{'id': 1}, {'id': 2}]
+                yield []
+                yield [{'id': watermark}]
+
+        extractor = PagedExtractor(id='test-extractor', config={})
+        assert [r async for r in extractor.run(watermark=3)] == [{'id': 1}, {'id': 2}, {'id': 3}]
+
+    async def test_pages(self):
+        extractor = plugin.StreamingExtractor(id='test-extractor', config={})
+
+        with pytest.raises(NotImplementedError):
+            [p async for p in extractor.pages()]
+
+    async def test_paginate(self):
+        extractor = plugin.StreamingExtractor(id='test-extractor', config={'host': 'https://netbox.bro'})
+
+        with patch('prophetess.plugin.paginate') as paginate_mock, \
+                patch('prophetess.plugin.sessions') as sessions_mock:
+            pages = extractor.paginate('https://netbox.bro/api/tenants/', results='records')
+
+        assert pages is paginate_mock.return_value
+        paginate_mock.assert_called_once_with(
+            sessions_mock.get.return_value, 'https://netbox.bro/api/tenants/', limiter=None, results='records',
+        )
 
 
 @pytest.mark.asyncio
@@ -105,6 +220,24 @@ class TestLoader:
         with pytest.raises(NotImplementedError):
             await loader.run({})
 
+    async def test_run_batch(self):
+        loader = plugin.Loader(
+            id='test-loader',
+            config={},
+        )
+        loader.run = asynctest.CoroutineMock()
+
+        await loader.run_batch([{'id': 1}, {'id': 2}])
+        loader.run.assert_has_awaits([call({'id': 1}), call({'id': 2})])
+
+    async def test_batching(self):
+        class BatchLoader(plugin.Loader):
+            async def run_batch(self, records):
+                pass
+
+        assert not plugin.Loader(id='test-loader', config={}).batching
+        assert BatchLoader(id='test-loader', config={}).batching
+
 
 class TestTransformer:
 
@@ -150,3 +283,50 @@ class TestTransformer:
             'host': 'localhost-1',
             'port': '5000',
         }]
+
+    @pytest.mark.asyncio
+    async def test_run_string_config(self):
+        transformer = plugin.Transformer(
+            id='test-transformer',
+            config='localhost-{host}',
+        )
+
+        assert transformer.template is None
+        vals = [t async for t in transformer.run({'host': 1})]
+        assert vals == ['localhost-1']
+
+    @pytest.mark.asyncio
+    async def test_run_custom_format(self):
+        class UpperTransformer(plugin.Transformer):
+            @staticmethod
+            def format(string, mapping):
+                return plugin.Transformer.format(string, mapping).upper()
+
+        transformer = UpperTransformer(id='test-transformer', config={'name': '{name}'})
+
+        assert transformer.template is None
+        assert not transformer.columnar
+        vals = [t async for t in transformer.run({'name': 'acme'})]
+        assert vals == [{'name': 'ACME'}]
+
+    @pytest.mark.asyncio
+    async def test_run_custom_parse(self):
+        class StripTransformer(plugin.Transformer):
+            def parse(self, keys, values):
+                if isinstance(keys, str):
+                    return self.format(keys, values).strip()
+                return super().parse(keys, values)
+
+        transformer = StripTransformer(id='test-transformer', config={'name': ' {name} '})
+
+        vals = [t async for t in transformer.run({'name': 'acme'})]
+        assert vals == [{'name': 'acme'}]
+
+    def test_columnar(self):
+        class CustomTransformer(plugin.Transformer):
+            async def run(self, data):
+                yield data
+
+        assert plugin.Transformer(id='test-transformer', config={'name': '{Name}'}).columnar
+        assert not plugin.Transformer(id='test-transformer', config='{Name}').columnar
+        assert not CustomTransformer(id='test-transformer', config={'name': '{Name}'}).columnar
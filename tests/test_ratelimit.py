@@ -0,0 +1,196 @@
+"""Unit tests for the prophetess.ratelimit package."""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from prophetess import exceptions, ratelimit
+
+
+class TestTokenBucket:
+
+    @pytest.mark.asyncio
+    async def test_burst(self):
+        bucket = ratelimit.TokenBucket(rate=1, burst=3)
+
+        with patch('prophetess.ratelimit.asyncio.sleep') as sleep_mock:
+            for _ in range(3):
+                await bucket.acquire()
+            sleep_mock.assert_not_called()
+
+        assert bucket.tokens < 1
+
+    @pytest.mark.asyncio
+    async def test_waits_for_refill(self):
+        bucket = ratelimit.TokenBucket(rate=100, burst=1)
+
+        start = asyncio.get_event_loop().time()
+        for _ in range(4):
+            await bucket.acquire()
+
+        assert asyncio.get_event_loop().time() - start >= 0.02
+
+    def test_default_burst(self):
+        assert ratelimit.TokenBucket(rate=20).burst == 20
+        assert ratelimit.TokenBucket(rate=0.5).burst == 1
+
+
+@pytest.mark.asyncio
+class TestLimiter:
+
+    async def test_concurrency(self):
+        limiter = ratelimit.Limiter('netbox', concurrency=2)
+        active = []
+        peak = []
+
+        async def call():
+            async with limiter:
+                active.append(1)
+                peak.append(len(active))
+                await asyncio.sleep(0.01)
+                active.pop()
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        assert max(peak) == 2
+        assert limiter.bucket is None
+
+    async def test_backoff(self):
+        limiter = ratelimit.Limiter('netbox', rate=100, adaptive=True)
+
+        with pytest.raises(exceptions.ServiceError):
+            async with limiter:
+                raise exceptions.ServiceError('slow down', status=429)
+
+        assert limiter.bucket.rate == 50
+
+    async def test_backoff_floor(self):
+        limiter = ratelimit.Limiter('netbox', rate=1, adaptive=True, min_rate=0.4, window=0)
+
+        limiter.backoff()
+        limiter.backoff()
+        assert limiter.bucket.rate == 0.4
+
+    async def test_no_backoff_on_client_error(self):
+        limiter = ratelimit.Limiter('netbox', rate=100, adaptive=True)
+
+        with pytest.raises(exceptions.ServiceError):
+            async with limiter:
+                raise exceptions.ServiceError('bad request', status=400)
+
+        with pytest.raises(exceptions.ServiceError):
+            async with limiter:
+                raise exceptions.ServiceError('slug already exists')
+
+        with pytest.raises(ValueError):
+            async with limiter:
+                raise ValueError()
+
+        assert limiter.bucket.rate == 100
+
+    async def test_recover(self):
+        limiter = ratelimit.Limiter('netbox', rate=100, adaptive=True, increase=10, window=0)
+        limiter.set_rate(80)
+
+        async with limiter:
+            pass
+        assert limiter.bucket.rate == 90
+
+        for _ in range(3):
+            async with limiter:
+                pass
+        assert limiter.bucket.rate == 100
+
+    @patch('prophetess.ratelimit.time.monotonic')
+    async def test_backoff_cooldown(self, monotonic_mock):
+        monotonic_mock.return_value = 1000
+        limiter = ratelimit.Limiter('netbox', rate=100, adaptive=True, window=2)
+
+        async def throttled():
+            async with limiter:
+                raise exceptions.ServiceError('slow down', status=429)
+
+        results = await asyncio.gather(*(throttled() for _ in range(5)), return_exceptions=True)
+        assert all(isinstance(r, exceptions.ServiceError) for r in results)
+        assert limiter.bucket.rate == 50
+
+        monotonic_mock.return_value = 1002
+        limiter.backoff()
+        assert limiter.bucket.rate == 25
+
+    @patch('prophetess.ratelimit.time.monotonic')
+    async def test_recover_per_window(self, monotonic_mock):
+        monotonic_mock.return_value = 1000
+        limiter = ratelimit.Limiter('netbox', rate=100, adaptive=True, increase=10, window=2)
+        limiter.set_rate(50)
+
+        for _ in range(5):
+            limiter.recover()
+        assert limiter.bucket.rate == 60
+
+        monotonic_mock.return_value = 1002
+        for _ in range(5):
+            limiter.recover()
+        assert limiter.bucket.rate == 70
+
+        # no increase until a window has passed since backing off
+        monotonic_mock.return_value = 1003
+        limiter.backoff()
+        limiter.recover()
+        assert limiter.bucket.rate == 35
+
+        monotonic_mock.return_value = 1005
+        limiter.recover()
+        assert limiter.bucket.rate == 45
+
+    async def test_not_adaptive(self):
+        limiter = ratelimit.Limiter('netbox', rate=100)
+
+        with pytest.raises(exceptions.ServiceError):
+            async with limiter:
+                raise exceptions.ServiceError('slow down', status=503)
+
+        assert limiter.bucket.rate == 100
+
+    async def test_release_on_cancel(self):
+        limiter = ratelimit.Limiter('netbox', rate=0.1, burst=1, concurrency=1)
+
+        async with limiter:
+            pass
+
+        task = asyncio.ensure_future(limiter.__aenter__())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert not limiter.semaphore.locked()
+
+    async def test_str_fmt(self):
+        assert str(ratelimit.Limiter('netbox')) == 'Limiter(netbox)'
+
+
+class TestLimiters:
+
+    def test_configure(self):
+        limiters = ratelimit.Limiters()
+        limiters.configure({
+            'netbox': {'rate': 20, 'burst': 40, 'concurrency': 4, 'adaptive': True},
+            'vault': None,
+        })
+
+        netbox = limiters.get('netbox')
+        assert netbox.bucket.rate == 20
+        assert netbox.bucket.burst == 40
+        assert netbox.concurrency == 4
+        assert netbox.adaptive
+        assert limiters.get('vault').bucket is None
+        assert limiters.get('other') is None
+
+    def test_limit(self):
+        class Plugin:
+            limiter = None
+
+        assert ratelimit.limit(Plugin()) is ratelimit.UNLIMITED
+        Plugin.limiter = ratelimit.Limiter('netbox')
+        assert ratelimit.limit(Plugin()) is Plugin.limiter
@@ -0,0 +1,141 @@
+"""Unit tests for the prophetess.reload package."""
+
+import asyncio
+import copy
+
+import asynctest
+import pytest
+
+from prophetess import reload
+
+CONFIG = {
+    'interval': 90,
+    'extractors': {
+        'sites': {'plugin': 'List', 'config': {'records': []}},
+        'devices': {'plugin': 'List', 'config': {'records': []}},
+    },
+    'loaders': {
+        'tenants': {'plugin': 'Recording', 'config': {}},
+    },
+    'transformers': {
+        'hash': {'plugin': 'Hashing', 'config': {}},
+    },
+    'pipelines': {
+        'site-sync': {'extractors': ['sites'], 'loaders': ['tenants'], 'transform': {'name': '{Name}'}},
+        'device-sync': {'extractors': ['devices'], 'loaders': ['tenants'], 'transform': 'hash'},
+    },
+}
+
+
+def test_definition():
+    d = reload.definition(CONFIG, 'device-sync')
+
+    assert d['pipeline'] is CONFIG['pipelines']['device-sync']
+    assert d['extractors'] == {'devices': CONFIG['extractors']['devices']}
+    assert d['loaders'] == {'tenants': CONFIG['loaders']['tenants']}
+    assert d['transformer'] == CONFIG['transformers']['hash']
+    assert d['interval'] == 90
+
+
+def test_diff_unchanged():
+    assert reload.diff(CONFIG, copy.deepcopy(CONFIG)) == {
+        'added': [],
+        'changed': [],
+        'removed': [],
+        'unchanged': ['site-sync', 'device-sync'],
+    }
+
+
+def test_diff():
+    cfg = copy.deepcopy(CONFIG)
+    cfg['extractors']['devices']['config']['records'] = [{'id': 1}]
+    cfg['pipelines']['rack-sync'] = cfg['pipelines'].pop('site-sync')
+
+    assert reload.diff(CONFIG, cfg) == {
+        'added': ['rack-sync'],
+        'changed': ['device-sync'],
+        'removed': ['site-sync'],
+        'unchanged': [],
+    }
+
+
+@pytest.mark.parametrize('section', ['loaders', 'transformers'])
+def test_diff_plugin(section):
+    cfg = copy.deepcopy(CONFIG)
+    for data in cfg[section].values():
+        data['config']['new'] = True
+
+    changes = reload.diff(CONFIG, cfg)
+    assert changes['changed'] == (['site-sync', 'device-sync'] if section == 'loaders' else ['device-sync'])
+
+
+def test_diff_shared_extractor():
+    cfg = copy.deepcopy(CONFIG)
+    cfg['pipelines']['rack-sync'] = {'extractors': ['sites'], 'loaders': ['tenants'], 'transform': {'rack': '{Name}'}}
+    new = copy.deepcopy(cfg)
+    new['pipelines']['rack-sync']['transform'] = {'rack': '{Name}!'}
+
+    # site-sync shares sites with rack-sync, device-sync shares nothing
+    assert reload.diff(cfg, new) == {
+        'added': [],
+        'changed': ['site-sync', 'rack-sync'],
+        'removed': [],
+        'unchanged': ['device-sync'],
+    }
+    assert reload.diff(cfg, CONFIG)['changed'] == ['site-sync']
+
+
+def test_diff_interval():
+    cfg = dict(CONFIG, interval=30)
+    assert reload.diff(CONFIG, cfg)['changed'] == ['site-sync', 'device-sync']
+
+
+class TestConfigWatcher:
+
+    def test_changed(self, tmp_path):
+        path = tmp_path / 'pipeline.yaml'
+        path.write_text('pipelines: {}')
+        w = reload.ConfigWatcher(str(path), asynctest.CoroutineMock())
+        assert not w.changed()
+
+        path.write_text('pipelines: {a: {}}')
+        assert w.changed()
+        assert not w.changed()
+
+    def test_changed_same_contents(self, tmp_path):
+        path = tmp_path / 'pipeline.yaml'
+        path.write_text('pipelines: {}')
+        w = reload.ConfigWatcher(str(path), asynctest.CoroutineMock())
+
+        path.write_text('pipelines: {}')
+        w._stat = None
+        assert not w.changed()
+
+    def test_changed_missing(self, tmp_path):
+        path = tmp_path / 'pipeline.yaml'
+        path.write_text('pipelines: {}')
+        w = reload.ConfigWatcher(str(path), asynctest.CoroutineMock())
+
+        path.unlink()
+        assert not w.changed()
+        path.write_text('pipelines: {b: {}}')
+        assert w.changed()
+
+    @pytest.mark.asyncio
+    async def test_run(self, tmp_path):
+        path = tmp_path / 'pipeline.yaml'
+        path.write_text('pipelines: {}')
+        callback = asynctest.CoroutineMock(side_effect=[ValueError('bad config'), None])
+        w = reload.ConfigWatcher(str(path), callback, interval=0.01)
+
+        task = asyncio.ensure_future(w.run())
+        path.write_text('pipelines: {a: {}}')
+        await asyncio.sleep(0.05)
+        assert callback.await_count == 1
+
+        # a failed reload doesn't stop the watcher
+        path.write_text('pipelines: {b: {}}')
+        await asyncio.sleep(0.05)
+        assert callback.await_count == 2
+
+        task.cancel()
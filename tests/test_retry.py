@@ -0,0 +1,49 @@
+"""Unit tests for the prophetess.retry package."""
+
+import asyncio
+
+import aiohttp
+import pytest
+
+from prophetess import exceptions, retry
+
+
+class TestRetry:
+
+    def test_delays(self):
+        r = retry.Retry(attempts=5, base=1, max=4)
+
+        delays = list(r.delays())
+        assert len(delays) == 4
+        for delay, cap in zip(delays, [1, 2, 4, 4]):
+            assert 0 <= delay <= cap
+
+    def test_no_retries(self):
+        assert list(retry.Retry().delays()) == []
+
+    @pytest.mark.parametrize('cfg,attempts,base,max_', [
+        (None, 1, 1, 30),
+        (3, 3, 1, 30),
+        ({'attempts': 4, 'base': 0.5, 'max': 10}, 4, 0.5, 10),
+    ])
+    def test_from_config(self, cfg, attempts, base, max_):
+        r = retry.Retry.from_config(cfg)
+
+        assert r.attempts == attempts
+        assert r.base == base
+        assert r.max == max_
+
+
+@pytest.mark.parametrize('exc,expected', [
+    (exceptions.ServiceError('down'), False),
+    (exceptions.ServiceError('throttled', status=429), True),
+    (exceptions.ServiceError('unavailable', status=503), True),
+    (exceptions.ServiceError('bad request', status=400), False),
+    (exceptions.InvalidConfigurationException('bad config'), False),
+    (aiohttp.ClientConnectionError(), True),
+    (asyncio.TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (KeyError('id'), False),
+])
+def test_retryable(exc, expected):
+    assert retry.retryable(exc) is expected
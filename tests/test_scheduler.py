@@ -0,0 +1,212 @@
+"""Unit tests for the prophetess.scheduler package."""
+
+import asyncio
+import datetime
+from unittest.mock import patch
+
+import asynctest
+import pytest
+
+from prophetess import exceptions, metrics, pipeline, scheduler
+
+
+def dt(*args):
+    return datetime.datetime(*args)
+
+
+class TestCron:
+
+    @pytest.mark.parametrize('expression,after,expected', [
+        ('* * * * *', dt(2020, 1, 1, 10, 30, 15), dt(2020, 1, 1, 10, 31)),
+        ('*/15 * * * *', dt(2020, 1, 1, 10, 30), dt(2020, 1, 1, 10, 45)),
+        ('*/15 * * * *', dt(2020, 1, 1, 10, 50), dt(2020, 1, 1, 11, 0)),
+        ('5 4 * * *', dt(2020, 1, 1, 10, 0), dt(2020, 1, 2, 4, 5)),
+        ('0 0 1 * *', dt(2020, 1, 15), dt(2020, 2, 1)),
+        ('0 0 31 * *', dt(2020, 2, 1), dt(2020, 3, 31)),
+        ('0 12 * * 1-5', dt(2020, 1, 4, 13, 0), dt(2020, 1, 6, 12, 0)),
+        ('0 12 * * 7', dt(2020, 1, 1), dt(2020, 1, 5, 12, 0)),
+        ('0 0 29 2 *', dt(2021, 1, 1), dt(2024, 2, 29)),
+        ('30 9,17 * * *', dt(2020, 1, 1, 10, 0), dt(2020, 1, 1, 17, 30)),
+        ('0 0 13 * 5', dt(2020, 1, 1), dt(2020, 1, 3)),
+        ('0 0 1 6-8/2 *', dt(2020, 1, 1), dt(2020, 6, 1)),
+        ('0 0 1 6-8/2 *', dt(2020, 6, 2), dt(2020, 8, 1)),
+        ('5/20 * * * *', dt(2020, 1, 1, 0, 30), dt(2020, 1, 1, 0, 45)),
+    ])
+    def test_next(self, expression, after, expected):
+        assert scheduler.Cron(expression).next(after) == expected
+
+    @pytest.mark.parametrize('expression', [
+        '* * * *',
+        '60 * * * *',
+        '* 24 * * *',
+        '* * 0 * *',
+        '*/0 * * * *',
+        '5-1 * * * *',
+        'a * * * *',
+    ])
+    def test_invalid(self, expression):
+        with pytest.raises(exceptions.InvalidConfigurationException):
+            scheduler.Cron(expression)
+
+    def test_never(self):
+        with pytest.raises(exceptions.InvalidConfigurationException):
+            scheduler.Cron('0 0 31 2 *').next(dt(2020, 1, 1))
+
+
+class TestIntervalTrigger:
+
+    def test_fixed_rate(self):
+        t = scheduler.IntervalTrigger(60)
+        assert t.delay(now=100) == 0
+        # a run taking 10 seconds doesn't delay the next one
+        assert t.delay(now=110) == 50
+        assert t.delay(now=160) == 60
+
+    def test_missed_ticks(self):
+        t = scheduler.IntervalTrigger(60)
+        assert t.delay(now=100) == 0
+        # the ticks at 160 and 220 are dropped, the one at 280 runs late
+        assert t.delay(now=290) == 0
+        assert t.delay(now=290) == 50
+
+    @patch('random.uniform')
+    def test_jitter(self, uniform_mock):
+        uniform_mock.return_value = 5
+        t = scheduler.IntervalTrigger(60, jitter=10)
+
+        assert t.delay(now=100) == 5
+        assert t.delay(now=100) == 65
+        uniform_mock.assert_called_with(0, 10)
+
+
+class TestCronTrigger:
+
+    def test_delay(self):
+        t = scheduler.CronTrigger('*/15 * * * *')
+        assert t.delay(now=dt(2020, 1, 1, 10, 10)) == 300
+
+    def test_delay_no_repeat(self):
+        t = scheduler.CronTrigger('*/15 * * * *')
+        assert t.delay(now=dt(2020, 1, 1, 10, 14, 59)) == 1
+        # woken a little early, the same minute isn't scheduled again
+        assert t.delay(now=dt(2020, 1, 1, 10, 14, 59, 500000)) == 900.5
+
+
+def test_trigger_for():
+    p = pipeline.Pipeline(id='p', extractors=[], transform=None, loaders=[])
+    t = scheduler.trigger_for(p, 90)
+    assert isinstance(t, scheduler.IntervalTrigger)
+    assert t.interval == 90
+    assert t.jitter == 0
+
+    p = pipeline.Pipeline(id='p', extractors=[], transform=None, loaders=[], interval=30, jitter=5)
+    t = scheduler.trigger_for(p, 90)
+    assert t.interval == 30
+    assert t.jitter == 5
+
+    p = pipeline.Pipeline(id='p', extractors=[], transform=None, loaders=[], schedule='* * * * *')
+    assert isinstance(scheduler.trigger_for(p, 90), scheduler.CronTrigger)
+
+
+class TestScheduler:
+
+    def test_init_invalid_schedule(self):
+        pipelines = pipeline.Pipelines()
+        pipelines.append(pipeline.Pipeline(id='p', extractors=[], transform=None, loaders=[], schedule='bad'))
+
+        with pytest.raises(exceptions.InvalidConfigurationException):
+            scheduler.Scheduler(pipelines, asynctest.CoroutineMock())
+
+    @pytest.mark.asyncio
+    async def test_run(self):
+        fast = pipeline.Pipeline(id='sched-fast', extractors=[], transform=None, loaders=[], interval=0.01)
+        slow = pipeline.Pipeline(id='sched-slow', extractors=[], transform=None, loaders=[], interval=0.01)
+        pipelines = pipeline.Pipelines()
+        pipelines.append(fast)
+        pipelines.append(slow)
+        runs = []
+
+        async def runner(p):
+            async with p.semaphore:
+                runs.append(p.id)
+                if p is slow:
+                    await asyncio.sleep(1)
+
+        skipped = metrics.pipeline_skipped.labels('sched-slow')._value.get()
+        s = scheduler.Scheduler(pipelines, runner)
+        task = asyncio.ensure_future(s.run())
+        await asyncio.sleep(0.1)
+
+        assert runs.count('sched-fast') > 3
+        assert runs.count('sched-slow') == 1
+        assert metrics.pipeline_skipped.labels('sched-slow')._value.get() > skipped
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        assert not s.running
+
+    @pytest.mark.asyncio
+    async def test_add_remove(self):
+        pipelines = pipeline.Pipelines()
+        pipelines.append(pipeline.Pipeline(id='sched-old', extractors=[], transform=None, loaders=[], interval=0.01))
+        runs = []
+
+        async def runner(p):
+            runs.append(p.id)
+
+        s = scheduler.Scheduler(pipelines, runner)
+        task = asyncio.ensure_future(s.run())
+        await asyncio.sleep(0.05)
+
+        s.remove('sched-old')
+        s.add(pipeline.Pipeline(id='sched-new', extractors=[], transform=None, loaders=[], interval=0.01))
+        assert set(s.triggers) == {'sched-new'}
+        runs.clear()
+        await asyncio.sleep(0.05)
+
+        assert set(runs) == {'sched-new'}
+        with pytest.raises(exceptions.InvalidConfigurationException):
+            s.add(pipeline.Pipeline(id='sched-new', extractors=[], transform=None, loaders=[], schedule='bad'))
+        assert 'sched-new' in s.schedules
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    @pytest.mark.asyncio
+    async def test_stop(self):
+        p = pipeline.Pipeline(id='sched-stop', extractors=[], transform=None, loaders=[], interval=0.01)
+        pipelines = pipeline.Pipelines()
+        pipelines.append(p)
+        started = asyncio.Event()
+
+        async def runner(p):
+            started.set()
+            await asyncio.sleep(0.05)
+
+        s = scheduler.Scheduler(pipelines, runner)
+        task = asyncio.ensure_future(s.run())
+        await started.wait()
+
+        s.stop()
+        await asyncio.wait_for(task, 1)
+        assert not s.schedules
+        # runs in progress are left to finish
+        assert len(s.running) == 1
+        await asyncio.gather(*s.running)
+
+        s.add(p)
+        assert not s.schedules
+
+    @pytest.mark.asyncio
+    async def test_run_error(self):
+        p = pipeline.Pipeline(id='sched-broken', extractors=[], transform=None, loaders=[], interval=0.01)
+        pipelines = pipeline.Pipelines()
+        pipelines.append(p)
+        s = scheduler.Scheduler(pipelines, asynctest.CoroutineMock())
+        s.triggers['sched-broken'] = None
+
+        with pytest.raises(AttributeError):
+            await asyncio.wait_for(s.run(), 1)
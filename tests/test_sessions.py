@@ -0,0 +1,99 @@
+"""Unit tests for the prophetess.sessions package."""
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from prophetess import exceptions, ratelimit, sessions
+
+
+@pytest.mark.parametrize('url,expected', [
+    ('https://netbox.bro/api/dcim/', 'https://netbox.bro'),
+    ('https://netbox.bro', 'https://netbox.bro'),
+    ('http://netbox.bro:8000/api', 'http://netbox.bro:8000'),
+    ('netbox.bro', 'https://netbox.bro'),
+])
+def test_key(url, expected):
+    assert sessions.Sessions.key(url) == expected
+
+
+@pytest.mark.asyncio
+class TestSessions:
+
+    async def test_get_shared(self):
+        s = sessions.Sessions()
+        first = s.get('https://netbox.bro/api/tenants/')
+
+        assert s.get('https://netbox.bro/api/sites/') is first
+        assert s.get('https://other.bro/api/') is not first
+        assert len(s) == 2
+        await s.close()
+
+    async def test_configure(self):
+        s = sessions.Sessions(limit=5)
+        s.configure(limit_per_host=2, ttl_dns_cache=60, timeout=10)
+        session = s.get('https://netbox.bro')
+
+        assert session.connector.limit == 5
+        assert session.connector.limit_per_host == 2
+        assert session.connector.use_dns_cache
+        assert session._timeout.total == 10
+        await s.close()
+
+    async def test_close(self):
+        s = sessions.Sessions()
+        session = s.get('https://netbox.bro')
+
+        await s.close()
+        assert session.closed
+        assert len(s) == 0
+
+        # closed sessions are replaced
+        assert s.get('https://netbox.bro') is not session
+        await s.close()
+
+
+async def serve_api() -> TestServer:
+    async def tenants(request):
+        offset = int(request.query.get('offset', 0))
+        body = {'results': [{'id': i} for i in range(offset, min(offset + 2, 5))]}
+        if offset + 2 < 5:
+            body['next'] = '/api/tenants/?offset={}'.format(offset + 2)
+        return web.json_response(body)
+
+    async def broken(request):
+        return web.Response(status=503, text='maintenance')
+
+    app = web.Application()
+    app.router.add_get('/api/tenants/', tenants)
+    app.router.add_get('/api/broken/', broken)
+
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+@pytest.mark.asyncio
+class TestPaginate:
+
+    async def test_pages(self):
+        api = await serve_api()
+        s = sessions.Sessions()
+        url = str(api.make_url('/api/tenants/'))
+        limiter = ratelimit.Limiter('netbox', concurrency=1)
+
+        pages = [p async for p in sessions.paginate(s.get(url), url, limiter=limiter)]
+        assert pages == [[{'id': 0}, {'id': 1}], [{'id': 2}, {'id': 3}], [{'id': 4}]]
+        await s.close()
+        await api.close()
+
+    async def test_error(self):
+        api = await serve_api()
+        s = sessions.Sessions()
+        url = str(api.make_url('/api/broken/'))
+
+        with pytest.raises(exceptions.ServiceError) as e:
+            [p async for p in sessions.paginate(s.get(url), url)]
+        assert e.value.status == 503
+        await s.close()
+        await api.close()
@@ -0,0 +1,161 @@
+"""Unit tests for the prophetess.sharding package."""
+
+import asyncio
+import collections
+import multiprocessing
+from unittest.mock import patch
+
+import pytest
+
+from prophetess import exceptions, sharding
+from prophetess.app import Prophetess
+
+from . import fixtures
+
+KEYS = ['pipeline-{}'.format(i) for i in range(1000)]
+
+
+def test_position():
+    assert sharding.position('site-sync') == sharding.position('site-sync')
+    assert sharding.position('site-sync') != sharding.position('rack-sync')
+
+
+def test_partition():
+    partitions = [sharding.Partition(i, 3) for i in range(3)]
+    for key in KEYS + list(range(100)):
+        assert sum(p.owns(key) for p in partitions) == 1
+
+
+class TestHashRing:
+
+    def test_owner(self):
+        ring = sharding.HashRing(4)
+        owners = collections.Counter(ring.owner(key) for key in KEYS)
+
+        assert set(owners) == {0, 1, 2, 3}
+        # roughly even, the points keep any replica from getting a big arc
+        assert all(150 < n < 350 for n in owners.values())
+
+    def test_consistent(self):
+        before = sharding.HashRing(4)
+        after = sharding.HashRing(5)
+
+        moved = [key for key in KEYS if before.owner(key) != after.owner(key)]
+        assert all(after.owner(key) == 4 for key in moved)
+        assert len(moved) < len(KEYS) / 3
+
+
+class TestShard:
+
+    def test_owns(self):
+        shards = [sharding.Shard(i, 3) for i in range(3)]
+        for key in KEYS:
+            assert sum(s.owns(key) for s in shards) == 1
+
+        assert shards[1].partition == sharding.Partition(1, 3)
+        assert str(shards[1]) == 'Shard(1/3)'
+
+    @pytest.mark.parametrize('index', [-1, 3])
+    def test_invalid_index(self, index):
+        with pytest.raises(exceptions.InvalidConfigurationException):
+            sharding.Shard(index, 3)
+
+
+def test_claim(tmp_path):
+    first = sharding.claim(str(tmp_path), 2)
+    second = sharding.claim(str(tmp_path), 2)
+    assert (first.index, second.index) == (0, 1)
+
+    with pytest.raises(exceptions.InvalidConfigurationException):
+        sharding.claim(str(tmp_path), 2)
+
+    first.release()
+    first.release()
+    assert sharding.claim(str(tmp_path), 2).index == 0
+    second.release()
+
+
+def test_shard_for(tmp_path):
+    assert sharding.shard_for(None, 1, directory=str(tmp_path)) is None
+    assert sharding.shard_for(2, 3, directory=str(tmp_path)).index == 2
+
+    shard = sharding.shard_for(None, 3, directory=str(tmp_path))
+    assert shard.index == 0
+    assert shard.lease is not None
+    shard.release()
+
+
+CONFIG = {
+    'extractors': {
+        'sites': {'plugin': 'List', 'config': {'records': [{'id': 0, 'Name': 'site'}]}},
+        'devices': {
+            'plugin': 'PartitionedList',
+            'config': {'records': [{'id': i, 'Name': 'device-{}'.format(i)} for i in range(30)]},
+        },
+    },
+    'loaders': {
+        'tenants': {'plugin': 'Recording', 'config': {}},
+    },
+    'pipelines': dict(
+        {
+            'pipe-{}'.format(i): {'extractors': ['sites'], 'loaders': ['tenants'], 'transform': {'pipeline': str(i)}}
+            for i in range(10)
+        },
+        **{
+            'device-sync': {
+                'extractors': ['devices'],
+                'loaders': ['tenants'],
+                'transform': {'device': '{Name}'},
+                'partitioned': True,
+            },
+        },
+    ),
+}
+
+
+def replica(directory, barrier, results):
+    """Run every pipeline of one replica once, reporting what it loaded"""
+    shard = sharding.claim(directory, 3)
+    # hold the lease until every replica has claimed one
+    barrier.wait()
+
+    fixtures.RecordingLoader.loaded = []
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    mage = Prophetess(CONFIG, shard)
+    loop.run_until_complete(mage.run())
+    loop.run_until_complete(mage.close())
+
+    results.put((shard.index, list(mage.pipelines), fixtures.RecordingLoader.loaded))
+    barrier.wait()
+
+
+def test_replicas(tmp_path):
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(3)
+    results = ctx.Queue()
+
+    with patch.dict('prophetess.config.PLUGINS', {'list': fixtures, 'partitionedlist': fixtures,
+                                                  'recording': fixtures}), \
+            patch('prophetess.pipeline.STATE_DIR', str(tmp_path)):
+        processes = [ctx.Process(target=replica, args=(str(tmp_path / 'replicas'), barrier, results))
+                     for _ in range(3)]
+        for p in processes:
+            p.start()
+        replicas = sorted(results.get(timeout=30) for _ in processes)
+        for p in processes:
+            p.join(timeout=30)
+            assert p.exitcode == 0
+
+    assert [index for index, _, _ in replicas] == [0, 1, 2]
+
+    # every pipeline runs on one replica, except partitioned ones which run on all
+    pipelines = collections.Counter(name for _, names, _ in replicas for name in names)
+    assert pipelines.pop('device-sync') == 3
+    assert set(pipelines) == {'pipe-{}'.format(i) for i in range(10)}
+    assert set(pipelines.values()) == {1}
+
+    # and partitioned extractors split their records between the replicas
+    devices = [r['device'] for _, _, loaded in replicas for r in loaded if 'device' in r]
+    assert sorted(devices) == sorted('device-{}'.format(i) for i in range(30))
+    assert all(any('device' in r for r in loaded) for _, _, loaded in replicas)
@@ -0,0 +1,69 @@
+"""Unit tests for the prophetess.spool package."""
+
+from prophetess import metrics, spool
+
+
+class TestSpool:
+
+    def test_append_take(self, tmp_path):
+        s = spool.Spool(str(tmp_path / 'spool' / 'loader.jsonl'), labels=('test', 'loader'))
+
+        assert len(s) == 0
+        assert s.take() == []
+
+        assert s.append([{'id': 1}, {'id': 2}]) == 2
+        assert s.append([{'id': 3}]) == 1
+        assert len(s) == 3
+
+        assert s.take() == [{'id': 1}, {'id': 2}, {'id': 3}]
+        assert len(s) == 0
+        assert not (tmp_path / 'spool' / 'loader.jsonl').exists()
+
+        s.done()
+        assert not (tmp_path / 'spool' / 'loader.jsonl.replaying').exists()
+        assert s.take() == []
+
+    def test_persisted(self, tmp_path):
+        path = str(tmp_path / 'loader.jsonl')
+        spool.Spool(path, labels=('test', 'loader')).append([{'id': 1}, {'id': 2}])
+
+        s = spool.Spool(path, labels=('test', 'loader'))
+        assert len(s) == 2
+        assert s.take() == [{'id': 1}, {'id': 2}]
+
+    def test_take_unfinished(self, tmp_path):
+        path = str(tmp_path / 'loader.jsonl')
+        s = spool.Spool(path, labels=('test', 'loader'))
+        s.append([{'id': 1}, {'id': 2}])
+        assert s.take() == [{'id': 1}, {'id': 2}]
+
+        # the process died before the replay was done, and more were spooled
+        s = spool.Spool(path, labels=('test', 'loader'))
+        s.append([{'id': 3}])
+        assert s.take() == [{'id': 1}, {'id': 2}, {'id': 3}]
+        assert s.take() == [{'id': 1}, {'id': 2}, {'id': 3}]
+
+        s.done()
+        assert s.take() == []
+
+    def test_bounded(self, tmp_path):
+        labels = ('test-bounded', 'loader')
+        s = spool.Spool(str(tmp_path / 'loader.jsonl'), max_size=3, labels=labels)
+
+        assert s.append([{'id': 1}, {'id': 2}]) == 2
+        assert s.append([{'id': 3}, {'id': 4}]) == 1
+        assert s.append([{'id': 5}]) == 0
+
+        assert len(s) == 3
+        assert metrics.spool_dropped.labels(*labels)._value.get() == 2
+        assert metrics.spooled.labels(*labels)._value.get() == 3
+        assert metrics.spool_size.labels(*labels)._value.get() == 3
+
+    def test_unreadable_record(self, tmp_path):
+        path = tmp_path / 'loader.jsonl'
+        path.write_text('{"id": 1}\n{"id": \n{"id": 3}\n')
+
+        assert spool.Spool(str(path), labels=('test', 'loader')).take() == [{'id': 1}, {'id': 3}]
+
+    def test_str_fmt(self):
+        assert str(spool.Spool('/tmp/loader.jsonl', labels=('test', 'loader'))) == 'Spool(/tmp/loader.jsonl)'
@@ -0,0 +1,49 @@
+"""Unit tests for the prophetess.state package."""
+
+import json
+
+from prophetess import state
+
+
+class TestStateStore:
+
+    def test_get_missing_file(self, tmp_path):
+        s = state.StateStore(str(tmp_path / 'state.json'))
+        assert s.get('key') is None
+        assert s.get('key', 'default') == 'default'
+
+    def test_save_and_load(self, tmp_path):
+        path = tmp_path / 'nested' / 'state.json'
+        s = state.StateStore(str(path))
+        s.set('key', '2020-01-01T00:00:00Z')
+        s.save()
+
+        assert json.loads(path.read_text()) == {'key': '2020-01-01T00:00:00Z'}
+        assert not (tmp_path / 'nested' / 'state.json.tmp').exists()
+        assert state.StateStore(str(path)).get('key') == '2020-01-01T00:00:00Z'
+
+    def test_save_shared_file(self, tmp_path):
+        path = str(tmp_path / 'state.json')
+        old = state.StateStore(path)
+        old.set('p1/e', 1)
+        old.set('p2/e', 2)
+        old.save()
+
+        # a second store on the same file, as after a reload
+        new = state.StateStore(path)
+        new.set('p2/e', 4)
+        new.save()
+
+        old.set('p1/e', 3)
+        old.save()
+        assert json.loads((tmp_path / 'state.json').read_text()) == {'p1/e': 3, 'p2/e': 4}
+
+    def test_load_corrupt_file(self, tmp_path):
+        path = tmp_path / 'state.json'
+        path.write_text('{not json')
+
+        s = state.StateStore(str(path))
+        assert s.get('key') is None
+
+    def test_str_fmt(self):
+        assert str(state.StateStore('/tmp/state.json')) == 'StateStore(/tmp/state.json)'
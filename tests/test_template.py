@@ -0,0 +1,156 @@
+"""Unit tests for the prophetess.template package."""
+
+import pytest
+
+from prophetess import plugin, template
+
+RECORD = {
+    'Id': 'a01',
+    'Name': 'Vapor IO',
+    'Count': 42,
+    'Ratio': 0.5,
+    'Tags': ['a', 'b'],
+    'Nested': {'key': 'value'},
+}
+
+
+@pytest.mark.parametrize('leaf', [
+    '{Name}',
+    'prefix-{Id}-{Name}-suffix',
+    'no fields',
+    'escaped {{braces}} {Name}',
+    '{Count:05d}',
+    '{Ratio:.2f}',
+    '{Name!r}',
+    '{Name!a}',
+    '{Name!s:>12}',
+    '{Count:d}{Count}',
+    '{Missing}',
+    '{Name}{Missing}',
+    '{Name:d}',
+    '{Tags[0]}',
+    '{Nested[key]}',
+    '{Name.upper}',
+    '{Count:{Count}}',
+    '',
+])
+def test_render_matches_format(leaf):
+    spec = {'leaf': leaf}
+    transformer = plugin.Transformer(id='test-transformer', config=spec)
+
+    try:
+        expected = transformer.parse(spec, RECORD)
+    except ValueError:
+        with pytest.raises(ValueError):
+            template.Template(spec).render(RECORD)
+        return
+
+    assert template.Template(spec).render(RECORD) == expected
+
+
+@pytest.mark.parametrize('leaf', ['{', '{0}', '{}', '{Name!x}'])
+def test_render_invalid_matches_format(leaf):
+    with pytest.raises(Exception) as expected:
+        leaf.format(**RECORD)
+
+    with pytest.raises(type(expected.value)):
+        template.Template({'leaf': leaf}).render(RECORD)
+
+
+def test_compile_leaf():
+    assert template.compile_leaf(5) == (template.CONSTANT, 5)
+    assert template.compile_leaf('a {{b}}') == (template.CONSTANT, 'a {b}')
+    assert template.compile_leaf('{a[0]}') == (template.FORMAT, '{a[0]}')
+
+    kind, (fmt, getter, names) = template.compile_leaf('{Name}')
+    assert kind == template.FIELD
+    assert fmt is format
+    assert getter(RECORD) == 'Vapor IO'
+    assert names == ('Name',)
+
+    kind, (fmt, getter, names) = template.compile_leaf('x{{{Name!r:>12}-{Id}')
+    assert kind == template.FIELDS
+    assert fmt.__self__ == 'x{{{0!r:>12}-{1}'
+    assert fmt(*getter(RECORD)) == "x{  'Vapor IO'-a01"
+    assert names == ('Name', 'Id')
+
+
+def test_render_nested():
+    spec = {
+        'name': '{Name}',
+        'tenant': {
+            'slug': '{Id}',
+            'group': {},
+            'meta': {
+                'count': '{Count}',
+                'static': 'fixed',
+            },
+        },
+        'last': '{Missing}',
+    }
+    t = template.Template(spec)
+
+    assert t.render(RECORD) == {
+        'name': 'Vapor IO',
+        'tenant': {
+            'slug': 'a01',
+            'group': {},
+            'meta': {
+                'count': '42',
+                'static': 'fixed',
+            },
+        },
+        'last': None,
+    }
+    assert list(t.render(RECORD)) == ['name', 'tenant', 'last']
+    # every render produces fresh mappings
+    assert t.render(RECORD)['tenant']['group'] is not t.render(RECORD)['tenant']['group']
+
+
+def test_render_not_a_mapping():
+    t = template.Template({'name': '{Name}', 'static': 'fixed'})
+    assert t.render('not a record') == {'name': None, 'static': 'fixed'}
+
+
+def test_columns_to_rows():
+    assert template.columns_to_rows({'a': [1, 2], 'b': ['x', 'y']}) == [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'y'}]
+    assert template.columns_to_rows({}) == []
+
+
+def test_render_columns_matches_render():
+    spec = {
+        'name': '{Name}',
+        'slug': '{Id}-{Name!r}',
+        'count': '{Count:03d}',
+        'tenant': {
+            'group': {},
+            'meta': {
+                'tag': '{Tags[0]}',
+                'missing': '{Missing}',
+                'static': 'fixed',
+                'number': 5,
+            },
+        },
+    }
+    rows = [
+        {'Id': 'a01', 'Name': 'Vapor IO', 'Count': 1, 'Tags': ['a']},
+        {'Id': 'a02', 'Name': 'Netbox', 'Count': 2, 'Tags': ['b']},
+        {'Id': 'a03', 'Name': None, 'Count': 3, 'Tags': ['c']},
+    ]
+    columns = {key: [row[key] for row in rows] for key in rows[0]}
+    t = template.Template(spec)
+
+    rendered = t.render_columns(columns)
+    assert rendered == [t.render(row) for row in rows]
+    assert rendered[0]['tenant']['group'] is not rendered[1]['tenant']['group']
+
+
+def test_render_columns_type_error():
+    t = template.Template({'count': '{Count:d}'})
+    assert t.render_columns({'Count': [1, None, 3]}) == [{'count': '1'}, {'count': None}, {'count': '3'}]
+
+
+def test_render_columns_empty():
+    t = template.Template({'name': '{Name}'})
+    assert t.render_columns({}) == []
+    assert t.render_columns({'Name': []}) == []
@@ -0,0 +1,162 @@
+"""Unit tests for the prophetess.web package."""
+
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+import asynctest
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from prophetess import cache, exceptions, metrics, pipeline, plugin
+from prophetess import web as views
+
+
+async def client(pipelines: pipeline.Pipelines = None) -> TestClient:
+    app = web.Application()
+    app['prophetess'] = SimpleNamespace(pipelines=pipeline.Pipelines() if pipelines is None else pipelines)
+    app.add_routes([
+        web.view('/metrics', views.MetricsView),
+        web.view('/cache', views.CacheView),
+        web.view('/cache/{extractor}', views.CacheView),
+        web.view('/reload', views.ReloadView),
+        web.view('/debug/profile', views.ProfileView),
+        web.view('/debug/tasks', views.TasksView),
+    ])
+    c = TestClient(TestServer(app))
+    await c.start_server()
+    return c
+
+
+def observations(histogram):
+    return sum(bucket.get() for bucket in histogram._buckets)
+
+
+@pytest.mark.asyncio
+class TestViews:
+
+    async def test_metrics(self):
+        c = await client()
+        resp = await c.get('/metrics')
+
+        assert resp.status == 200
+        assert 'prophetess_plugin_exec_time' in await resp.text()
+        await c.close()
+
+    async def test_cache(self):
+        pipelines = pipeline.Pipelines()
+        for name in ('sites', 'device-types'):
+            c = pipelines.caches[name] = cache.CachedExtractor(plugin.Extractor(id=name, config={}), ttl=60)
+            c.store([{'id': 1}])
+        c = await client(pipelines)
+
+        resp = await c.get('/cache')
+        assert resp.status == 200
+        assert (await resp.json())['sites']['records'] == 1
+
+        resp = await c.delete('/cache/sites')
+        assert resp.status == 200
+        assert pipelines.caches['sites'].records is None
+        assert pipelines.caches['device-types'].records == [{'id': 1}]
+
+        resp = await c.delete('/cache')
+        assert resp.status == 200
+        assert await resp.text() == 'Invalidated sites, device-types\n'
+        assert pipelines.caches['device-types'].records is None
+
+        resp = await c.delete('/cache/nope')
+        assert resp.status == 404
+        await c.close()
+
+    async def test_cache_partitions(self):
+        pipelines = pipeline.Pipelines()
+        for name in ('sites', 'sites.partition-0-of-2'):
+            c = pipelines.caches[name] = cache.CachedExtractor(plugin.Extractor(id='sites', config={}), ttl=60)
+            c.store([{'id': 1}])
+        c = await client(pipelines)
+
+        resp = await c.delete('/cache/sites')
+        assert resp.status == 200
+        assert await resp.text() == 'Invalidated sites, sites.partition-0-of-2\n'
+        assert pipelines.caches['sites.partition-0-of-2'].records is None
+        await c.close()
+
+    async def test_reload(self):
+        c = await client()
+        c.server.app['reload'] = asynctest.CoroutineMock(return_value={'added': ['site-sync']})
+
+        resp = await c.post('/reload')
+        assert resp.status == 200
+        assert await resp.json() == {'added': ['site-sync']}
+
+        c.server.app['reload'].side_effect = exceptions.ProphetessException('Unknown pipelines: nope')
+        resp = await c.post('/reload')
+        assert resp.status == 400
+        assert await resp.text() == 'ProphetessException: Unknown pipelines: nope\n'
+        await c.close()
+
+    async def test_profile(self):
+        async def busy():
+            while True:
+                sum(range(1000))
+                await asyncio.sleep(0)
+
+        task = asyncio.ensure_future(busy())
+        c = await client()
+        resp = await c.get('/debug/profile', params={'seconds': '0.05', 'limit': '10'})
+
+        assert resp.status == 200
+        assert 'busy' in await resp.text()
+        task.cancel()
+        await c.close()
+
+    async def test_profile_conflict(self):
+        c = await client()
+        first = asyncio.ensure_future(c.get('/debug/profile', params={'seconds': '0.1'}))
+        await asyncio.sleep(0.05)
+
+        resp = await c.get('/debug/profile', params={'seconds': '0.1'})
+        assert resp.status == 409
+        assert (await first).status == 200
+        await c.close()
+
+    @pytest.mark.parametrize('params', [{'seconds': 'ten'}, {'seconds': '0', 'sort': 'nope'}])
+    async def test_profile_bad_request(self, params):
+        c = await client()
+        resp = await c.get('/debug/profile', params=params)
+
+        assert resp.status == 400
+        await c.close()
+
+    async def test_tasks(self):
+        async def waiting_for_netbox():
+            await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(waiting_for_netbox())
+        c = await client()
+        resp = await c.get('/debug/tasks')
+
+        assert resp.status == 200
+        assert 'waiting_for_netbox' in await resp.text()
+        task.cancel()
+        await c.close()
+
+
+def test_watch_slow_callbacks():
+    loop = asyncio.new_event_loop()
+    before = observations(metrics.slow_callbacks)
+    handlers = list(logging.getLogger('asyncio').handlers)
+
+    try:
+        views.watch_slow_callbacks(loop, 0.01)
+        assert loop.get_debug()
+
+        loop.call_soon(time.sleep, 0.02)
+        loop.run_until_complete(asyncio.sleep(0.01))
+    finally:
+        loop.close()
+        logging.getLogger('asyncio').handlers = handlers
+
+    assert observations(metrics.slow_callbacks) == before + 1